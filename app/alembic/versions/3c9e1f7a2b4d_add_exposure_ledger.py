@@ -0,0 +1,48 @@
+"""add exposure ledger
+
+Revision ID: 3c9e1f7a2b4d
+Revises: d5f2dba9e57c
+Create Date: 2026-10-18 10:12:31.204113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9e1f7a2b4d'
+down_revision = 'd5f2dba9e57c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('exposure',
+    sa.Column('supplier_id', sa.String(length=50), nullable=False),
+    sa.Column('purchaser_id', sa.String(length=50), nullable=False),
+    sa.Column('used', sa.Float(), nullable=False),
+    sa.Column('requested', sa.Float(), nullable=False),
+    sa.Column('invoices', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('supplier_id', 'purchaser_id')
+    )
+    # backfill relationship-, supplier- ('*' as purchaser) and purchaser-totals ('*' as supplier)
+    # (same numbers as `python -m database.rebuild_exposure`)
+    op.execute("""
+        INSERT INTO exposure (supplier_id, purchaser_id, used, requested, invoices)
+        SELECT
+            COALESCE(supplier_id, '*'),
+            COALESCE(purchaser_id, '*'),
+            SUM(CASE WHEN finance_status = 'FINANCED' THEN principal ELSE 0 END),
+            SUM(CASE WHEN finance_status IN ('INITIAL', 'DISBURSAL_REQUESTED') THEN principal ELSE 0 END),
+            COUNT(*)
+        FROM (
+            SELECT supplier_id, purchaser_id, finance_status,
+                COALESCE((NULLIF(payment_details, '')::json->>'principal')::float, 0) AS principal
+            FROM invoice
+        ) AS i
+        GROUP BY GROUPING SETS ((supplier_id, purchaser_id), (supplier_id), (purchaser_id))
+    """)
+
+
+def downgrade():
+    op.drop_table('exposure')
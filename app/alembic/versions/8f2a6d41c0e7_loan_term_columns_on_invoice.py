@@ -0,0 +1,50 @@
+"""loan term columns on invoice
+
+Revision ID: 8f2a6d41c0e7
+Revises: 3c9e1f7a2b4d
+Create Date: 2026-10-18 11:02:47.581930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f2a6d41c0e7'
+down_revision = '3c9e1f7a2b4d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('invoice', sa.Column('principal', sa.Float(), nullable=True))
+    op.add_column('invoice', sa.Column('interest', sa.Float(), nullable=True))
+    op.add_column('invoice', sa.Column('loan_id', sa.String(length=50), nullable=True))
+    op.add_column('invoice', sa.Column('disbursal_transaction_id', sa.String(length=50), nullable=True))
+    op.add_column('invoice', sa.Column('collection_date', sa.Date(), nullable=True))
+    op.add_column('invoice', sa.Column('asset_id', sa.BigInteger(), nullable=True))
+    op.create_index(op.f('ix_invoice_loan_id'), 'invoice', ['loan_id'], unique=False)
+    op.create_index(op.f('ix_invoice_asset_id'), 'invoice', ['asset_id'], unique=False)
+    # backfill from the payment_details (same mapping as invoice.utils.payment_details_to_columns)
+    op.execute("""
+        UPDATE invoice SET
+            principal = COALESCE((pd->>'principal')::float, 0),
+            interest = COALESCE((pd->>'interest')::float, 0),
+            loan_id = NULLIF(pd->>'loan_id', ''),
+            disbursal_transaction_id = NULLIF(pd->>'disbursal_transaction_id', ''),
+            collection_date = NULLIF(pd->>'collection_date', '')::date,
+            asset_id = (pd->'tokenization'->>'asset_id')::bigint
+        FROM (SELECT id AS invoice_id, NULLIF(payment_details, '')::json AS pd FROM invoice) AS details
+        WHERE invoice.id = details.invoice_id
+    """)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_invoice_asset_id'), table_name='invoice')
+    op.drop_index(op.f('ix_invoice_loan_id'), table_name='invoice')
+    op.drop_column('invoice', 'asset_id')
+    op.drop_column('invoice', 'collection_date')
+    op.drop_column('invoice', 'disbursal_transaction_id')
+    op.drop_column('invoice', 'loan_id')
+    op.drop_column('invoice', 'interest')
+    op.drop_column('invoice', 'principal')
@@ -0,0 +1,26 @@
+"""repayment log batch key
+
+Revision ID: a6e04b9d2c18
+Revises: f3c27d8e4a61
+Create Date: 2026-10-18 21:12:05.417391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6e04b9d2c18'
+down_revision = 'f3c27d8e4a61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('repayment_log', sa.Column('batch_key', sa.String(length=50), nullable=True))
+    op.create_index(op.f('ix_repayment_log_batch_key'), 'repayment_log', ['batch_key'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_repayment_log_batch_key'), table_name='repayment_log')
+    op.drop_column('repayment_log', 'batch_key')
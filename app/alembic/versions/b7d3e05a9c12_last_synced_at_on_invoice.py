@@ -0,0 +1,26 @@
+"""last synced at on invoice
+
+Revision ID: b7d3e05a9c12
+Revises: 8f2a6d41c0e7
+Create Date: 2026-10-18 14:21:09.734415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e05a9c12'
+down_revision = '8f2a6d41c0e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('invoice', sa.Column('last_synced_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_invoice_last_synced_at'), 'invoice', ['last_synced_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_invoice_last_synced_at'), table_name='invoice')
+    op.drop_column('invoice', 'last_synced_at')
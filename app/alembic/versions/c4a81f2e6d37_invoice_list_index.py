@@ -0,0 +1,24 @@
+"""invoice list index
+
+Revision ID: c4a81f2e6d37
+Revises: b7d3e05a9c12
+Create Date: 2026-10-18 16:48:52.103586
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a81f2e6d37'
+down_revision = 'b7d3e05a9c12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_invoice_created_on_id', 'invoice', ['created_on', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_invoice_created_on_id', table_name='invoice')
@@ -0,0 +1,45 @@
+"""repayment log outbox
+
+Revision ID: e91b5c3d7f20
+Revises: c4a81f2e6d37
+Create Date: 2026-10-18 18:21:09.417352
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e91b5c3d7f20'
+down_revision = 'c4a81f2e6d37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('repayment_log',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('idempotency_key', sa.String(length=50), nullable=False),
+    sa.Column('invoice_id', sa.String(length=50), nullable=False),
+    sa.Column('asset_id', sa.BigInteger(), nullable=False),
+    sa.Column('log_data', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=50), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('tx_id', sa.String(length=100), nullable=True),
+    sa.Column('created_on', sa.DateTime(), nullable=True),
+    sa.Column('sent_on', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('idempotency_key')
+    )
+    op.create_index(op.f('ix_repayment_log_invoice_id'), 'repayment_log', ['invoice_id'], unique=False)
+    op.create_index(
+        'ix_repayment_log_status_next_attempt_at', 'repayment_log', ['status', 'next_attempt_at'], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index('ix_repayment_log_status_next_attempt_at', table_name='repayment_log')
+    op.drop_index(op.f('ix_repayment_log_invoice_id'), table_name='repayment_log')
+    op.drop_table('repayment_log')
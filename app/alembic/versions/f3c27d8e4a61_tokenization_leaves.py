@@ -0,0 +1,32 @@
+"""tokenization leaves
+
+Revision ID: f3c27d8e4a61
+Revises: e91b5c3d7f20
+Create Date: 2026-10-18 20:03:44.862015
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c27d8e4a61'
+down_revision = 'e91b5c3d7f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('tokenization_leaf',
+    sa.Column('asset_id', sa.BigInteger(), nullable=False),
+    sa.Column('leaf_index', sa.Integer(), nullable=False),
+    sa.Column('invoice_id', sa.String(length=50), nullable=False),
+    sa.Column('leaf', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('asset_id', 'leaf_index')
+    )
+    op.create_index(op.f('ix_tokenization_leaf_invoice_id'), 'tokenization_leaf', ['invoice_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_tokenization_leaf_invoice_id'), table_name='tokenization_leaf')
+    op.drop_table('tokenization_leaf')
@@ -1,13 +1,16 @@
 import requests
 import os
 import json
-from typing import List
+from typing import Dict, List, Optional
 from sqlalchemy.orm import Session
 from database import crud
 from database.exceptions import (
-    AssetCreationException, AssetLogException, NoInvoicesToBeTokenized, InvoicesAlreadyTokenized, InvoicesNotFinancable, TokenizationException
+    AssetCreationException, AssetLogException, NoInvoicesToBeTokenized, InvoicesAlreadyTokenized, InvoicesNotFinancable, TokenizationException,
+    UnknownInvoiceException
 )
-from utils.common import AssetLogResponse, FinanceStatus, FundedInvoice, LogData, NewLoanParams, NewLogAssetInput, NewAssetResponse, NewLogEntryInput
+from utils.common import AssetLogResponse, FinanceStatus, FundedInvoice, InclusionProof, LogData, NewLoanParams, NewLogAssetInput, NewAssetResponse, NewLogEntryInput
+from utils.merkle import canonical_json, merkle_proof, merkle_root
+from algorand.utils import batch_repayment_log_data, repayment_log_data
 from database.models import Invoice
 
 from starlette.status import (HTTP_200_OK, HTTP_400_BAD_REQUEST)
@@ -19,12 +22,17 @@ load_dotenv()
 
 ALGO_LOG_BASE_URL = os.getenv("ALGO_LOG_BASE_URL")
 ALGO_LOG_API_SECRET= os.getenv("ALGO_LOG_API_SECRET")
+ALGO_LOG_CONNECT_TIMEOUT_IN_S = float(os.getenv("ALGO_LOG_CONNECT_TIMEOUT_IN_S", 3.05))
+ALGO_LOG_READ_TIMEOUT_IN_S = float(os.getenv("ALGO_LOG_READ_TIMEOUT_IN_S", 30))
+
 
 class AlgoService():
     def __init__(self, base_url: str, password: str):
         """ initialize client and get access token from RC-sandbox """
         self.base_url = base_url
         self.headers = {"Authorization": f"Bearer {password}"}
+        self.timeout = (ALGO_LOG_CONNECT_TIMEOUT_IN_S, ALGO_LOG_READ_TIMEOUT_IN_S)
+        self.session = requests.Session()
         # TODO add logging
         self._logger = get_logger(self.__class__.__name__)
 
@@ -38,52 +46,41 @@ class AlgoService():
         throws if there is an invoice that has no real world tx-ref"
         """
  
+        # validate the loan's invoices in the db before loading them
+        check = crud.invoice.check_loan_invoices(loan_id, db)
+
         # verify loan_id exists
-        all_invoices: List[Invoice] = crud.invoice.get_all_invoices(db)
-        invoices_from_loan = [i for i in all_invoices if json.loads(i.payment_details)['loan_id'] == loan_id]
-        if not invoices_from_loan:
+        if not check.invoices:
             raise NoInvoicesToBeTokenized()
-        
+
         # verify no invoice is already tokenized
-        def is_tokenized(i: Invoice):
-            details = json.loads(i.payment_details)
-            if 'tokenization' in details.keys() and details['tokenization'] != {}:
-                return True
-            return False
-
-        invoices_already_tokenized = [i.order_ref for i in invoices_from_loan if is_tokenized(i)]
-        # print('already', invoices_already_tokenized_details)
-        if invoices_already_tokenized:
+        if check.tokenized:
             raise InvoicesAlreadyTokenized(
-                msg=f"Invoices already tokenized with order ref: {str(invoices_already_tokenized)}"
+                msg=f"Invoices already tokenized with order ref: {str(check.tokenized)}"
             )
-        
+
         # verify all invoices in state FINANCED
-        invoices_not_in_state_financed = [
-            (i.order_ref, i.finance_status) for i in invoices_from_loan if i.finance_status != FinanceStatus.FINANCED
-        ]
-        if invoices_not_in_state_financed:
+        if check.not_financed:
             raise InvoicesNotFinancable(
-                msg=f"Invoices not in state to be tokenized: {str(invoices_not_in_state_financed)}"
+                msg=f"Invoices not in state to be tokenized: {str(check.not_financed)}"
             )
 
         # verify all invoices have a real-world tx-reference
-        invoices_without_tx_ref = [
-            i.order_ref for i in invoices_from_loan if not(bool(json.loads(i.payment_details).get('disbursal_transaction_id', 0)))
-        ]
-        if invoices_without_tx_ref:
+        if check.without_tx_ref:
             raise InvoicesNotFinancable(
-                msg=f"Invoices are missing tx-reference: {str(invoices_without_tx_ref)}"
+                msg=f"Invoices are missing tx-reference: {str(check.without_tx_ref)}"
             )
-        
+
+        invoices_from_loan: List[Invoice] = crud.invoice.get_invoices_from_loan(loan_id, db)
         return invoices_from_loan
 
     def tokenize_loan(self, loan_id: str, db: Session):
         """
         - gets all invoices related to a given loan_id, 
         - summarizes the essential data that should be put onto the metadata of the token
+          (the merkle root over the invoices, see get_inclusion_proof)
         - creates the asset
-        - writes the asset_id into the payment_details of each invoice
+        - writes the asset_id into the payment_details of all invoices (in one transaction)
         @returns success: the new asset_id of the created NFT
         throws if there is an issue with the invoices (see self.get_invoices_to_be_tokenized)
         """
@@ -96,9 +93,12 @@ class AlgoService():
                 invoice_id=i.id,
                 order_id=i.order_ref,
                 value=i.value,
-                transaction_ref=json.loads(i.payment_details).get("disbursal_transaction_id"),
+                transaction_ref=i.disbursal_transaction_id,
                 financed_on=str(i.financed_on),
-            ) for i in invoices_to_be_tokenized]
+            ) for i in sorted(invoices_to_be_tokenized, key=lambda i: i.id)]
+        # commit to the invoices with the root of a merkle tree over them, the leaves are stored in our db
+        leaves = [(i.invoice_id, canonical_json(i.dict())) for i in compact_invoice_info]
+        root = merkle_root([leaf for _, leaf in leaves])
         
         # TODO how to summarize the terms from multiple invoices into the terms of one loan?
         # - which start dates: for now: just choose one from one invoice
@@ -116,13 +116,15 @@ class AlgoService():
                 tenor_in_days=sample_invoice.tenor_in_days,
                 start_date=sample_invoice.financed_on.timestamp(),
                 compounding_frequency="daily",
-                data=str([i.dict() for i in compact_invoice_info])
+                data=json.dumps({"merkle_root": root, "invoices": len(leaves), "hash": "sha256"})
             )
         )
         self._logger.info(f"Summarized for asset metadata like this: {new_asset_input}")
 
         url = self.base_url + "/v1/log/new"
-        response = requests.request("POST", url, json=new_asset_input.to_camelized_dict(), headers=self.headers)
+        response = self.session.post(
+            url, json=new_asset_input.to_camelized_dict(), headers=self.headers, timeout=self.timeout
+        )
         print('resp', response)
         if response.status_code != HTTP_200_OK:
             err_msg = str(response.json())
@@ -136,11 +138,15 @@ class AlgoService():
             data = NewAssetResponse(**raw_response)
             new_asset_info = {
                 'asset_id': data.assetId,
+                'merkle_root': root,
                 'transactions': {data.txId: "creation"}
             }
-            for inv in invoices_to_be_tokenized:
-                crud.invoice.update_invoice_payment_details(
-                    invoice_id=inv.id, new_data={"tokenization": new_asset_info}, db=db
+            updated = crud.invoice.update_invoices_tokenization(
+                [inv.id for inv in invoices_to_be_tokenized], new_asset_info, db, leaves=leaves
+            )
+            if updated != len(invoices_to_be_tokenized):
+                self._logger.error(
+                    f"Stored asset {data.assetId} on {updated} of {len(invoices_to_be_tokenized)} invoices of loan {loan_id}"
                 )
             print('new asset data', new_asset_info)
             return data
@@ -155,9 +161,42 @@ class AlgoService():
         #     balances = response.json()["data"]
         #     return {inv: result_to_balance(val) for inv, val in balances.items()}
 
+    def get_inclusion_proof(self, invoice_id: str, db: Session) -> InclusionProof:
+        """
+        proof that an invoice is one of the invoices the metadata of its loan-asset commits to
+        (see utils.merkle for how to verify it, the root has to match the one in the asset's metadata)
+        throws UnknownInvoiceException if there is no such invoice
+        throws TokenizationException if the invoice is not tokenized (or was tokenized without merkle root)
+        or if the stored leaves do not add up to the merkle root it was tokenized with
+        """
+        invoice = crud.invoice.get(db, invoice_id)
+        if not invoice:
+            raise UnknownInvoiceException(f"Unknown invoice {invoice_id}")
+        if not invoice.asset_id:
+            raise TokenizationException(f"Invoice {invoice_id} is not tokenized")
+        # the root the asset was created with (the same as in its metadata)
+        stored_root = json.loads(invoice.payment_details or "{}").get("tokenization", {}).get("merkle_root")
+        leaves = crud.invoice.get_tokenization_leaves(invoice.asset_id, db)
+        index = next((l.leaf_index for l in leaves if l.invoice_id == invoice_id), None)
+        if index is None or not stored_root:
+            raise TokenizationException(f"Asset {invoice.asset_id} does not commit to its invoices with a merkle root")
+        leaf_data = [l.leaf for l in leaves]
+        if merkle_root(leaf_data) != stored_root:
+            raise TokenizationException(f"The stored leaves of asset {invoice.asset_id} do not match its merkle root")
+        return InclusionProof(
+            asset_id=invoice.asset_id,
+            merkle_root=stored_root,
+            invoice=FundedInvoice(**json.loads(leaf_data[index])),
+            leaf=leaf_data[index],
+            leaf_index=index,
+            leaves=len(leaf_data),
+            proof=merkle_proof(leaf_data, index),
+        )
+
     def log_invoice_repayment(self, invoice_id: str, tx_ref: str, db: Session):
         """
         Creates a log-tx for on the invoice's loan-asset assuming full repayment
+        NOTE: repayments are logged through the repayment log outbox (see crud.repayment_log), this sends right away
         """
         try:
             invoice = crud.invoice.get(db=db, id=invoice_id)
@@ -165,24 +204,10 @@ class AlgoService():
             asset_id = payment_details.get('tokenization', {}).get('asset_id', False)
             if not asset_id:
                 raise TokenizationException(f"Invoice not tokenized, no asset-id found.")
-            url = self.base_url + f"/v1/log/{asset_id}"
-            # log_data = NewLogEntryInput(
-            log_data=LogData(
-                data={
-                'type': 'repay',
-                'subtype': 'full',
-                'amount': invoice.value,
-                'tx_ref': tx_ref
-            }).dict()
-            # )
-            response = requests.request("POST", url, json=log_data, headers=self.headers)
-            raw_response = response.json()
-            self._logger.info(f"Result:{raw_response}")
-            if response.status_code != HTTP_200_OK:
-                raise AssertionError(str(raw_response))
+            log_data = repayment_log_data(invoice, tx_ref)
+            log_response = self.send_log_entry(asset_id, log_data)
 
             # store reference to blockchain tx on invoice
-            log_response = AssetLogResponse(**raw_response)
             new_tx_entry = { log_response.txId: { 'log_data': log_data, 'tx_info': log_response.data } }
             return new_tx_entry
  
@@ -190,6 +215,40 @@ class AlgoService():
             # TODO more fine-grained handling here
             raise AssetLogException(str(e))
 
+    def log_asset_repayments(
+        self, asset_id: int, repayments: Dict[str, Dict], idempotency_key: Optional[str] = None
+    ) -> AssetLogResponse:
+        """
+        log the repayments of several invoices of one asset (their repayment_log_data by invoice id)
+        with one transaction, a single repayment is logged as is
+        """
+        if len(repayments) == 1:
+            log_data = next(iter(repayments.values()))
+        else:
+            log_data = batch_repayment_log_data(repayments)
+        return self.send_log_entry(asset_id, log_data, idempotency_key)
+
+    def send_log_entry(self, asset_id: int, log_data: Dict, idempotency_key: Optional[str] = None) -> AssetLogResponse:
+        """
+        append log_data to the log of an asset.
+        The idempotency_key is sent as Idempotency-Key header, so that the logger can recognize retried entries
+        throws AssetLogException if the logger can not be reached or rejects the entry
+        """
+        url = self.base_url + f"/v1/log/{asset_id}"
+        headers = {**self.headers, "Idempotency-Key": idempotency_key} if idempotency_key else self.headers
+        try:
+            response = self.session.post(url, json=log_data, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise AssetLogException(f"Algorand-logger not reachable: {str(e)}")
+        try:
+            raw_response = response.json()
+        except ValueError:
+            raw_response = response.text
+        self._logger.info(f"Result:{raw_response}")
+        if response.status_code != HTTP_200_OK:
+            raise AssetLogException(f"Algorand-logger responded with {response.status_code}: {str(raw_response)}")
+        return AssetLogResponse(**raw_response)
+
 
 algo_service = AlgoService(
     base_url=ALGO_LOG_BASE_URL,
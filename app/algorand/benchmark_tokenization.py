@@ -0,0 +1,138 @@
+import argparse
+import datetime as dt
+import json
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+from starlette.testclient import TestClient
+
+from algorand.algo_service import AlgoService
+from algorand.fake_logger import AssetLedger, FakeLoggerConfig, create_app
+from database import crud
+from database.db import SessionLocal, engine, env
+from database.models import Invoice, Supplier
+from database.utils import reset_db
+from utils.common import FinanceStatus
+from utils.merkle import verify_proof
+
+# seeds the (test-)db with financed loans and tokenizes them against the fake algorand-logger:
+# > python -m algorand.benchmark_tokenization --loans 50 --invoices-per-loan 20 --latency 0.2 --workers 4
+# (in-process by default, pass --url to use a running fake or logger instead)
+# NOTE: truncates the db first
+
+parser = argparse.ArgumentParser(description="benchmark the tokenization of loans")
+parser.add_argument("--loans", type=int, default=50)
+parser.add_argument("--invoices-per-loan", type=int, default=20)
+parser.add_argument("--workers", type=int, default=1, help="loans tokenized at the same time")
+parser.add_argument("--latency", type=float, default=0, help="seconds every request to the fake logger takes")
+parser.add_argument("--error-rate", type=float, default=0, help="share of requests to the fake logger failing")
+parser.add_argument("--url", default=None, help="base url of a running (fake) logger to use instead")
+parser.add_argument("--secret", default="secret")
+parser.add_argument("--seed", type=int, default=0)
+args = parser.parse_args()
+
+if env == "PRODUCTION":
+    raise NotImplementedError("refusing to truncate the production db")
+
+query_count = 0
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def count_queries(conn, cursor, statement, parameters, context, executemany):
+    global query_count
+    query_count += 1
+
+
+def seed(db):
+    rng = random.Random(args.seed)
+    reset_db(db)
+    supplier_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    db.bulk_insert_mappings(Supplier, [{
+        "supplier_id": supplier_id, "name": "benchmark supplier", "creditline_size": 10 ** 9, "default_apr": 0.15,
+        "default_tenor_in_days": 90, "data": ""
+    }])
+    financed_on = dt.datetime(2026, 1, 1)
+    invoices = []
+    for loan in range(args.loans):
+        loan_id = f"bench-loan-{loan}"
+        for i in range(args.invoices_per_loan):
+            value = round(rng.uniform(500, 50000), 2)
+            payment_details = {"loan_id": loan_id, "disbursal_transaction_id": f"tx-{loan}-{i}", "principal": value}
+            invoices.append({
+                "id": str(uuid.UUID(int=rng.getrandbits(128))), "order_ref": f"bench-{loan}-{i}",
+                "supplier_id": supplier_id, "purchaser_id": f"purchaser-{i % 10}",
+                "shipment_status": "DELIVERED", "finance_status": FinanceStatus.FINANCED,
+                "apr": 0.15, "tenor_in_days": 90, "value": value, "principal": value, "financed_on": financed_on,
+                "loan_id": loan_id, "disbursal_transaction_id": f"tx-{loan}-{i}",
+                "data": "{}", "payment_details": json.dumps(payment_details),
+            })
+    db.bulk_insert_mappings(Invoice, invoices)
+    db.commit()
+
+
+def new_algo_service(ledger: AssetLedger) -> AlgoService:
+    if args.url:
+        return AlgoService(base_url=args.url, password=args.secret)
+    service = AlgoService(base_url="http://testserver", password=args.secret)
+    service.session = TestClient(create_app(ledger.config, ledger))
+    return service
+
+
+def tokenize(loan_ids, ledger):
+    """ tokenize the given loans one after the other, returns the seconds each took (None if it failed) """
+    service = new_algo_service(ledger)
+    db = SessionLocal()
+    timings = []
+    try:
+        for loan_id in loan_ids:
+            start = time.perf_counter()
+            try:
+                service.tokenize_loan(loan_id, db)
+                timings.append(time.perf_counter() - start)
+            except Exception as e:
+                db.rollback()
+                print(f"{loan_id} failed: {str(e)[:100]}")
+                timings.append(None)
+    finally:
+        db.close()
+    return timings
+
+
+db_session = SessionLocal()
+try:
+    print(f"seeding {args.loans} loans x {args.invoices_per_loan} invoices...")
+    seed(db_session)
+    ledger = AssetLedger(FakeLoggerConfig(latency_in_s=args.latency, error_rate=args.error_rate, secret=args.secret))
+    loan_ids = [f"bench-loan-{loan}" for loan in range(args.loans)]
+
+    query_count = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        parts = list(executor.map(lambda w: tokenize(loan_ids[w::args.workers], ledger), range(args.workers)))
+    duration = time.perf_counter() - start
+
+    timings = sorted(t for part in parts for t in part if t is not None)
+    tokenized = len(timings)
+    print(f"tokenized {tokenized} of {args.loans} loans in {duration:.2f}s with {args.workers} worker(s)")
+    print(f"{tokenized / duration:8.2f} loans/s, {tokenized * args.invoices_per_loan / duration:8.1f} invoices/s")
+    if timings:
+        print(f"per loan: median {timings[len(timings) // 2] * 1000:.1f}ms, max {timings[-1] * 1000:.1f}ms, "
+              f"{query_count / args.loans:.1f} queries")
+
+    # every invoice of a tokenized loan has to be provable against its asset
+    db_session.expire_all()
+    service = new_algo_service(ledger)
+    for invoice in db_session.query(Invoice).filter(Invoice.asset_id.isnot(None)).limit(100):
+        proof = service.get_inclusion_proof(invoice.id, db_session)
+        assert verify_proof(proof.leaf, proof.proof, proof.merkle_root), f"invalid proof for {invoice.id}"
+        if not args.url:
+            metadata = json.loads(ledger.get_asset(invoice.asset_id)["params"]["loanParams"]["data"])
+            assert metadata["merkle_root"] == proof.merkle_root, f"root of {invoice.id} differs from the asset's"
+        assert crud.invoice.check_loan_invoices(invoice.loan_id, db_session).tokenized
+finally:
+    reset_db(db_session)
+    db_session.commit()
+    db_session.close()
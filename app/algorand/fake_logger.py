@@ -0,0 +1,181 @@
+"""
+in-memory stand-in for the algorand-logger api we use (asset creation and log entries), for offline development,
+tests and throughput benchmarks. Asset ids and tx ids are assigned deterministically, requests can be slowed down
+and made to fail randomly. Requests with an Idempotency-Key header that was seen before get the same response again.
+
+run it with e.g.
+> cd app
+> python -m algorand.fake_logger --latency 0.2 --error-rate 0.01 --port 8002
+and point the backend at it with ALGO_LOG_BASE_URL=http://localhost:8002
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import random
+import threading
+from typing import Dict, List, Optional
+
+from fastapi import Body, FastAPI, Header, HTTPException
+from pydantic import BaseModel
+from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_404_NOT_FOUND, HTTP_503_SERVICE_UNAVAILABLE
+
+AUTHORIZATION_HEADER = Header(None, alias="Authorization")
+IDEMPOTENCY_KEY_HEADER = Header(None, alias="Idempotency-Key")
+
+
+class FakeLoggerConfig(BaseModel):
+    # every request waits latency_in_s + up to latency_jitter_in_s
+    latency_in_s: float = 0
+    latency_jitter_in_s: float = 0
+    # share of requests that fail with a 503 before anything is logged
+    error_rate: float = 0
+    # share of requests that are logged but still answered with a 503 (e.g. a timeout on the way back)
+    lost_response_rate: float = 0
+    # if set, requests without "Bearer <secret>" are rejected
+    secret: Optional[str] = None
+    first_asset_id: int = 1000
+    # tx ids are derived from the seed and a running number
+    seed: int = 0
+
+
+def to_tx_id(seed: int, number: int) -> str:
+    """ a 52 character base32 id, like algorand's tx ids """
+    return base64.b32encode(hashlib.sha256(f"{seed}/{number}".encode()).digest()).decode()[:52]
+
+
+class AssetLedger:
+    """ the assets and their log entries known to the fake """
+
+    def __init__(self, config: FakeLoggerConfig):
+        self.config = config
+        self._assets: Dict[int, Dict] = {}
+        self._responses: Dict[str, Dict] = {}
+        self._txs = 0
+        self._lock = threading.Lock()
+
+    def _next_tx_id(self) -> str:
+        self._txs += 1
+        return to_tx_id(self.config.seed, self._txs)
+
+    def create_asset(self, payload: Dict, idempotency_key: Optional[str] = None) -> Dict:
+        with self._lock:
+            if idempotency_key in self._responses:
+                return self._responses[idempotency_key]
+            asset_id = self.config.first_asset_id + len(self._assets)
+            tx_id = self._next_tx_id()
+            self._assets[asset_id] = {"params": payload, "logs": [], "tx_id": tx_id}
+            response = {"assetId": asset_id, "txId": tx_id}
+            if idempotency_key:
+                self._responses[idempotency_key] = response
+            return response
+
+    def log(self, asset_id: int, payload: Dict, idempotency_key: Optional[str] = None) -> Dict:
+        """ raises KeyError for unknown assets """
+        with self._lock:
+            if idempotency_key in self._responses:
+                return self._responses[idempotency_key]
+            logs = self._assets[asset_id]["logs"]
+            tx_id = self._next_tx_id()
+            logs.append({"tx_id": tx_id, "data": payload.get("data", {})})
+            response = {"txId": tx_id, "data": {"assetId": asset_id, "logIndex": len(logs) - 1, "round": self._txs}}
+            if idempotency_key:
+                self._responses[idempotency_key] = response
+            return response
+
+    def get_asset(self, asset_id: int) -> Dict:
+        with self._lock:
+            return self._assets[asset_id]
+
+    def get_logs(self, asset_id: int) -> List[Dict]:
+        with self._lock:
+            return list(self._assets[asset_id]["logs"])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"assets": len(self._assets), "transactions": self._txs}
+
+
+def create_app(config: FakeLoggerConfig, ledger: Optional[AssetLedger] = None) -> FastAPI:
+    ledger = ledger if ledger is not None else AssetLedger(config)
+    fake = FastAPI(title="fake algorand-logger")
+    fake.state.ledger = ledger
+
+    async def simulate(authorization: Optional[str]):
+        if config.latency_in_s or config.latency_jitter_in_s:
+            await asyncio.sleep(config.latency_in_s + random.uniform(0, config.latency_jitter_in_s))
+        if config.secret and authorization != f"Bearer {config.secret}":
+            raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail="invalid secret")
+        if random.random() < config.error_rate:
+            raise HTTPException(status_code=HTTP_503_SERVICE_UNAVAILABLE, detail="simulated failure")
+
+    def lose_response():
+        if random.random() < config.lost_response_rate:
+            raise HTTPException(status_code=HTTP_503_SERVICE_UNAVAILABLE, detail="simulated lost response")
+
+    @fake.post("/v1/log/new")
+    async def _create_asset(
+        payload: Dict = Body(...),
+        authorization: Optional[str] = AUTHORIZATION_HEADER,
+        idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER,
+    ):
+        await simulate(authorization)
+        response = ledger.create_asset(payload, idempotency_key)
+        lose_response()
+        return response
+
+    @fake.post("/v1/log/{asset_id}")
+    async def _log(
+        asset_id: int,
+        payload: Dict = Body(...),
+        authorization: Optional[str] = AUTHORIZATION_HEADER,
+        idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER,
+    ):
+        await simulate(authorization)
+        try:
+            response = ledger.log(asset_id, payload, idempotency_key)
+        except KeyError:
+            raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="unknown asset")
+        lose_response()
+        return response
+
+    @fake.get("/v1/log/{asset_id}")
+    def _get_logs(asset_id: int):
+        try:
+            return ledger.get_logs(asset_id)
+        except KeyError:
+            raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="unknown asset")
+
+    @fake.get("/")
+    def _health():
+        return ledger.stats()
+
+    return fake
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="run a fake algorand-logger api on an in-memory ledger")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--latency", type=float, default=0, help="seconds every request takes at least")
+    parser.add_argument("--jitter", type=float, default=0, help="up to how many seconds are added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of requests failing with 503")
+    parser.add_argument(
+        "--lost-response-rate", type=float, default=0, help="share of requests logged but answered with 503"
+    )
+    parser.add_argument("--secret", default=None, help="only accept requests with this bearer token")
+    parser.add_argument("--first-asset-id", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = FakeLoggerConfig(
+        latency_in_s=args.latency,
+        latency_jitter_in_s=args.jitter,
+        error_rate=args.error_rate,
+        lost_response_rate=args.lost_response_rate,
+        secret=args.secret,
+        first_asset_id=args.first_asset_id,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host="0.0.0.0", port=args.port)
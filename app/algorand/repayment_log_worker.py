@@ -0,0 +1,116 @@
+import datetime as dt
+import json
+import threading
+import time
+from typing import Optional
+
+from algorand.algo_service import algo_service
+from database import crud
+from database.db import SessionLocal
+from utils.common import RepaymentLogStats
+from utils.constant import REPAYMENT_LOG_BATCH_SIZE, REPAYMENT_LOG_INTERVAL_IN_S
+from utils.logger import get_logger
+
+
+class RepaymentLogWorker:
+    """
+    drains the repayment log outbox (crud.repayment_log) to the algorand logger in a background thread every
+    interval seconds. The due entries of an asset are logged together with one transaction.
+    Each worker process has its own worker, entries are claimed with SKIP LOCKED so that every
+    entry is sent by one of them at a time.
+    Failed entries are retried with backoff (see RepaymentLogService.mark_failed)
+    """
+
+    def __init__(self, interval_in_s: int = REPAYMENT_LOG_INTERVAL_IN_S, batch_size: int = REPAYMENT_LOG_BATCH_SIZE):
+        self.interval_in_s = interval_in_s
+        self.batch_size = batch_size
+        self.last_run = RepaymentLogStats()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._running = threading.Lock()
+        self._thread = None
+        self._logger = get_logger(self.__class__.__name__)
+
+    def start(self):
+        if self._thread or not self.interval_in_s:
+            return
+        self._logger.info(f"Sending repayment logs every {self.interval_in_s}s")
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._loop, name="repayment-log", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def trigger(self):
+        """ send the due entries as soon as possible """
+        if not self._thread:
+            threading.Thread(target=self.run_once, name="repayment-log-once", daemon=True).start()
+        else:
+            self._wakeup.set()
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval_in_s)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            # keep going while there are due entries left
+            while not self._stopped.is_set():
+                stats = self.run_once()
+                # (a run in another thread sends them)
+                if stats is None or stats.sent + stats.errored < self.batch_size:
+                    break
+
+    def run_once(self) -> Optional[RepaymentLogStats]:
+        """
+        send up to batch_size due entries, one db transaction (and one algorand transaction) per asset.
+        Returns None if another thread is already sending
+        """
+        if not self._running.acquire(blocking=False):
+            return None
+
+        stats = RepaymentLogStats(started_at=dt.datetime.utcnow())
+        start = time.monotonic()
+        db = SessionLocal()
+        try:
+            while stats.sent + stats.errored < self.batch_size:
+                # all due entries of an asset are logged with one transaction
+                entries = crud.repayment_log.claim_next_batch(db, self.batch_size - stats.sent - stats.errored)
+                if not entries:
+                    break
+                key = entries[0].batch_key
+                try:
+                    response = algo_service.log_asset_repayments(
+                        entries[0].asset_id, {e.invoice_id: json.loads(e.log_data) for e in entries},
+                        idempotency_key=key
+                    )
+                except Exception as e:
+                    self._logger.warning(f"Sending repayment log {key} ({len(entries)} entries) failed: {str(e)}")
+                    crud.repayment_log.mark_failed(db, entries, str(e))
+                    stats.errored += len(entries)
+                    continue
+                # if storing the tx fails, the entries stay pending and are resent with the same idempotency key
+                crud.repayment_log.mark_sent(db, entries, response.txId, response.data)
+                stats.sent += len(entries)
+                stats.transactions += 1
+        except Exception as e:
+            db.rollback()
+            self._logger.exception(f"Repayment log worker failed: {str(e)}")
+            stats.error = str(e)
+        finally:
+            db.close()
+            stats.duration_in_s = time.monotonic() - start
+            self.last_run = stats
+            self._running.release()
+
+        if stats.sent or stats.errored or stats.error:
+            self._logger.info(f"Repayment logs done: {stats.dict()}")
+        return stats
+
+
+repayment_log_worker = RepaymentLogWorker()
@@ -0,0 +1,84 @@
+import pytest
+from algorand.algo_service import AlgoService
+from algorand.utils import repayment_log_data
+from algorand.fake_logger import AssetLedger, FakeLoggerConfig, create_app
+from database.exceptions import AssetLogException
+from database.models import Invoice
+from starlette.testclient import TestClient
+
+
+def fake_algo_service(config: FakeLoggerConfig, password: str = "secret"):
+    ledger = AssetLedger(config)
+    service = AlgoService(base_url="http://testserver", password=password)
+    # route the service's requests into the fake app
+    service.session = TestClient(create_app(config, ledger))
+    return service, ledger
+
+
+def create_asset(service: AlgoService) -> int:
+    response = service.session.post(service.base_url + "/v1/log/new", json={"assetName": "test"}, headers=service.headers)
+    return response.json()["assetId"]
+
+
+def test_ids_are_deterministic():
+    first, _ = fake_algo_service(FakeLoggerConfig(seed=1))
+    second, _ = fake_algo_service(FakeLoggerConfig(seed=1))
+    asset_id = create_asset(first)
+    assert asset_id == create_asset(second) == 1000
+
+    log_data = {"data": {"type": "repay"}}
+    assert first.send_log_entry(asset_id, log_data).txId == second.send_log_entry(asset_id, log_data).txId
+
+
+def test_idempotent_log_entries():
+    service, ledger = fake_algo_service(FakeLoggerConfig())
+    asset_id = create_asset(service)
+    log_data = {"data": {"type": "repay"}}
+
+    tx_id = service.send_log_entry(asset_id, log_data, idempotency_key="k1").txId
+    assert service.send_log_entry(asset_id, log_data, idempotency_key="k1").txId == tx_id
+    assert service.send_log_entry(asset_id, log_data, idempotency_key="k2").txId != tx_id
+
+    assert len(ledger.get_logs(asset_id)) == 2
+
+
+def test_batched_repayments():
+    service, ledger = fake_algo_service(FakeLoggerConfig())
+    asset_id = create_asset(service)
+    repayments = {
+        f"in{i}": repayment_log_data(Invoice(id=f"in{i}", value=100), f"tx{i}") for i in range(3)
+    }
+
+    service.log_asset_repayments(asset_id, repayments)
+
+    logs = ledger.get_logs(asset_id)
+    assert len(logs) == 1
+    assert logs[0]["data"]["amount"] == 300
+    assert [r["invoice_id"] for r in logs[0]["data"]["repayments"]] == list(repayments.keys())
+
+
+def test_failures():
+    service, _ = fake_algo_service(FakeLoggerConfig(error_rate=1))
+    with pytest.raises(AssetLogException):
+        service.send_log_entry(1000, {"data": {}})
+
+    service, _ = fake_algo_service(FakeLoggerConfig(secret="secret"), password="invalid")
+    with pytest.raises(AssetLogException):
+        service.send_log_entry(1000, {"data": {}})
+
+    service, _ = fake_algo_service(FakeLoggerConfig())
+    with pytest.raises(AssetLogException):
+        service.send_log_entry(1000, {"data": {}})
+
+
+def test_lost_responses_are_logged():
+    service, ledger = fake_algo_service(FakeLoggerConfig())
+    asset_id = create_asset(service)
+    ledger.config.lost_response_rate = 1
+    with pytest.raises(AssetLogException):
+        service.send_log_entry(asset_id, {"data": {}}, idempotency_key="k1")
+
+    # the retry gets the response of the entry that was logged
+    ledger.config.lost_response_rate = 0
+    tx_id = service.send_log_entry(asset_id, {"data": {}}, idempotency_key="k1").txId
+    assert [log["tx_id"] for log in ledger.get_logs(asset_id)] == [tx_id]
@@ -0,0 +1,27 @@
+import time
+
+from algorand.repayment_log_worker import RepaymentLogWorker
+from utils.common import RepaymentLogStats
+
+
+def test_run_once_is_skipped_while_another_run_sends():
+    worker = RepaymentLogWorker(interval_in_s=0)
+    with worker._running:
+        assert worker.run_once() is None
+
+
+def test_loop_waits_while_another_run_sends():
+    worker = RepaymentLogWorker(interval_in_s=0.05, batch_size=2)
+    # the last run sent a full batch, so the loop would go on right away
+    worker.last_run = RepaymentLogStats(sent=2)
+    runs = []
+    run_once = worker.run_once
+    worker.run_once = lambda: runs.append(1) or run_once()
+
+    with worker._running:
+        worker.start()
+        time.sleep(0.3)
+        worker.stop()
+
+    # one attempt per interval instead of spinning until the other run finishes
+    assert 0 < len(runs) <= 7
@@ -0,0 +1,26 @@
+from typing import Dict
+
+from database.models import Invoice
+from utils.common import LogData
+
+
+def repayment_log_data(invoice: Invoice, tx_ref: str) -> Dict:
+    """ the log entry of the full repayment of an invoice """
+    return LogData(
+        data={
+        'type': 'repay',
+        'subtype': 'full',
+        'amount': invoice.value,
+        'tx_ref': tx_ref
+    }).dict()
+
+
+def batch_repayment_log_data(repayments: Dict[str, Dict]) -> Dict:
+    """ one log entry for the repayments of several invoices of the same asset, from their repayment_log_data by id """
+    return LogData(
+        data={
+        'type': 'repay',
+        'subtype': 'batch',
+        'amount': sum(r['data']['amount'] for r in repayments.values()),
+        'repayments': [{'invoice_id': invoice_id, **r['data']} for invoice_id, r in repayments.items()]
+    }).dict()
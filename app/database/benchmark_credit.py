@@ -0,0 +1,159 @@
+import argparse
+import json
+import math
+import random
+import time
+import uuid
+
+from sqlalchemy import event
+
+from database import crud
+from database.crud.whitelist_service import whitelist_entry_to_receiverInfo
+from database.db import SessionLocal, engine, env
+from database.models import Invoice, Supplier, Whitelist
+from database.utils import reset_db
+from invoice.utils import invoice_to_principal
+from utils.common import CreditLineInfo, FinanceStatus, PurchaserInfo
+
+# seeds the (test-)db with a synthetic book and compares the /credit dashboard with the original computation
+# (one invoice query per whitelisted purchaser, summed up in python):
+# > python -m database.benchmark_credit --suppliers 50 --purchasers 200 --invoices 50000
+# NOTE: truncates the db first
+
+parser = argparse.ArgumentParser(description="benchmark the /credit dashboard aggregation")
+parser.add_argument("--suppliers", type=int, default=50)
+parser.add_argument("--purchasers", type=int, default=200, help="whitelisted purchasers per supplier")
+parser.add_argument("--invoices", type=int, default=50000)
+parser.add_argument("--runs", type=int, default=5)
+parser.add_argument("--seed", type=int, default=0)
+args = parser.parse_args()
+
+if env == "PRODUCTION":
+    raise NotImplementedError("refusing to truncate the production db")
+
+query_count = 0
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def count_queries(conn, cursor, statement, parameters, context, executemany):
+    global query_count
+    query_count += 1
+
+
+def seed(db):
+    rng = random.Random(args.seed)
+    reset_db(db)
+    supplier_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(args.suppliers)]
+    purchaser_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(args.purchasers)]
+    db.bulk_insert_mappings(Supplier, [
+        {"supplier_id": s_id, "name": f"supplier {i}", "creditline_size": 10 ** 8, "default_apr": 0.15,
+         "default_tenor_in_days": 90, "data": ""}
+        for i, s_id in enumerate(supplier_ids)
+    ])
+    db.bulk_insert_mappings(Whitelist, [
+        {"supplier_id": s_id, "purchaser_id": p_id, "location_id": f"loc-{j}", "name": f"purchaser {j}",
+         "phone": "+91-0000000000", "city": "Hubballi", "creditline_size": 10 ** 6, "apr": 0.15, "tenor_in_days": 90}
+        for s_id in supplier_ids for j, p_id in enumerate(purchaser_ids)
+    ])
+    statuses = [FinanceStatus.INITIAL, FinanceStatus.FINANCED, FinanceStatus.REPAID, FinanceStatus.DISBURSAL_REQUESTED]
+    invoices = []
+    for i in range(args.invoices):
+        value = round(rng.uniform(500, 50000), 2)
+        invoices.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))), "order_ref": f"bench-{i}",
+            "supplier_id": rng.choice(supplier_ids), "purchaser_id": rng.choice(purchaser_ids),
+            "shipment_status": "DELIVERED", "finance_status": rng.choice(statuses),
+            "value": value, "principal": value * 0.9, "data": "{}",
+            "payment_details": json.dumps({"principal": value * 0.9}),
+        })
+        if len(invoices) == 10000:
+            db.bulk_insert_mappings(Invoice, invoices)
+            invoices = []
+    db.bulk_insert_mappings(Invoice, invoices)
+    db.commit()
+    crud.exposure.rebuild(db)
+
+
+def original_credit_line_info(supplier_id, db):
+    credit_line_breakdown = {}
+    for w_entry in crud.whitelist.get_whitelist(db, supplier_id):
+        credit_line_size = w_entry.creditline_size
+        # (the original filtered by the purchaser only, which counts the purchaser's invoices of other suppliers too)
+        invoices = db.query(Invoice).filter(
+            Invoice.supplier_id == supplier_id, Invoice.purchaser_id == w_entry.purchaser_id
+        ).all()
+        to_be_repaid = sum(invoice_to_principal(i) for i in invoices if i.finance_status == FinanceStatus.FINANCED)
+        requested = sum(
+            invoice_to_principal(i)
+            for i in invoices
+            if i.finance_status in [FinanceStatus.DISBURSAL_REQUESTED, FinanceStatus.INITIAL]
+        )
+        credit_line_breakdown[w_entry.purchaser_id] = CreditLineInfo(
+            supplier_id=supplier_id,
+            info=whitelist_entry_to_receiverInfo(w_entry),
+            total=credit_line_size,
+            available=credit_line_size - to_be_repaid - requested,
+            used=to_be_repaid,
+            requested=requested,
+            invoices=len(invoices),
+        )
+    return credit_line_breakdown
+
+
+def original_credit_line_summary(supplier_id, supplier_name, db):
+    summary = CreditLineInfo(info=PurchaserInfo(name=supplier_name), supplier_id="tusker")
+    for c in original_credit_line_info(supplier_id, db).values():
+        summary.total += c.total
+        summary.available += c.available
+        summary.used += c.used
+        summary.requested += c.requested
+        summary.invoices += c.invoices
+    return summary
+
+
+def per_supplier(db):
+    """ the /credit payload as assembled before the exposure ledger, with an invoice query per whitelist entry """
+    res = {"tusker": {}}
+    for s in crud.supplier.get_all_suppliers(db):
+        res["tusker"][s.name] = original_credit_line_summary(s.supplier_id, s.name, db)
+    for s in crud.supplier.get_all_suppliers(db):
+        res[s.supplier_id] = original_credit_line_info(s.supplier_id, db)
+    return res
+
+
+def same_credit_line(a, b):
+    """ sums in a different order, so compare them with some tolerance """
+    return a.total == b.total and a.invoices == b.invoices and all(
+        math.isclose(getattr(a, f), getattr(b, f), abs_tol=1e-6) for f in ["available", "used", "requested"]
+    )
+
+
+def measure(name, f, db):
+    global query_count
+    timings = []
+    for _ in range(args.runs):
+        db.expire_all()
+        query_count = 0
+        start = time.perf_counter()
+        result = f(db)
+        timings.append(time.perf_counter() - start)
+    print(f"{name:>14}: {query_count:5d} queries, best {min(timings) * 1000:8.1f}ms, "
+          f"mean {sum(timings) / len(timings) * 1000:8.1f}ms")
+    return result
+
+
+db_session = SessionLocal()
+try:
+    print(f"seeding {args.suppliers} suppliers x {args.purchasers} purchasers, {args.invoices} invoices...")
+    seed(db_session)
+    before = measure("per supplier", per_supplier, db_session)
+    after = measure("dashboard", crud.invoice.get_credit_dashboard, db_session)
+    assert before.keys() == after.keys(), "dashboard differs from the per-supplier payload"
+    assert all(
+        before[k].keys() == after[k].keys() and all(same_credit_line(before[k][p], after[k][p]) for p in before[k])
+        for k in before
+    ), "dashboard differs from the per-supplier payload"
+finally:
+    reset_db(db_session)
+    db_session.commit()
+    db_session.close()
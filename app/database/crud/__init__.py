@@ -2,4 +2,6 @@ from .invoice_service import invoice
 from .whitelist_service import whitelist
 from .supplier_service import supplier
 from .purchaser_service import purchaser
-from .kycuser_service import kyc_user
\ No newline at end of file
+from .kycuser_service import kyc_user
+from .exposure_service import exposure
+from .repayment_log_service import repayment_log
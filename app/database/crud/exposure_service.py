@@ -0,0 +1,136 @@
+from typing import Dict, List, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from database.crud.base import CRUDBase
+from database.models import CreditExposure, Invoice
+from database.schemas import ExposureCreate, ExposureUpdate
+from utils.common import FinanceStatus
+
+# used in place of a supplier_id / purchaser_id for the rows that aggregate over all relationships
+EXPOSURE_TOTAL = "*"
+
+REQUESTED_STATUS = [FinanceStatus.DISBURSAL_REQUESTED, FinanceStatus.INITIAL]
+
+
+def to_exposure(finance_status: str, principal: float) -> Tuple[float, float]:
+    """ how much an invoice contributes to the (used, requested) credit of its creditline """
+    if finance_status == FinanceStatus.FINANCED:
+        return principal, 0
+    if finance_status in REQUESTED_STATUS:
+        return 0, principal
+    return 0, 0
+
+
+class ExposureService(CRUDBase[CreditExposure, ExposureCreate, ExposureUpdate]):
+    def get(self, db: Session, supplier_id: str, purchaser_id: str):
+        return db.query(CreditExposure).filter(
+            CreditExposure.supplier_id == supplier_id, CreditExposure.purchaser_id == purchaser_id
+        ).first()
+
+    def get_relationships(self, db: Session, supplier_id: str) -> Dict[str, CreditExposure]:
+        """ exposure of all relationships of a supplier, by purchaser_id """
+        rows = db.query(CreditExposure).filter(
+            CreditExposure.supplier_id == supplier_id, CreditExposure.purchaser_id != EXPOSURE_TOTAL
+        ).all()
+        return {r.purchaser_id: r for r in rows}
+
+    def get_supplier_total(self, db: Session, supplier_id: str):
+        return self.get(db, supplier_id, EXPOSURE_TOTAL)
+
+    def get_purchaser_total(self, db: Session, purchaser_id: str):
+        return self.get(db, EXPOSURE_TOTAL, purchaser_id)
+
+    def add(
+        self, db: Session, supplier_id: str, purchaser_id: str,
+        used: float = 0, requested: float = 0, invoices: int = 0
+    ):
+        """
+        add the given deltas to the relationship-, supplier- and purchaser-rows.
+        NOTE: does not commit, so that the change lands in the same transaction as the invoice-update causing it
+        """
+        if not any([used, requested, invoices]):
+            return
+        for s_id, p_id in [
+            (supplier_id, purchaser_id), (supplier_id, EXPOSURE_TOTAL), (EXPOSURE_TOTAL, purchaser_id)
+        ]:
+            # atomic upsert, so that concurrent updates on the same creditline do not overwrite each other
+            stmt = insert(CreditExposure).values(
+                supplier_id=s_id, purchaser_id=p_id, used=used, requested=requested, invoices=invoices
+            )
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=[CreditExposure.supplier_id, CreditExposure.purchaser_id],
+                set_={
+                    "used": CreditExposure.used + stmt.excluded.used,
+                    "requested": CreditExposure.requested + stmt.excluded.requested,
+                    "invoices": CreditExposure.invoices + stmt.excluded.invoices,
+                }
+            ))
+
+    def track_change(
+        self, db: Session, supplier_id: str, purchaser_id: str,
+        before: Tuple[str, float], after: Tuple[str, float]
+    ):
+        """ book the difference between two (finance_status, principal)-states of an invoice """
+        used_before, requested_before = to_exposure(*before)
+        used_after, requested_after = to_exposure(*after)
+        self.add(
+            db, supplier_id, purchaser_id,
+            used=used_after - used_before,
+            requested=requested_after - requested_before
+        )
+
+    def compute_from_invoices(self, db: Session) -> Dict[Tuple[str, str], Dict]:
+        """ recompute all ledger entries from the invoice table """
+        totals = {}
+        principal = func.coalesce(Invoice.principal, 0)
+        rows = db.query(
+            Invoice.supplier_id,
+            Invoice.purchaser_id,
+            func.sum(case([(Invoice.finance_status == FinanceStatus.FINANCED, principal)], else_=0)).label("used"),
+            func.sum(case([(Invoice.finance_status.in_(REQUESTED_STATUS), principal)], else_=0)).label("requested"),
+            func.count(Invoice.id).label("invoices"),
+        ).group_by(Invoice.supplier_id, Invoice.purchaser_id).all()
+        for row in rows:
+            for key in [
+                (row.supplier_id, row.purchaser_id),
+                (row.supplier_id, EXPOSURE_TOTAL),
+                (EXPOSURE_TOTAL, row.purchaser_id)
+            ]:
+                entry = totals.setdefault(key, {"used": 0, "requested": 0, "invoices": 0})
+                entry["used"] += row.used
+                entry["requested"] += row.requested
+                entry["invoices"] += row.invoices
+        return totals
+
+    def verify(self, db: Session, tolerance: float = 0.01) -> List[Tuple[Tuple[str, str], Dict, Dict]]:
+        """ compare the ledger with the invoice table, returns list of (key, stored, expected) that differ """
+        expected = self.compute_from_invoices(db)
+        stored = {
+            (r.supplier_id, r.purchaser_id): {"used": r.used, "requested": r.requested, "invoices": r.invoices}
+            for r in db.query(CreditExposure).all()
+        }
+        empty = {"used": 0, "requested": 0, "invoices": 0}
+        mismatches = []
+        for key in set(expected.keys()) | set(stored.keys()):
+            e, s = expected.get(key, empty), stored.get(key, empty)
+            if any(abs(e[field] - s[field]) > tolerance for field in empty):
+                mismatches.append((key, s, e))
+        return mismatches
+
+    def rebuild(self, db: Session):
+        """ drop the ledger and recompute it from the invoice table in one transaction """
+        self._logger.info("Rebuilding exposure ledger from invoice table")
+        totals = self.compute_from_invoices(db)
+        db.query(CreditExposure).delete(synchronize_session=False)
+        db.bulk_insert_mappings(CreditExposure, [
+            {"supplier_id": s_id, "purchaser_id": p_id, **entry} for (s_id, p_id), entry in totals.items()
+        ])
+        db.commit()
+        self._logger.info(f"Rebuilt {len(totals)} ledger entries")
+        return len(totals)
+
+
+exposure = ExposureService(CreditExposure)
@@ -3,28 +3,35 @@ from database.schemas import whitelist
 from database.schemas import InvoiceCreate
 from database.exceptions import (
     RelationshipLimitException, PurchaserLimitException, SupplierLimitException, 
-    DuplicateInvoiceException, UnknownInvoiceException, CreditLimitException)
+    DuplicateInvoiceException, UnknownInvoiceException, CreditLimitException, UnknownPurchaserException)
 from database.db import SessionLocal, session
 import datetime as dt
-from database.models import Invoice, User, Supplier
-from typing import Dict
-from invoice.tusker_client import code_to_order_status, tusker_client
+from database.models import Invoice, User, Supplier, Whitelist, Purchaser, CreditExposure, TokenizationLeaf
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import Text, and_, cast, func, or_, tuple_
+from sqlalchemy.dialects.postgresql import JSONB
+from invoice.tusker_client import FINAL_SHIPMENT_STATUS, code_to_order_status, tusker_client
 from utils.email import EmailClient, terms_to_email_body
 from sqlalchemy.orm import Session
 import json
-from utils.common import LoanTerms, CreditLineInfo, PaymentDetails, PurchaserInfo, RealizedTerms
+from utils.common import LoanTerms, CreditLineInfo, PaymentDetails, PurchaserInfo, RealizedTerms, InvoiceAdmission
 from utils.constant import DISBURSAL_EMAIL, ARBOREUM_DISBURSAL_EMAIL
-from invoice.utils import raw_order_to_price, invoice_to_principal
+from invoice.utils import raw_order_to_price, payment_details_to_columns
 import uuid
 from database.crud.whitelist_service import  whitelist_entry_to_receiverInfo
+from database.crud.exposure_service import EXPOSURE_TOTAL
 from database import crud
 from database.crud.base import CRUDBase
 from database.models import Invoice
 from database.schemas import InvoiceCreate, InvoiceUpdate
 from utils.common import FinanceStatus
 from utils.loan import principal_to_interest
-from utils.constant import INVOICE_FUNDING_RATE, DEFAULT_PURCHASER_LIMIT
-from algorand.algo_service import algo_service
+from utils.constant import INVOICE_FUNDING_RATE, DEFAULT_PURCHASER_LIMIT, SYNC_CHUNK_SIZE
+from algorand.utils import repayment_log_data
+
+# invoices in these states are not synced with tusker anymore
+FINAL_FINANCE_STATUS = [FinanceStatus.REPAID, FinanceStatus.DEFAULTED]
 
 
 
@@ -47,6 +54,22 @@ def invoice_to_terms(
         interest=principal_to_interest(funded_invoice_amount, apr,tenor_in_days),
     )
 
+
+class Creditline(NamedTuple):
+    """ the limits of a (locked) creditline and the credit already used on them """
+    supplier_id: str
+    purchaser_id: str
+    relationship_limit: float
+    purchaser_limit: float
+    supplier_limit: float
+    default_apr: Optional[float]
+    default_tenor_in_days: Optional[int]
+    # used + requested of the relationship
+    relationship_exposure: float
+    purchaser_used: float
+    supplier_used: float
+
+
 class InvoiceService(CRUDBase[Invoice, InvoiceCreate, InvoiceUpdate]):
     def insert_new_invoice_from_raw_order(self, raw_order: Dict, db: Session):
         # verify the customer of the order has the purchaser whitelisted
@@ -59,10 +82,104 @@ class InvoiceService(CRUDBase[Invoice, InvoiceCreate, InvoiceUpdate]):
         # tenor_in_days=whitelist_entry.tenor_in_days,
         # for now draw from supplier
         supplier = crud.supplier.get(db, supplier_id)
+        if not supplier:
+            raise UnknownInvoiceException("Invoice must belong to a supplier")
         apr=supplier.default_apr
         tenor_in_days=supplier.default_tenor_in_days
         return self._insert_new_invoice_for_purchaser_x_supplier(raw_order, purchaser_id, supplier_id, apr, tenor_in_days, db)
 
+    def admit_invoice(self, raw_order: Dict, db: Session):
+        """
+        check the credit limits of an order and insert it as new invoice in one transaction.
+        The limit rows stay locked from the check until the invoice is committed, so that concurrent admissions
+        on the same creditlines can not both pass on the same headroom.
+        """
+        try:
+            creditline = self._check_credit_limit(raw_order, db)
+            return self._insert_new_invoice_for_purchaser_x_supplier(
+                raw_order, creditline.purchaser_id, creditline.supplier_id,
+                creditline.default_apr, creditline.default_tenor_in_days, db
+            )
+        except Exception:
+            # release the locks
+            db.rollback()
+            raise
+
+    def admit_invoices(self, raw_orders: List[Dict], db: Session) -> List[InvoiceAdmission]:
+        """
+        batch version of admit_invoice: checks all orders against running totals of their creditlines
+        (locked with one query) and inserts the admitted ones in one transaction.
+        Orders are admitted in the given order, returns one admitted/rejected entry per order
+        """
+        report = []
+        location_to_purchaser = crud.whitelist.get_purchasers_from_location_ids(
+            db, [o.get('rcvr').get('id') for o in raw_orders]
+        )
+        pairs = {
+            (o.get('cust').get('id'), location_to_purchaser[o.get('rcvr').get('id')])
+            for o in raw_orders if o.get('rcvr').get('id') in location_to_purchaser
+        }
+        try:
+            creditlines = {(c.supplier_id, c.purchaser_id): c for c in self._lock_creditlines(db, list(pairs))}
+            existing = self.get_existing_ids([o.get('id') for o in raw_orders], db)
+            known_suppliers = {s[0] for s in db.query(Supplier.supplier_id).filter(
+                Supplier.supplier_id.in_({o.get('cust').get('id') for o in raw_orders})
+            ).all()}
+
+            # running totals: new invoices only add to the requested credit of their relationship
+            relationship_exposure = {key: c.relationship_exposure for key, c in creditlines.items()}
+            new_invoices = []
+            for raw_order in raw_orders:
+                invoice_id, order_ref = raw_order.get('id'), raw_order.get('ref_no')
+                supplier_id = raw_order.get('cust').get('id')
+                purchaser_id = location_to_purchaser.get(raw_order.get('rcvr').get('id'))
+                creditline = creditlines.get((supplier_id, purchaser_id))
+                value = raw_order_to_price(raw_order) * INVOICE_FUNDING_RATE
+
+                reason = ""
+                if invoice_id in existing:
+                    reason = "Invoice already exists"
+                elif not purchaser_id:
+                    reason = "Invalid recipient"
+                elif supplier_id not in known_suppliers:
+                    reason = f"Supplier {supplier_id} not registered"
+                elif not creditline:
+                    reason = "Reciever not whitelisted"
+                else:
+                    reason = self._get_limit_error(creditline, value, relationship_exposure[(supplier_id, purchaser_id)])
+
+                if reason:
+                    report.append(InvoiceAdmission(order_ref=order_ref, invoice_id=invoice_id, reason=reason))
+                    continue
+
+                new_invoices.append(self._to_new_invoice(
+                    raw_order, purchaser_id, supplier_id, creditline.default_apr, creditline.default_tenor_in_days
+                ))
+                relationship_exposure[(supplier_id, purchaser_id)] += value
+                existing.add(invoice_id)
+                report.append(InvoiceAdmission(order_ref=order_ref, invoice_id=invoice_id, admitted=True))
+
+            # book all admitted invoices with one upsert per creditline, in key order (like the creditline locks)
+            booked_by_creditline = {}
+            for i in new_invoices:
+                booked_by_creditline.setdefault((i.supplier_id, i.purchaser_id), []).append(i)
+            for (supplier_id, purchaser_id), booked in sorted(booked_by_creditline.items()):
+                crud.exposure.add(
+                    db, supplier_id, purchaser_id, requested=sum(i.principal for i in booked), invoices=len(booked)
+                )
+            db.add_all([Invoice(**jsonable_encoder(i)) for i in new_invoices])
+            db.commit()
+        except Exception:
+            # release the locks
+            db.rollback()
+            raise
+
+        self._logger.info(f"Admitted {len(new_invoices)} of {len(raw_orders)} orders")
+        return report
+
+    def get_existing_ids(self, invoice_ids: List[str], db: Session) -> Set[str]:
+        return {i[0] for i in db.query(Invoice.id).filter(Invoice.id.in_(invoice_ids)).all()}
+
     def _insert_new_invoice_for_purchaser_x_supplier(
         self, raw_order: Dict, purchaser_id: str, supplier_id: str, apr: float, tenor_in_days: int, db: Session
     ):
@@ -72,8 +189,31 @@ class InvoiceService(CRUDBase[Invoice, InvoiceCreate, InvoiceUpdate]):
         if exists:
             self._logger.error(f"Duplicate Invoice Entry: Order {_id} already in db. Raw Order: {raw_order}")
             raise DuplicateInvoiceException(f"invoice with {_id} already exists")
-        
-        new_invoice = InvoiceCreate(
+
+        new_invoice = self._to_new_invoice(raw_order, purchaser_id, supplier_id, apr, tenor_in_days)
+        crud.exposure.add(db, supplier_id, purchaser_id, requested=new_invoice.principal, invoices=1)
+        invoice = self.create(db, obj_in=new_invoice)
+        return invoice.id
+
+    def _to_new_invoice(
+        self, raw_order: Dict, purchaser_id: str, supplier_id: str, apr: float, tenor_in_days: int
+    ) -> InvoiceCreate:
+        _id = raw_order.get('id')
+        # calculate the terms upfront so that the invoice is created and booked on its creditline in one commit
+        terms = invoice_to_terms(
+            id=_id, order_id=raw_order.get('ref_no'), amount=raw_order_to_price(raw_order),
+            apr=apr, tenor_in_days=tenor_in_days
+        )
+        payment_details = PaymentDetails(
+            requestId=str(uuid.uuid4()),
+            repaymentId=str(uuid.uuid4()),
+            loan_id=terms.loan_id,
+            apr=terms.apr,
+            tenor_in_days=terms.tenor_in_days,
+            principal=terms.principal,
+            interest=terms.interest,
+        ).dict()
+        return InvoiceCreate(
             id=raw_order.get("id"),
             order_ref=raw_order.get('ref_no'),
             supplier_id=supplier_id,
@@ -84,16 +224,9 @@ class InvoiceService(CRUDBase[Invoice, InvoiceCreate, InvoiceUpdate]):
             tenor_in_days=tenor_in_days,
             value=raw_order_to_price(raw_order),
             data=json.dumps(raw_order),
-            payment_details=json.dumps(PaymentDetails(
-                requestId=str(uuid.uuid4()),
-                repaymentId=str(uuid.uuid4()),
-                apr=apr,
-                tenor_in_days=tenor_in_days
-            ).dict())
+            payment_details=json.dumps(payment_details),
+            **payment_details_to_columns(payment_details)
         )
-        invoice = self.create(db, obj_in=new_invoice)
-        self.prepare_disbursal(invoice, db)
-        return invoice.id
 
     def update_invoice_shipment_status(self, invoice_id: str, new_status: str, db: Session):
         invoice = self.get(db, invoice_id)
@@ -109,12 +242,37 @@ class InvoiceService(CRUDBase[Invoice, InvoiceCreate, InvoiceUpdate]):
 
     def update_and_log(self, db: Session, db_object, new_data: Dict):
         if db_object:
+            if 'payment_details' in new_data:
+                # keep the typed loan-term columns in sync with the payment_details
+                new_data = {**new_data, **payment_details_to_columns(json.loads(new_data['payment_details']))}
             update = InvoiceUpdate(**new_data, updated_on=dt.datetime.utcnow())
+            self._track_exposure(db, db_object, new_data)
             return self.update(db, db_obj=db_object, obj_in=update)
         else:
             self._logger.error(f"Update target object not found for new_data {new_data}")
             raise UnknownInvoiceException
 
+    def _track_exposure(self, db: Session, invoice: Invoice, new_data: Dict):
+        """ book changes in finance_status or principal on the exposure ledger (committed with the update) """
+        if 'finance_status' not in new_data and 'principal' not in new_data:
+            return
+        principal = invoice.principal or 0
+        crud.exposure.track_change(
+            db, invoice.supplier_id, invoice.purchaser_id,
+            before=(invoice.finance_status, principal),
+            after=(new_data.get('finance_status', invoice.finance_status), new_data.get('principal', principal))
+        )
+
+    def remove(self, db: Session, *, id: str) -> Invoice:
+        invoice = self.get(db, id)
+        if invoice:
+            crud.exposure.track_change(
+                db, invoice.supplier_id, invoice.purchaser_id,
+                before=(invoice.finance_status, invoice.principal or 0), after=(invoice.finance_status, 0)
+            )
+            crud.exposure.add(db, invoice.supplier_id, invoice.purchaser_id, invoices=-1)
+        return super().remove(db, id=id)
+
     def update_invoice_value(self, invoice_id: str, new_value: int, db: Session):
         invoice = self.get(db, invoice_id)
         self.update_and_log(db, invoice, { "value": new_value })
@@ -140,27 +298,15 @@ class InvoiceService(CRUDBase[Invoice, InvoiceCreate, InvoiceUpdate]):
             update['financed_on'] = financed_on
 
         if new_status == FinanceStatus.REPAID:
-            self._logger.info(f"trying to log repayment of {invoice_id} on algorand chain")
             if not tx_id:
                 raise AssertionError("All extra finance info must be there")
-            try:
-                new_tx_entry = algo_service.log_invoice_repayment(invoice_id, tx_id, db)
-                # update the list of transactions associated with the asset
-                # NOTE storing all that in the payment-details is starting to get messy
-                # we should start using pydantics JSON-support or create a proper table for this
-                # (or maybe just its own entry in the table)
-                tokenization_info = json.loads(invoice.payment_details).get('tokenization', {}) # this should not empty
-                # print('current tokenization', tokenization_info)
-                # print('old tokenization', len(tokenization_info['transactions']))
-                # print('new tx', new_tx_entry)
-                tokenization_info.get('transactions').update(new_tx_entry)
-                # print('new tokenization', tokenization_info)
-                # print('new tokenization', len(tokenization_info['transactions']))
-                crud.invoice.update_invoice_payment_details(
-                    invoice_id=invoice_id, new_data={"tokenization": tokenization_info}, db=db
-                )
-            except Exception as e:
-                self._logger.exception(f"ERROR logging payment to chain: {str(e)}")
+            if invoice.asset_id:
+                # logged on chain by the repayment log worker (see algorand.repayment_log_worker),
+                # the outbox entry is committed together with the new status
+                key = crud.repayment_log.enqueue(db, invoice, tx_id, repayment_log_data(invoice, tx_id))
+                self._logger.info(f"queued repayment log {key} of {invoice_id} for asset {invoice.asset_id}")
+            else:
+                self._logger.info(f"{invoice_id} is not tokenized, no repayment to log on chain")
 
         update['finance_status'] = new_status
         return self.update_and_log(db, invoice, update)
@@ -182,45 +328,157 @@ class InvoiceService(CRUDBase[Invoice, InvoiceCreate, InvoiceUpdate]):
         print('new data', new_data)
         self.update_and_log(db, invoice, {'payment_details': json.dumps(payment_details)})
 
+    def update_invoices_tokenization(
+        self, invoice_ids: List[str], tokenization: Dict, db: Session, leaves: Optional[List[Tuple[str, str]]] = None
+    ) -> int:
+        """
+        write the tokenization info (asset_id & transactions) into the payment_details and the asset_id column
+        of all given invoices in one statement and one transaction, together with the (invoice_id, leaf)-pairs
+        of the merkle tree the asset commits to (if any).
+        Invoices that are already tokenized are left alone, returns the number of updated invoices
+        """
+        payment_details = cast(func.coalesce(func.nullif(Invoice.payment_details, ""), "{}"), JSONB)
+        new_payment_details = payment_details.op("||")(
+            func.jsonb_build_object("tokenization", cast(json.dumps(tokenization), JSONB))
+        )
+        try:
+            updated = db.query(Invoice).filter(Invoice.id.in_(invoice_ids), Invoice.asset_id.is_(None)).update({
+                "payment_details": cast(new_payment_details, Text),
+                "asset_id": tokenization["asset_id"],
+                "updated_on": dt.datetime.utcnow(),
+            }, synchronize_session=False)
+            if leaves:
+                db.bulk_insert_mappings(TokenizationLeaf, [
+                    {"asset_id": tokenization["asset_id"], "leaf_index": index, "invoice_id": invoice_id, "leaf": leaf}
+                    for index, (invoice_id, leaf) in enumerate(leaves)
+                ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        # the loaded invoices do not know about the update
+        db.expire_all()
+        return updated
+
+    def get_tokenization_leaves(self, asset_id: int, db: Session) -> List[TokenizationLeaf]:
+        """ the leaves of the merkle tree of an asset, in order """
+        return db.query(TokenizationLeaf).filter(
+            TokenizationLeaf.asset_id == asset_id
+        ).order_by(TokenizationLeaf.leaf_index).all()
+
     def get_all_invoices(self, db: Session):
-        # TODO use skip & limit for pagination
-        return self.get_multi(db)
+        # NOTE: use get_invoices_page to list invoices page by page
+        return db.query(Invoice).all()
+
+    def get_invoices_page(
+        self,
+        db: Session,
+        limit: int = 100,
+        after: Optional[Tuple[dt.datetime, str]] = None,
+        supplier_id: Optional[str] = None,
+        purchaser_id: Optional[str] = None,
+        finance_status: Optional[str] = None,
+        shipment_status: Optional[str] = None,
+    ) -> List[Tuple[Invoice, Optional[Whitelist], Optional[Supplier]]]:
+        """
+        up to limit invoices (ordered by created_on, id) created after the given (created_on, id)-cursor,
+        together with their whitelist-entry and supplier, in one query
+        """
+        query = db.query(Invoice, Whitelist, Supplier).outerjoin(Whitelist, and_(
+            Whitelist.supplier_id == Invoice.supplier_id, Whitelist.purchaser_id == Invoice.purchaser_id
+        )).outerjoin(Supplier, Supplier.supplier_id == Invoice.supplier_id)
+        if after:
+            query = query.filter(tuple_(Invoice.created_on, Invoice.id) > tuple_(*after))
+        for column, value in [
+            (Invoice.supplier_id, supplier_id),
+            (Invoice.purchaser_id, purchaser_id),
+            (Invoice.finance_status, finance_status),
+            (Invoice.shipment_status, shipment_status),
+        ]:
+            if value is not None:
+                query = query.filter(column == value)
+        return query.order_by(Invoice.created_on, Invoice.id).limit(limit).all()
     
     def get_all_invoices_from_purchaser(self, purchaser_id: str, db: Session):
         return db.query(Invoice).filter(Invoice.purchaser_id == purchaser_id).all()
 
     def get_sum_of_live_invoices_from_purchaser(self, purchaser_id, db: Session):
-        invoices = self.get_all_invoices_from_purchaser(purchaser_id, db)
-        return sum([invoice_to_principal(i)  for i in invoices if i.finance_status == FinanceStatus.FINANCED])
+        return db.query(func.coalesce(func.sum(Invoice.principal), 0)).filter(
+            Invoice.purchaser_id == purchaser_id, Invoice.finance_status == FinanceStatus.FINANCED
+        ).scalar()
+
+    def get_invoices_from_loan(self, loan_id: str, db: Session):
+        return db.query(Invoice).filter(Invoice.loan_id == loan_id).all()
+
+    def check_loan_invoices(self, loan_id: str, db: Session):
+        """
+        one aggregate (over the loan_id index) with the number of invoices of a loan and the order refs of those
+        that are already tokenized, not FINANCED or without disbursal tx-ref (None if there are none)
+        """
+        return db.query(
+            func.count(Invoice.id).label("invoices"),
+            func.array_agg(Invoice.order_ref).filter(Invoice.asset_id.isnot(None)).label("tokenized"),
+            func.array_agg(func.concat(Invoice.order_ref, ": ", Invoice.finance_status)).filter(
+                func.coalesce(Invoice.finance_status, "") != FinanceStatus.FINANCED
+            ).label("not_financed"),
+            func.array_agg(Invoice.order_ref).filter(
+                func.coalesce(Invoice.disbursal_transaction_id, "") == ""
+            ).label("without_tx_ref"),
+        ).filter(Invoice.loan_id == loan_id).one()
 
     def get_all_invoices_from_supplier(self, supplier_id: str, db: Session):
         return db.query(Invoice).filter(Invoice.supplier_id == supplier_id).all()
 
-    def update_invoice_db(self, db: Session):
-        """ get latest data for all invoices in db from tusker, compare shipment status,
+    def update_invoice_db(self, db: Session, chunk_size: int = SYNC_CHUNK_SIZE):
+        """ get latest data for all live invoices in db from tusker, compare shipment status,
         if changed: 
             try to process it, update DB if processing was successful
+        invoices are synced in chunks of chunk_size, the stalest first, so that a sync that crashed
+        half-way is continued by the next run
         returns (list of successful updates, list of failed updates)
         """
+        _, updated, errored = self.sync_shipments(db, chunk_size)
+        return updated, errored
+
+    def sync_shipments(self, db: Session, chunk_size: int = SYNC_CHUNK_SIZE) -> Tuple[int, List, List]:
+        """ update_invoice_db, also returning the number of invoices checked """
+        checked = 0
         updated = []
         errored = []
-        # get latest data for all (TODO non-final) orders in DB
-        res = db.query(Invoice).all()
-        # TODO optimize by moving all filtering into the query
-        invoices = {i.id: i for i in res}
-        # get order_ref to track by
-        all_reference_numbers = [i.order_ref for i in res]
-        latest_raw_orders = tusker_client.track_orders(all_reference_numbers)
-        self._logger.info(f"updating {len(latest_raw_orders)} orders")
-
-        # compare with DB if status changed
-        for order in latest_raw_orders:
+        sync_started = dt.datetime.utcnow()
+        while True:
+            chunk = self._get_invoices_to_sync(db, sync_started, chunk_size)
+            if not chunk:
+                break
+            invoices = {i.id: i for i in chunk}
+            checked += len(chunk)
+            # get order_ref to track by, process the orders page by page as they arrive
+            for orders in tusker_client.iter_order_pages([i.order_ref for i in chunk]):
+                self._logger.info(f"updating {len(orders)} orders")
+                self._sync_orders(db, invoices, orders, updated, errored)
+
+            # mark the whole chunk (also orders tusker did not return) as synced so the next chunk moves on
+            db.query(Invoice).filter(Invoice.id.in_(list(invoices.keys()))).update(
+                {"last_synced_at": sync_started, "updated_on": Invoice.updated_on}, synchronize_session=False
+            )
+            db.commit()
+
+        return checked, updated, errored
+
+    def _sync_orders(
+        self, db: Session, invoices: Dict[str, Invoice], orders: List[Dict], updated: List, errored: List
+    ):
+        """ compare the latest orders with their invoices, if the shipment status changed, process and store it """
+        for order in orders:
+            invoice = invoices.get(order.get("id"))
+            if not invoice:
+                continue
             new_shipment_status = code_to_order_status(order.get("status"))
-            invoice = invoices[order.get("id")]
             self._logger.info(f"updating order with ref_no: {order.get('ref_no')}")
             if new_shipment_status != invoice.shipment_status:
                 # ...if new, enact consequence and if successful update DB
                 self._logger.info(f"{invoice.shipment_status} -> {new_shipment_status}")
+                tusker_client.order_cache.invalidate(order.get("ref_no"))
                 update = {}
                 try:
                     self.handle_update(db, invoice, new_shipment_status, order)
@@ -230,13 +488,20 @@ class InvoiceService(CRUDBase[Invoice, InvoiceCreate, InvoiceUpdate]):
                     self.update_and_log(db, invoice, update)
                     updated.append((invoice.id, new_shipment_status))
                 except Exception as e:
+                    db.rollback()
                     print(f"ERROR handling {invoice.id}: {str(e)}")
                     self._logger.exception(f"ERROR handling {invoice.id}: {str(e)}")
                     errored.append((invoice.id, new_shipment_status))
             else:
                 self._logger.info(f"no update needed: {invoice.shipment_status} unchanged.")
 
-        return updated, errored
+    def _get_invoices_to_sync(self, db: Session, synced_before: dt.datetime, limit: int) -> List[Invoice]:
+        """ invoices whose shipment can still change and that were not synced since synced_before """
+        return db.query(Invoice).filter(
+            or_(Invoice.shipment_status.is_(None), Invoice.shipment_status.notin_(FINAL_SHIPMENT_STATUS)),
+            or_(Invoice.finance_status.is_(None), Invoice.finance_status.notin_(FINAL_FINANCE_STATUS)),
+            or_(Invoice.last_synced_at.is_(None), Invoice.last_synced_at < synced_before),
+        ).order_by(Invoice.last_synced_at.asc().nullsfirst(), Invoice.id).limit(limit).all()
 
     def handle_update(self, db: Session, invoice: Invoice, new_status: str, order: Dict):
         error = ""
@@ -274,70 +539,178 @@ class InvoiceService(CRUDBase[Invoice, InvoiceCreate, InvoiceUpdate]):
         2) receiver limit is not crossed
         2) purchaser limit is not crossed
         """
-        target_location_id=raw_order.get('rcvr').get('id')
-        supplier_id=raw_order.get('cust').get('id')
-        purchaser_id = crud.whitelist.get_whitelisted_purchaser_from_location_id(db, supplier_id, target_location_id)
-
-        value=raw_order_to_price(raw_order) * INVOICE_FUNDING_RATE
-        supplier_relationships = self.get_credit_line_info(supplier_id, db)
+        self._check_credit_limit(raw_order, db)
+        return True
 
+    def _creditline_query(self, db: Session):
+        """
+        limits of whitelisted relationships, their purchasers and their suppliers,
+        locking the whitelist-, purchaser- and supplier-rows until the end of the transaction
+        """
+        return db.query(
+            Whitelist.supplier_id,
+            Whitelist.purchaser_id,
+            Whitelist.creditline_size.label("relationship_limit"),
+            Purchaser.credit_limit.label("purchaser_limit"),
+            Supplier.creditline_size.label("supplier_limit"),
+            Supplier.default_apr,
+            Supplier.default_tenor_in_days,
+        ).join(
+            Supplier, Supplier.supplier_id == Whitelist.supplier_id
+        ).join(
+            Purchaser, Purchaser.purchaser_id == Whitelist.purchaser_id
+        ).with_for_update(of=[Whitelist, Purchaser, Supplier])
+
+    def _with_exposure(self, db: Session, limits) -> List[Creditline]:
+        """
+        adds the exposure to the locked limits. Read in a statement of its own after the locks are granted:
+        under READ COMMITTED the statement that waited for a lock still sees the exposure from before the
+        transaction holding it committed, only a new statement sees its bookings
+        """
+        if not limits:
+            return []
+        keys = set()
+        for limit in limits:
+            keys |= {
+                (limit.supplier_id, limit.purchaser_id),
+                (EXPOSURE_TOTAL, limit.purchaser_id),
+                (limit.supplier_id, EXPOSURE_TOTAL),
+            }
+        exposure = {
+            (e.supplier_id, e.purchaser_id): e for e in db.query(CreditExposure).filter(
+                tuple_(CreditExposure.supplier_id, CreditExposure.purchaser_id).in_(list(keys))
+            ).all()
+        }
+
+        def used(key, requested=False):
+            e = exposure.get(key)
+            return ((e.used or 0) + ((e.requested or 0) if requested else 0)) if e else 0
+
+        return [Creditline(
+            **limit._asdict(),
+            relationship_exposure=used((limit.supplier_id, limit.purchaser_id), requested=True),
+            purchaser_used=used((EXPOSURE_TOTAL, limit.purchaser_id)),
+            supplier_used=used((limit.supplier_id, EXPOSURE_TOTAL)),
+        ) for limit in limits]
+
+    def _lock_creditline(self, db: Session, supplier_id: str, location_id: str) -> Optional[Creditline]:
+        """ fetch & lock the creditline an order would be booked on """
+        # same lookup as whitelist.get_whitelisted_purchaser_from_location_id
+        purchaser_id = db.query(Whitelist.purchaser_id).filter(Whitelist.location_id == location_id).limit(1).as_scalar()
+        limits = self._creditline_query(db).filter(
+            Whitelist.supplier_id == supplier_id, Whitelist.purchaser_id == purchaser_id
+        ).first()
+        return self._with_exposure(db, [limits])[0] if limits else None
+
+    def _lock_creditlines(self, db: Session, supplier_x_purchaser_ids: List[Tuple[str, str]]) -> List[Creditline]:
+        """
+        fetch & lock several creditlines. The rows are locked in the order of their keys, so concurrent
+        batches on overlapping creditlines wait for each other instead of deadlocking
+        """
+        if not supplier_x_purchaser_ids:
+            return []
+        return self._with_exposure(db, self._creditline_query(db).filter(
+            tuple_(Whitelist.supplier_id, Whitelist.purchaser_id).in_(sorted(supplier_x_purchaser_ids))
+        ).order_by(Whitelist.supplier_id, Whitelist.purchaser_id).all())
+
+    def _get_limit_error(self, creditline, value: float, relationship_exposure: float) -> str:
+        """ returns why an invoice of given value can not be financed on a creditline, empty if it can """
         # 1) relationship limit
-        if supplier_relationships[purchaser_id].available < value:
-            # raise RelationshipLimitException(
-            msg = f"Relationship limit exceeded: {supplier_relationships[purchaser_id].available} not enough \
-                    to fund invoice of value {value}"
-            assert False, msg
-            raise RelationshipLimitException(msg) # TODO
+        available = creditline.relationship_limit - relationship_exposure
+        if available < value:
+            return f"Relationship limit exceeded: {available} not enough to fund invoice of value {value}"
 
         # 2) receiver limit not crossed
-        purchaser_invoices = crud.invoice.get_all_invoices_from_purchaser(purchaser_id, db)
-        total_value_financed = sum(invoice_to_principal(i) for i in purchaser_invoices if i.finance_status == FinanceStatus.FINANCED)
-        purchaser = crud.purchaser.get(db, purchaser_id)
-        if purchaser.credit_limit < value + total_value_financed:
-            msg = f"Purchaser limit exceeded: Funded ({total_value_financed}) and invoice of value {value} \
-                exceed limit ({purchaser.credit_limit})."
-            assert False, msg
-            raise PurchaserLimitException(msg=msg)
+        if creditline.purchaser_limit < value + creditline.purchaser_used:
+            return f"Purchaser limit exceeded: Funded ({creditline.purchaser_used}) and invoice of value {value} \
+                exceed limit ({creditline.purchaser_limit})."
 
          # 3) supplier limit not crossed
-        supplier_invoices = crud.invoice.get_all_invoices_from_supplier(supplier_id, db)
-        total_value_financed = sum(invoice_to_principal(i) for i in supplier_invoices if i.finance_status == FinanceStatus.FINANCED)
-        supplier = crud.supplier.get(db, supplier_id)
-        if supplier.creditline_size < value + total_value_financed:
-            msg = f"Supplier limit exceeded: Funded ({total_value_financed}) and invoice of value {value} \
-                exceed limit ({supplier.creditline_size})."
-            assert False, msg
-            raise SupplierLimitException(msg)
+        if creditline.supplier_limit < value + creditline.supplier_used:
+            return f"Supplier limit exceeded: Funded ({creditline.supplier_used}) and invoice of value {value} \
+                exceed limit ({creditline.supplier_limit})."
+        return ""
 
-        return True
+    def _check_credit_limit(self, raw_order, db: Session):
+        """ check_credit_limit, returning the (locked) creditline the order would be booked on """
+        target_location_id=raw_order.get('rcvr').get('id')
+        supplier_id=raw_order.get('cust').get('id')
+        creditline = self._lock_creditline(db, supplier_id, target_location_id)
+        if not creditline:
+            # find out why to raise the informative exception
+            purchaser_id = crud.whitelist.get_whitelisted_purchaser_from_location_id(db, supplier_id, target_location_id)
+            raise UnknownPurchaserException(f"Purchaser {purchaser_id} or supplier {supplier_id} not registered")
+
+        value=raw_order_to_price(raw_order) * INVOICE_FUNDING_RATE
+        msg = self._get_limit_error(creditline, value, creditline.relationship_exposure)
+        # TODO raise Relationship-/Purchaser-/SupplierLimitException instead
+        assert not msg, msg
+        return creditline
 
-    # TODO turn this into a view using
-    # https://stackoverflow.com/questions/9766940/how-to-create-an-sql-view-with-sqlalchemy
     def get_credit_line_info(self, supplier_id: str, db: Session):
-        credit_line_breakdown = {}
-        for w_entry in crud.whitelist.get_whitelist(db, supplier_id):
-            credit_line_size  = w_entry.creditline_size if w_entry.creditline_size != 0 else 0
-
-            invoices = db.query(Invoice).filter(Invoice.purchaser_id == w_entry.purchaser_id).all()
-            to_be_repaid = sum(invoice_to_principal(i) for i in invoices if i.finance_status == FinanceStatus.FINANCED)
-            requested = sum(invoice_to_principal(i) for i in invoices if i.finance_status in [ FinanceStatus.DISBURSAL_REQUESTED, FinanceStatus.INITIAL])
-            n_of_invoices = len(invoices)
-
-            credit_line_breakdown[w_entry.purchaser_id] = CreditLineInfo(**{
-                "supplier_id": supplier_id,
-                "info": whitelist_entry_to_receiverInfo(w_entry),
-                "total": credit_line_size,
-                "available": credit_line_size - to_be_repaid - requested, #invoince.value for invoice in to_be_repaid)
-                "used":to_be_repaid,
-                "requested": requested,
-                "invoices": n_of_invoices
-            })
-        return credit_line_breakdown
+        """ creditline breakdown per whitelisted purchaser, read from the exposure ledger """
+        return {
+            w_entry.purchaser_id: self._to_credit_line_info(w_entry, exposure)
+            for w_entry, exposure in self._credit_lines(db).filter(Whitelist.supplier_id == supplier_id).all()
+        }
 
     def get_credit_line_summary(self, supplier_id: str, supplier_name: str, db: Session):
+        return self._to_credit_line_summary(supplier_name, self.get_credit_line_info(supplier_id, db).values())
+
+    def get_provider_summary(self, provider: str, db: Session):
+        """ create a credit line summary for all customers whose role is user """
+        # (as before, the summaries of all suppliers whatever the provider)
+        return self.get_credit_dashboard(db)["tusker"]
+
+    def get_credit_dashboard(self, db: Session) -> Dict[str, Dict[str, CreditLineInfo]]:
+        """
+        the /credit payload in one query: the summary of every supplier (by name, under "tusker")
+        and the creditline breakdown of every supplier (by supplier_id)
+        """
+        rows = db.query(Supplier, Whitelist, CreditExposure).outerjoin(
+            Whitelist, Whitelist.supplier_id == Supplier.supplier_id
+        ).outerjoin(CreditExposure, and_(
+            CreditExposure.supplier_id == Whitelist.supplier_id, CreditExposure.purchaser_id == Whitelist.purchaser_id
+        )).all()
+
+        suppliers = {}
+        breakdowns = {}
+        for supplier, w_entry, exposure in rows:
+            suppliers[supplier.supplier_id] = supplier
+            breakdown = breakdowns.setdefault(supplier.supplier_id, {})
+            if w_entry:
+                breakdown[w_entry.purchaser_id] = self._to_credit_line_info(w_entry, exposure)
+
+        summaries = {
+            supplier.name: self._to_credit_line_summary(supplier.name, breakdowns[supplier_id].values())
+            for supplier_id, supplier in suppliers.items()
+        }
+        return {"tusker": summaries, **breakdowns}
+
+    def _credit_lines(self, db: Session):
+        """ whitelist entries with their exposure """
+        return db.query(Whitelist, CreditExposure).outerjoin(CreditExposure, and_(
+            CreditExposure.supplier_id == Whitelist.supplier_id, CreditExposure.purchaser_id == Whitelist.purchaser_id
+        ))
+
+    def _to_credit_line_info(self, w_entry: Whitelist, exposure: Optional[CreditExposure]) -> CreditLineInfo:
+        credit_line_size  = w_entry.creditline_size if w_entry.creditline_size != 0 else 0
+        to_be_repaid = exposure.used if exposure else 0
+        requested = exposure.requested if exposure else 0
+        n_of_invoices = exposure.invoices if exposure else 0
+        return CreditLineInfo(**{
+            "supplier_id": w_entry.supplier_id,
+            "info": whitelist_entry_to_receiverInfo(w_entry),
+            "total": credit_line_size,
+            "available": credit_line_size - to_be_repaid - requested, #invoince.value for invoice in to_be_repaid)
+            "used":to_be_repaid,
+            "requested": requested,
+            "invoices": n_of_invoices
+        })
+
+    def _to_credit_line_summary(self, supplier_name: str, credit_lines) -> CreditLineInfo:
         summary = CreditLineInfo(info=PurchaserInfo(name=supplier_name), supplier_id="tusker")
-        credit_line_breakdown = self.get_credit_line_info(supplier_id, db)
-        for c in credit_line_breakdown.values():
+        for c in credit_lines:
             summary.total += c.total
             summary.available += c.available
             summary.used += c.used
@@ -345,14 +718,6 @@ class InvoiceService(CRUDBase[Invoice, InvoiceCreate, InvoiceUpdate]):
             summary.invoices += c.invoices
         return summary
 
-    def get_provider_summary(self, provider: str, db: Session):
-        """ create a credit line summary for all customers whose role is user """
-        credit = {}
-        for supplier in crud.supplier.get_all_suppliers(db):
-            credit[supplier.name] = crud.invoice.get_credit_line_summary(supplier_id=supplier.supplier_id, supplier_name=supplier.name, db=db)
-        return credit
-
-
 
 invoice = InvoiceService(Invoice)
 
@@ -168,10 +168,14 @@ class KYCUserService(CRUDBase[KYCUser, KYCUserCreate, KYCUserUpdate]):
         # create new data object to be stored and append updates
         # new_user_data = json.loads(copy.deepcopy(user_entry.data))
         new_user_data = copy.deepcopy(user_entry.data)
-        for doc_name, image_url in update.dict(exclude_unset=True).items():
-            if doc_name == "phone_number": continue
-            # TODO LEVEL 2: download image from link and store in file-path
-            path = image_service.fetch_and_store(image_url=image_url, doc_name=doc_name, phone_number=update.phone_number)
+        image_urls = {
+            doc_name: image_url for doc_name, image_url in update.dict(exclude_unset=True).items()
+            if doc_name != "phone_number"
+        }
+        # LEVEL 2: download the images (at the same time) and store them in file-paths
+        paths = image_service.fetch_and_store_all(image_urls, phone_number=update.phone_number)
+        for doc_name in image_urls:
+            path = paths[doc_name]
            # create new object with existing & new filepaths
             new_image_data = new_user_data['images'].get(
                 doc_name,
@@ -2,10 +2,12 @@ from database.utils import remove_none_entries
 from routes.v1.purchaser import PurchaserUpdateInput
 from database.exceptions import UnknownPurchaserException, DuplicatePurchaserEntryException
 from os import name
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from database.db import session
-from database.models import Purchaser
+from database.models import CreditExposure, Purchaser
+from database.crud.exposure_service import EXPOSURE_TOTAL
 from database.crud.base import CRUDBase
 from database.schemas import PurchaserCreate, PurchaserUpdate
 
@@ -17,6 +19,18 @@ class PurchaserService(CRUDBase[Purchaser, PurchaserCreate, PurchaserUpdate]):
     def get_all(self, db: Session):
         return db.query(Purchaser).all()
 
+    def get_with_credit_used(
+        self, db: Session, skip: int = 0, limit: Optional[int] = None, name: Optional[str] = None
+    ) -> List[Tuple[Purchaser, float]]:
+        """ purchasers (ordered by name) with the sum of their financed invoices from the exposure ledger """
+        query = db.query(Purchaser, func.coalesce(CreditExposure.used, 0)).outerjoin(
+            CreditExposure,
+            (CreditExposure.supplier_id == EXPOSURE_TOTAL) & (CreditExposure.purchaser_id == Purchaser.purchaser_id)
+        )
+        if name:
+            query = query.filter(Purchaser.name.ilike(f"%{name}%"))
+        return query.order_by(Purchaser.name, Purchaser.purchaser_id).offset(skip).limit(limit).all()
+
     def remove(self, db: Session, purchaser_id: str):
         obj = self.get(db, purchaser_id)
         db.delete(obj)
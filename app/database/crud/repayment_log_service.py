@@ -0,0 +1,176 @@
+import datetime as dt
+import json
+import uuid
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from database.crud.base import CRUDBase
+from database.models import Invoice, RepaymentLog
+from database.schemas import RepaymentLogCreate, RepaymentLogUpdate
+from utils.common import RepaymentLogStatus
+from utils.constant import REPAYMENT_LOG_BACKOFF_IN_S, REPAYMENT_LOG_MAX_ATTEMPTS, REPAYMENT_LOG_MAX_BACKOFF_IN_S
+
+
+def to_idempotency_key(invoice_id: str, tx_ref: str) -> str:
+    """ the same repayment always gets the same key """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"repayment/{invoice_id}/{tx_ref}"))
+
+
+def to_batch_idempotency_key(entries: List[RepaymentLog]) -> str:
+    """
+    key of a log entry covering several outbox entries. It is stored on the entries as their batch_key when they are
+    first claimed together (see RepaymentLogService.claim_next_batch), so that a retry sends the same batch again
+    """
+    if len(entries) == 1:
+        return entries[0].idempotency_key
+    keys = ",".join(sorted(e.idempotency_key for e in entries))
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"repayments/{keys}"))
+
+
+def to_backoff_in_s(attempts: int) -> float:
+    """ seconds to wait before the next attempt after the given number of failed attempts """
+    return min(REPAYMENT_LOG_BACKOFF_IN_S * 2 ** (attempts - 1), REPAYMENT_LOG_MAX_BACKOFF_IN_S)
+
+
+class RepaymentLogService(CRUDBase[RepaymentLog, RepaymentLogCreate, RepaymentLogUpdate]):
+    def enqueue(self, db: Session, invoice: Invoice, tx_ref: str, log_data: Dict) -> str:
+        """
+        add the log entry of a repayment of a tokenized invoice to the outbox, returns its idempotency key.
+        Enqueueing the same repayment twice only adds one entry.
+        NOTE: does not commit, so that the entry lands in the same transaction as the repayment
+        """
+        key = to_idempotency_key(invoice.id, tx_ref)
+        now = dt.datetime.utcnow()
+        stmt = insert(RepaymentLog).values(
+            idempotency_key=key,
+            invoice_id=invoice.id,
+            asset_id=invoice.asset_id,
+            log_data=json.dumps(log_data),
+            status=RepaymentLogStatus.PENDING,
+            attempts=0,
+            next_attempt_at=now,
+            created_on=now,
+        )
+        db.execute(stmt.on_conflict_do_nothing(index_elements=[RepaymentLog.idempotency_key]))
+        return key
+
+    def get_from_invoice(self, db: Session, invoice_id: str) -> List[RepaymentLog]:
+        return db.query(RepaymentLog).filter(RepaymentLog.invoice_id == invoice_id).order_by(RepaymentLog.id).all()
+
+    def claim_next(self, db: Session) -> Optional[RepaymentLog]:
+        """
+        the longest due pending entry, locked until the next commit or rollback.
+        Entries locked by other workers are skipped, so that every entry is sent by one worker at a time
+        """
+        return self._due_entries(db).order_by(
+            RepaymentLog.next_attempt_at, RepaymentLog.id
+        ).with_for_update(skip_locked=True).first()
+
+    def claim_next_batch(self, db: Session, limit: int) -> List[RepaymentLog]:
+        """
+        the longest due pending entry and up to limit - 1 further due entries of the same asset, all locked.
+        Contains at most one entry per invoice (further ones are left for the next batch).
+        A new batch is committed under its batch_key before it is returned, a batch that was claimed before is
+        claimed again as it is, so that the logger can recognize it by its key even if the last attempt
+        was logged but its response got lost
+        """
+        first = self.claim_next(db)
+        if not first:
+            return []
+        if first.batch_key:
+            return self._claim_batch(db, first.batch_key)
+
+        batch = {first.invoice_id: first}
+        if limit > 1:
+            others = self._due_entries(db).filter(
+                RepaymentLog.asset_id == first.asset_id,
+                RepaymentLog.invoice_id != first.invoice_id,
+                RepaymentLog.batch_key.is_(None),
+            ).order_by(RepaymentLog.id).limit(limit - 1).with_for_update(skip_locked=True).all()
+            for entry in others:
+                batch.setdefault(entry.invoice_id, entry)
+        key = to_batch_idempotency_key(list(batch.values()))
+        for entry in batch.values():
+            entry.batch_key = key
+        # the batch has to be on record before it is sent
+        db.commit()
+        return self._claim_batch(db, key)
+
+    def _claim_batch(self, db: Session, batch_key: str) -> List[RepaymentLog]:
+        """
+        the pending entries of a batch, locked. Waits for a worker that is sending the batch already
+        (instead of skipping its entries), so that a batch is never sent in parts. Empty if that worker sent it
+        """
+        return db.query(RepaymentLog).filter(
+            RepaymentLog.batch_key == batch_key, RepaymentLog.status == RepaymentLogStatus.PENDING
+        ).order_by(RepaymentLog.id).with_for_update().all()
+
+    def _due_entries(self, db: Session):
+        return db.query(RepaymentLog).filter(
+            RepaymentLog.status == RepaymentLogStatus.PENDING,
+            RepaymentLog.next_attempt_at <= dt.datetime.utcnow(),
+        )
+
+    def mark_sent(self, db: Session, entries: List[RepaymentLog], tx_id: str, tx_info: Dict):
+        """
+        store the tx that logged the given entries on the entries and in the tokenization-transactions
+        of their invoices (all of them refer to the same tx), commits once
+        """
+        now = dt.datetime.utcnow()
+        for entry in entries:
+            entry.status = RepaymentLogStatus.SENT
+            entry.attempts += 1
+            entry.tx_id = tx_id
+            entry.sent_on = now
+            entry.last_error = None
+        log_data = {e.invoice_id: json.loads(e.log_data) for e in entries}
+        invoices = db.query(Invoice).filter(Invoice.id.in_(list(log_data.keys()))).with_for_update().all()
+        for invoice in invoices:
+            payment_details = json.loads(invoice.payment_details)
+            tokenization = payment_details.get("tokenization") or {}
+            transactions = tokenization.get("transactions") or {}
+            transactions[tx_id] = {"log_data": log_data[invoice.id], "tx_info": tx_info}
+            payment_details["tokenization"] = {**tokenization, "transactions": transactions}
+            invoice.payment_details = json.dumps(payment_details)
+            invoice.updated_on = now
+        if len(invoices) < len(log_data):
+            missing = set(log_data.keys()) - {i.id for i in invoices}
+            self._logger.error(f"Invoices {missing} of repayment log tx {tx_id} not found")
+        db.commit()
+
+    def mark_failed(self, db: Session, entries: List[RepaymentLog], error: str):
+        """ schedule the next attempt with exponential backoff, or give up after REPAYMENT_LOG_MAX_ATTEMPTS """
+        for entry in entries:
+            entry.attempts += 1
+            entry.last_error = error
+            if entry.attempts >= REPAYMENT_LOG_MAX_ATTEMPTS:
+                self._logger.error(f"Giving up on repayment log {entry.idempotency_key} after {entry.attempts} attempts")
+                entry.status = RepaymentLogStatus.FAILED
+            else:
+                entry.next_attempt_at = dt.datetime.utcnow() + dt.timedelta(seconds=to_backoff_in_s(entry.attempts))
+        db.commit()
+
+    def retry_failed(self, db: Session) -> int:
+        """ move all entries that were given up on back into the queue, returns their number """
+        # (they keep their batch_key, the logger might have logged them after all)
+        retried = db.query(RepaymentLog).filter(RepaymentLog.status == RepaymentLogStatus.FAILED).update({
+            "status": RepaymentLogStatus.PENDING, "attempts": 0, "next_attempt_at": dt.datetime.utcnow()
+        }, synchronize_session=False)
+        db.commit()
+        return retried
+
+    def get_stats(self, db: Session) -> Dict:
+        """ number of pending & failed entries and when the oldest pending entry was created """
+        rows = db.query(
+            RepaymentLog.status, func.count(RepaymentLog.id), func.min(RepaymentLog.created_on)
+        ).filter(RepaymentLog.status != RepaymentLogStatus.SENT).group_by(RepaymentLog.status).all()
+        by_status = {status: (count, oldest) for status, count, oldest in rows}
+        pending, oldest_pending = by_status.get(RepaymentLogStatus.PENDING, (0, None))
+        failed, _ = by_status.get(RepaymentLogStatus.FAILED, (0, None))
+        return {"pending": pending, "failed": failed, "oldest_pending": oldest_pending}
+
+
+repayment_log = RepaymentLogService(RepaymentLog)
@@ -45,6 +45,13 @@ class WhitelistService(CRUDBase[Whitelist, WhitelistCreate, WhitelistUpdate]):
         else: 
             raise UnknownPurchaserException("unkwown purchaser id")
 
+    def get_from_purchaser_ids(self, db: Session, purchaser_ids: List[str]) -> Dict[str, Whitelist]:
+        """ batch version of get_from_purchaser_id, purchasers without whitelist entry are left out """
+        entries = db.query(Whitelist).filter(Whitelist.purchaser_id.in_(purchaser_ids)).distinct(
+            Whitelist.purchaser_id
+        ).order_by(Whitelist.purchaser_id).all()
+        return {e.purchaser_id: e for e in entries}
+
     def purchaser_id_to_location(self, db: Session, _purchaser_id: str):
         return self.get_from_purchaser_id(db, _purchaser_id).location_id
 
@@ -74,6 +81,16 @@ class WhitelistService(CRUDBase[Whitelist, WhitelistCreate, WhitelistUpdate]):
         ).first()
         return bool(exists)
 
+    def get_purchasers_from_location_ids(self, db: Session, location_ids: List[str]) -> Dict[str, str]:
+        """ batch version of location_to_purchaser_id, unknown locations are left out """
+        location_to_purchaser = {}
+        rows = db.query(Whitelist.location_id, Whitelist.purchaser_id).filter(
+            Whitelist.location_id.in_(set(location_ids))
+        ).all()
+        for location_id, purchaser_id in rows:
+            location_to_purchaser.setdefault(location_id, purchaser_id)
+        return location_to_purchaser
+
     def get_whitelisted_purchaser_from_location_id(self, db: Session, supplier_id: str, location_id: str):
         """ return a purchaser id if a given supplier has them whitelisted as customer """
         # note this is a two step query so we can get more informative error messages
@@ -73,6 +73,22 @@ class AssetCreationException(BaseException):
     pass
 
 
+class TuskerException(BaseException):
+    pass
+
+class TuskerConnectionException(TuskerException):
+    """ tusker could not be reached (in time) """
+    pass
+
+class TuskerServerException(TuskerException):
+    """ tusker responded with a 5xx """
+    pass
+
+class TuskerRequestException(TuskerException):
+    """ tusker rejected the request (4xx) """
+    pass
+
+
 class UnknownPhoneNumberException(BaseException):
     pass
 
@@ -82,6 +98,10 @@ class DuplicatePhoneNumberException(BaseException):
 class NoDocumentsException(BaseException):
     pass
 
+class ImageDownloadException(BaseException):
+    """ a kyc document could not be fetched (unreachable, error response, too large or too slow) """
+    pass
+
 
 
 
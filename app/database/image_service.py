@@ -1,15 +1,30 @@
 import requests
 import urllib.request
 import os
-from typing import List
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 import shutil
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from database.exceptions import ImageDownloadException
+from utils.logger import get_logger
 # class to provide facilites to take an url-link, download the file
 # store it on the harddrive, under a location that makes sense.
 # Moreover, it should be able to retrieve those files in a way
 # that they can be served over api, either individually or as a zip-file
 
 load_dotenv()
+IMAGE_CONNECT_TIMEOUT_IN_S = float(os.getenv("IMAGE_CONNECT_TIMEOUT_IN_S", 3.05))
+IMAGE_READ_TIMEOUT_IN_S = float(os.getenv("IMAGE_READ_TIMEOUT_IN_S", 20))
+# a download that takes longer than this in total is aborted (checked between chunks)
+IMAGE_DOWNLOAD_TIMEOUT_IN_S = float(os.getenv("IMAGE_DOWNLOAD_TIMEOUT_IN_S", 120))
+IMAGE_MAX_SIZE_IN_BYTES = int(os.getenv("IMAGE_MAX_SIZE_IN_BYTES", 25 * 1024 * 1024))
+IMAGE_CHUNK_SIZE_IN_BYTES = 64 * 1024
+# max number of documents downloaded at the same time (over all requests)
+IMAGE_DOWNLOAD_WORKERS = int(os.getenv("IMAGE_DOWNLOAD_WORKERS", 4))
 
 def create_zip_folder(target_dir_path: str, output_filename: str):
     shutil.make_archive(output_filename, 'zip', target_dir_path)
@@ -33,10 +48,27 @@ def zip_and_stream(filenames: List[str], phone: str):
 
 
 class ImageService():
-    def __init__(self, root_dir = ""):
+    def __init__(
+        self,
+        root_dir = "",
+        max_size_in_bytes: int = IMAGE_MAX_SIZE_IN_BYTES,
+        download_timeout_in_s: float = IMAGE_DOWNLOAD_TIMEOUT_IN_S,
+        workers: int = IMAGE_DOWNLOAD_WORKERS,
+    ):
         self.root_dir = root_dir or "./"
         if not os.path.exists(self.root_dir):
             os.makedirs(self.root_dir)
+        self._logger = get_logger(self.__class__.__name__)
+        self.max_size_in_bytes = max_size_in_bytes
+        self.timeout = (IMAGE_CONNECT_TIMEOUT_IN_S, IMAGE_READ_TIMEOUT_IN_S)
+        self.download_timeout_in_s = download_timeout_in_s
+        self.workers = workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(workers, 1))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._executor = None
+        self._executor_lock = threading.Lock()
 
     def _create_filepath(self, doc_name: str, phone_number: str):
         """ where to store a file, creating user folder if not there """
@@ -46,15 +78,75 @@ class ImageService():
         return user_folder + "/" + doc_name
 
     def fetch_and_store(self, image_url: str, doc_name: str, phone_number: str):
+        """
+        stream the file at image_url to the user's folder in chunks, the stored file is only replaced once the download
+        is complete. Raises an ImageDownloadException if it fails, is larger than max_size_in_bytes or takes too long
+        """
         filepath = self._create_filepath(doc_name, phone_number)
+        start = time.monotonic()
+        size = 0
+        tmp = tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(filepath), prefix=f".{doc_name}.", suffix=".part", delete=False
+        )
+        try:
+            with tmp, self.session.get(image_url, stream=True, timeout=self.timeout) as response:
+                if response.status_code != 200:
+                    raise ImageDownloadException(f"fetching {doc_name} failed with {response.status_code}")
+                content_length = int(response.headers.get("Content-Length") or 0)
+                if content_length > self.max_size_in_bytes:
+                    raise ImageDownloadException(f"{doc_name} is larger than {self.max_size_in_bytes} bytes")
+                for chunk in response.iter_content(chunk_size=IMAGE_CHUNK_SIZE_IN_BYTES):
+                    size += len(chunk)
+                    if size > self.max_size_in_bytes:
+                        raise ImageDownloadException(f"{doc_name} is larger than {self.max_size_in_bytes} bytes")
+                    if time.monotonic() - start > self.download_timeout_in_s:
+                        raise ImageDownloadException(
+                            f"fetching {doc_name} took longer than {self.download_timeout_in_s}s"
+                        )
+                    tmp.write(chunk)
+            # urllib.request.urlretrieve(image_url, filepath)
+            os.replace(tmp.name, filepath)
+        except requests.RequestException as e:
+            os.remove(tmp.name)
+            duration = time.monotonic() - start
+            self._logger.error(f"fetching {doc_name} of {phone_number} failed after {duration:.2f}s: {str(e)}")
+            raise ImageDownloadException(f"fetching {doc_name} failed: {str(e)}")
+        except Exception:
+            os.remove(tmp.name)
+            self._logger.error(f"fetching {doc_name} of {phone_number} failed after {time.monotonic() - start:.2f}s")
+            raise
 
-        img_data = requests.get(image_url).content
-        with open(filepath, 'wb') as handler:
-            handler.write(img_data)
+        self._logger.info(f"stored {doc_name} of {phone_number} ({size} bytes) in {time.monotonic() - start:.2f}s")
+        return filepath
 
-        # urllib.request.urlretrieve(image_url, filepath)
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if not self._executor:
+                self._executor = ThreadPoolExecutor(max_workers=max(self.workers, 1), thread_name_prefix="image")
+            return self._executor
 
-        return filepath
+    def fetch_and_store_all(self, image_urls: Dict[str, str], phone_number: str) -> Dict[str, str]:
+        """
+        fetch_and_store the documents ({doc_name: image_url}) at the same time (at most workers downloads overall),
+        returns {doc_name: filepath}. Raises the first ImageDownloadException once all downloads finished
+        """
+        start = time.monotonic()
+        executor = self._get_executor()
+        futures = {
+            doc_name: executor.submit(self.fetch_and_store, image_url, doc_name, phone_number)
+            for doc_name, image_url in image_urls.items()
+        }
+        filepaths = {}
+        error = None
+        for doc_name, future in futures.items():
+            try:
+                filepaths[doc_name] = future.result()
+            except Exception as e:
+                error = error or e
+        if error:
+            raise error if isinstance(error, ImageDownloadException) else ImageDownloadException(str(error))
+        self._logger.info(f"stored {len(filepaths)} documents of {phone_number} in {time.monotonic() - start:.2f}s")
+        return filepaths
 
     def load_image(self, doc_name: str, phone_number: str):
         filepath = self._create_filepath(doc_name, phone_number)
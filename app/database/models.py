@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import (Column, DateTime, Float, ForeignKey, Integer, String,
+from sqlalchemy import (BigInteger, Column, Date, DateTime, Float, ForeignKey, Index, Integer, String,
                         Table, Text)
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
@@ -31,6 +31,13 @@ class Invoice(Base):
     value = Column(Float, nullable=True)
 
     payment_details = Column(Text, nullable=True)
+    # typed copies of the payment_details-fields we filter & aggregate by (kept in sync by the invoice service)
+    principal = Column(Float, nullable=True)
+    interest = Column(Float, nullable=True)
+    loan_id = Column(String(50), nullable=True, index=True)
+    disbursal_transaction_id = Column(String(50), nullable=True)
+    collection_date = Column(Date, nullable=True)
+    asset_id = Column(BigInteger, nullable=True, index=True) # set once the invoice's loan is tokenized
 
     # delivery_date = Column(DateTime)
 
@@ -38,10 +45,14 @@ class Invoice(Base):
     financed_on = Column(DateTime, nullable=True)
     updated_on = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     created_on = Column(DateTime, default=datetime.now)
+    last_synced_at = Column(DateTime, nullable=True, index=True) # last time the shipment status was pulled from tusker
 
     # TODO (maybe) add relationships
     # supplier = relationship("Supplier", back_populates="invoices")
 
+    # keyset pagination of the invoice list
+    __table_args__ = (Index("ix_invoice_created_on_id", "created_on", "id"),)
+
 
 class Whitelist(Base):
     """ keeps track of the receivers whose invoices can be financed for each customer """
@@ -65,6 +76,58 @@ class Purchaser(Base):
     credit_limit = Column(Integer, nullable=False)
 
 
+class CreditExposure(Base):
+    """
+    running totals of the credit that is used (financed) & requested per supplier-purchaser relationship.
+    Rows with supplier_id or purchaser_id set to EXPOSURE_TOTAL hold the aggregate over all purchasers of a supplier
+    (or all suppliers of a purchaser) respectively. Updated in the same transaction as the invoice that changes it.
+    """
+    __tablename__ = "exposure"
+    supplier_id = Column(String(50), primary_key=True)
+    purchaser_id = Column(String(50), primary_key=True)
+    used = Column(Float, nullable=False, default=0)
+    requested = Column(Float, nullable=False, default=0)
+    invoices = Column(Integer, nullable=False, default=0)
+
+
+class RepaymentLog(Base):
+    """
+    outbox of repayment log entries for the algorand logger. Entries are written in the same transaction as the
+    repayment they log and sent by a background worker (see algorand.repayment_log_worker)
+    """
+    __tablename__ = "repayment_log"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # sent along with the entry, so that the logger can drop entries it already logged
+    idempotency_key = Column(String(50), nullable=False, unique=True)
+    # the key of the batch the entry was first sent with, retries resend exactly the entries of that batch
+    batch_key = Column(String(50), nullable=True, index=True)
+    invoice_id = Column(String(50), nullable=False, index=True)
+    asset_id = Column(BigInteger, nullable=False)
+    log_data = Column(Text, nullable=False)
+    status = Column(String(50), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)
+    last_error = Column(Text, nullable=True)
+    tx_id = Column(String(100), nullable=True)
+    created_on = Column(DateTime, default=datetime.now)
+    sent_on = Column(DateTime, nullable=True)
+
+    # the worker polls for due entries
+    __table_args__ = (Index("ix_repayment_log_status_next_attempt_at", "status", "next_attempt_at"),)
+
+
+class TokenizationLeaf(Base):
+    """
+    the invoices (as FundedInvoice) a loan-asset commits to with the merkle root in its metadata,
+    in the order of the tree's leaves (see utils.merkle)
+    """
+    __tablename__ = "tokenization_leaf"
+    asset_id = Column(BigInteger, primary_key=True)
+    leaf_index = Column(Integer, primary_key=True)
+    invoice_id = Column(String(50), nullable=False, index=True)
+    leaf = Column(Text, nullable=False)
+
+
 class User(Base): #TUSKER
     """ used to look up usernames and their passwords """
     __tablename__ = "users"
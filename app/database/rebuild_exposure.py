@@ -0,0 +1,29 @@
+import argparse
+
+from database import crud
+from database.db import SessionLocal
+from utils.logger import get_logger
+
+# run this module to check the exposure ledger against the invoice table:
+# > python -m database.rebuild_exposure --verify
+# and to recompute it from scratch (e.g. after manual changes to the invoice table):
+# > python -m database.rebuild_exposure
+
+logger = get_logger(__name__)
+
+parser = argparse.ArgumentParser(description="recompute the credit exposure ledger from the invoice table")
+parser.add_argument("--verify", action="store_true", help="only report differences, do not write anything")
+args = parser.parse_args()
+
+db_session = SessionLocal()
+try:
+    mismatches = crud.exposure.verify(db_session)
+    for (supplier_id, purchaser_id), stored, expected in mismatches:
+        logger.warning(f"ledger mismatch for ({supplier_id}, {purchaser_id}): stored {stored}, expected {expected}")
+    logger.info(f"found {len(mismatches)} mismatching ledger entries")
+
+    if not args.verify:
+        crud.exposure.rebuild(db_session)
+        assert not crud.exposure.verify(db_session), "ledger still inconsistent after rebuild"
+finally:
+    db_session.close()
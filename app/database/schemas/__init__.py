@@ -2,4 +2,6 @@ from .invoice import InvoiceUpdate, InvoiceInDB, InvoiceCreate
 from .whitelist import WhitelistCreate, WhitelistInDB, WhitelistUpdate
 from .supplier import SupplierCreate, SupplierInDB, SupplierUpdate
 from .purchaser import PurchaserCreate, PurchaserUpdate
-from .kycuser import KYCUserCreate, KYCUserUpdate, KYCStatus
\ No newline at end of file
+from .kycuser import KYCUserCreate, KYCUserUpdate, KYCStatus
+from .exposure import ExposureCreate, ExposureUpdate, ExposureInDB
+from .repayment_log import RepaymentLogCreate, RepaymentLogUpdate, RepaymentLogInDB
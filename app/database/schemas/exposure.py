@@ -0,0 +1,27 @@
+# following this tutorial, schemas will denote pydantics-models
+# whereas models.py will describe the SQLAlchemy models
+from typing import Optional
+from pydantic import BaseModel
+
+
+class ExposureBase(BaseModel):
+    supplier_id: str
+    purchaser_id: str
+    used: float = 0
+    requested: float = 0
+    invoices: int = 0
+
+
+class ExposureCreate(ExposureBase):
+    pass
+
+
+class ExposureUpdate(BaseModel):
+    used: Optional[float] = None
+    requested: Optional[float] = None
+    invoices: Optional[int] = None
+
+
+class ExposureInDB(ExposureBase):
+    class Config:
+        orm_mode = True
@@ -25,6 +25,12 @@ class InvoiceCreate(InvoiceBase):
     value: float
     # TODO use pydantics' json export import helpers:
     payment_details: str
+    principal: Optional[float] = None
+    interest: Optional[float] = None
+    loan_id: Optional[str] = None
+    disbursal_transaction_id: Optional[str] = None
+    collection_date: Optional[date] = None
+    asset_id: Optional[int] = None
 
 
 # Properties stored in DB
@@ -50,6 +56,12 @@ class InvoiceUpdate(InvoiceBase):
     financed_on: Optional[datetime] = None
     verified: Optional[bool]
     payment_details: Optional[str]
+    principal: Optional[float] = None
+    interest: Optional[float] = None
+    loan_id: Optional[str] = None
+    disbursal_transaction_id: Optional[str] = None
+    collection_date: Optional[date] = None
+    asset_id: Optional[int] = None
     updated_on: datetime
 
 
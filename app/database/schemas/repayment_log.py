@@ -0,0 +1,40 @@
+# following this tutorial, schemas will denote pydantics-models
+# whereas models.py will describe the SQLAlchemy models
+import datetime as dt
+from typing import Optional
+from pydantic import BaseModel
+
+
+class RepaymentLogBase(BaseModel):
+    idempotency_key: str
+    invoice_id: str
+    asset_id: int
+    log_data: str
+    status: str
+    attempts: int = 0
+    next_attempt_at: dt.datetime
+
+
+class RepaymentLogCreate(RepaymentLogBase):
+    pass
+
+
+class RepaymentLogUpdate(BaseModel):
+    status: Optional[str] = None
+    attempts: Optional[int] = None
+    next_attempt_at: Optional[dt.datetime] = None
+    last_error: Optional[str] = None
+    tx_id: Optional[str] = None
+    sent_on: Optional[dt.datetime] = None
+
+
+class RepaymentLogInDB(RepaymentLogBase):
+    id: int
+    batch_key: Optional[str] = None
+    last_error: Optional[str] = None
+    tx_id: Optional[str] = None
+    created_on: Optional[dt.datetime] = None
+    sent_on: Optional[dt.datetime] = None
+
+    class Config:
+        orm_mode = True
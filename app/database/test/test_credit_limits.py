@@ -1,6 +1,7 @@
 import pytest
 import math
 import copy
+import threading
 from database import crud
 from sqlalchemy.orm import Session
 from database.crud.invoice_service import InvoiceService
@@ -15,6 +16,7 @@ from app.database.exceptions import (
 )
 from database.schemas import WhitelistUpdate
 from utils.common import FinanceStatus
+from test.integration.conftest import TestingSessionLocal
 
 invoice_service: InvoiceService = crud.invoice
 whitelist_service: WhitelistService = crud.whitelist
@@ -54,6 +56,21 @@ def test_credit_line_breakdown(whitelisted_invoices):
     # assert after[gurugrupa_receiver1].used == before[gurugrupa_receiver1].used + in1.value + in2.value
 
 
+def test_credit_dashboard(whitelisted_invoices):
+    invoices, db_session = whitelisted_invoices
+    supplier_id = invoices[0].supplier_id
+    supplier = crud.supplier.get(db_session, supplier_id)
+
+    dashboard = invoice_service.get_credit_dashboard(db_session)
+
+    assert dashboard[supplier_id] == invoice_service.get_credit_line_info(supplier_id, db_session)
+    summary = dashboard["tusker"][supplier.name]
+    assert summary == invoice_service.get_credit_line_summary(supplier_id, supplier.name, db_session)
+    assert summary.invoices == len(invoices)
+    assert invoice_service.get_provider_summary("tusker", db_session) == dashboard["tusker"]
+    assert invoice_service.get_provider_summary("other", db_session) == dashboard["tusker"]
+
+
 def test_credit_line_breakdown_invalid_customer_id(db_session: Session):
     assert invoice_service.get_credit_line_info("deadbeef", db_session) == {}
 
@@ -172,6 +189,150 @@ def test_purchaser_limit(whitelisted_purchasers):
         )
 
 
+def test_admit_invoice_books_requested_credit(whitelisted_purchasers):
+    supplier, p1, _, db_session = whitelisted_purchasers
+
+    # first invoice takes more than half of the relationship limit...
+    invoice_value = (p1.creditline_size / INVOICE_FUNDING_RATE) * 0.6
+    def new_order():
+        return get_new_raw_order(
+            purchaser_name=p1.name,
+            purchaser_location_id=p1.location_id,
+            supplier_id=supplier.supplier_id,
+            value=invoice_value
+        )
+    invoice_id = invoice_service.admit_invoice(new_order(), db_session)
+    invoice = invoice_service.get(db_session, invoice_id)
+    assert invoice.principal == invoice_value * INVOICE_FUNDING_RATE
+    assert invoice.finance_status == FinanceStatus.INITIAL
+
+    # ...so the requested amount must block a second one of the same size
+    with pytest.raises(AssertionError, match=r".*Relationship*" ):
+        invoice_service.admit_invoice(new_order(), db_session)
+    assert len(invoice_service.get_all_invoices(db_session)) == 1
+
+
+def test_admit_invoices_checks_running_totals(whitelisted_purchasers):
+    supplier, p1, _, db_session = whitelisted_purchasers
+
+    # two orders fit the relationship limit, the third one does not
+    invoice_value = (p1.creditline_size / INVOICE_FUNDING_RATE) * 0.4
+    orders = []
+    for i in range(3):
+        order = get_new_raw_order(
+            purchaser_name=p1.name,
+            purchaser_location_id=p1.location_id,
+            supplier_id=supplier.supplier_id,
+            value=invoice_value
+        )
+        order['ref_no'] = f"batch-{i}"
+        orders.append(order)
+    # ...and a duplicate within the batch is only admitted once
+    orders.append(copy.deepcopy(orders[0]))
+    # ...and an order of a supplier we do not know is rejected as such
+    orders.append(get_new_raw_order(
+        purchaser_name=p1.name, purchaser_location_id=p1.location_id, supplier_id="deadbeef", value=invoice_value
+    ))
+
+    report = invoice_service.admit_invoices(orders, db_session)
+
+    assert [a.admitted for a in report] == [True, True, False, False, False]
+    assert "Relationship" in report[2].reason
+    assert report[3].reason == "Invoice already exists"
+    assert report[4].reason == "Supplier deadbeef not registered"
+    assert len(invoice_service.get_all_invoices(db_session)) == 2
+    relationship = crud.exposure.get(db_session, supplier.supplier_id, p1.purchaser_id)
+    assert relationship.invoices == 2
+    assert math.isclose(relationship.requested, 2 * invoice_value * INVOICE_FUNDING_RATE)
+
+
+def test_concurrent_admissions_share_headroom(whitelisted_purchasers):
+    supplier, p1, _, db_session = whitelisted_purchasers
+
+    # each order takes more than half of the relationship limit
+    invoice_value = (p1.creditline_size / INVOICE_FUNDING_RATE) * 0.6
+    def new_order():
+        return get_new_raw_order(
+            purchaser_name=p1.name,
+            purchaser_location_id=p1.location_id,
+            supplier_id=supplier.supplier_id,
+            value=invoice_value
+        )
+    first, second = new_order(), new_order()
+    other_session = TestingSessionLocal()
+    result = {}
+
+    def admit_second():
+        try:
+            result["invoice_id"] = invoice_service.admit_invoice(second, other_session)
+        except AssertionError as e:
+            result["error"] = str(e)
+
+    thread = threading.Thread(target=admit_second)
+    try:
+        # holds the row locks until the transaction ends...
+        creditline = invoice_service._check_credit_limit(first, db_session)
+        thread.start()
+        # ...so a concurrent admission on the same creditline has to wait
+        thread.join(timeout=0.5)
+        assert thread.is_alive()
+
+        # once the first invoice is booked, the second one must see its exposure
+        invoice_service._insert_new_invoice_for_purchaser_x_supplier(
+            first, creditline.purchaser_id, creditline.supplier_id,
+            creditline.default_apr, creditline.default_tenor_in_days, db_session
+        )
+        db_session.commit()
+        thread.join(timeout=10)
+        assert not thread.is_alive()
+    finally:
+        other_session.rollback()
+        other_session.close()
+        db_session.rollback()
+
+    assert "invoice_id" not in result
+    assert "Relationship" in result["error"]
+    assert len(invoice_service.get_all_invoices(db_session)) == 1
+
+
+def test_concurrent_overlapping_batches(whitelisted_purchasers):
+    supplier, p1, p2, db_session = whitelisted_purchasers
+
+    def new_order(purchaser):
+        return get_new_raw_order(
+            purchaser_name=purchaser.name,
+            purchaser_location_id=purchaser.location_id,
+            supplier_id=supplier.supplier_id,
+            value=100
+        )
+    # both batches book on both creditlines, in opposite order
+    batches = [[new_order(p1), new_order(p2)], [new_order(p2), new_order(p1)]]
+    sessions = [TestingSessionLocal(), TestingSessionLocal()]
+    results = [None, None]
+
+    def admit(i):
+        try:
+            results[i] = invoice_service.admit_invoices(batches[i], sessions[i])
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=admit, args=(i,)) for i in range(2)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+        assert not any(thread.is_alive() for thread in threads)
+    finally:
+        for session in sessions:
+            session.rollback()
+            session.close()
+
+    assert all(isinstance(report, list) for report in results), results
+    assert all(a.admitted for report in results for a in report)
+    assert len(invoice_service.get_all_invoices(db_session)) == 4
+
+
 @pytest.mark.skip()
 def test_credit_line_summary(whitelisted_invoices):
     supplier_id = whitelisted_invoices[0].supplier_id
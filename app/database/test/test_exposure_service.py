@@ -0,0 +1,74 @@
+import math
+
+from database import crud
+from database.crud.exposure_service import ExposureService
+from database.crud.invoice_service import InvoiceService
+from database.models import CreditExposure
+from invoice.utils import invoice_to_principal
+from utils.common import FinanceStatus
+
+invoice_service: InvoiceService = crud.invoice
+exposure_service: ExposureService = crud.exposure
+
+
+def test_ledger_tracks_new_invoices(whitelisted_invoices):
+    invoices, db = whitelisted_invoices
+    supplier_id, purchaser_id = invoices[0].supplier_id, invoices[0].purchaser_id
+
+    relationship = exposure_service.get(db, supplier_id, purchaser_id)
+    assert relationship.invoices == 2
+    assert relationship.used == 0
+    assert math.isclose(relationship.requested, sum(invoice_to_principal(i) for i in invoices))
+
+    assert exposure_service.get_supplier_total(db, supplier_id).invoices == 2
+    assert exposure_service.get_purchaser_total(db, purchaser_id).invoices == 2
+    assert exposure_service.verify(db) == []
+
+
+def test_ledger_tracks_finance_status(whitelisted_invoices):
+    invoices, db = whitelisted_invoices
+    in1 = invoices[0]
+    principal = invoice_to_principal(in1)
+    before = exposure_service.get(db, in1.supplier_id, in1.purchaser_id)
+    used_before, requested_before = before.used, before.requested
+
+    invoice_service.update_invoice_payment_status(
+        db, in1.id, FinanceStatus.FINANCED, loan_id="l1", tx_id="tx1", disbursal_time=1632497776
+    )
+
+    for row in [
+        exposure_service.get(db, in1.supplier_id, in1.purchaser_id),
+        exposure_service.get_supplier_total(db, in1.supplier_id),
+        exposure_service.get_purchaser_total(db, in1.purchaser_id),
+    ]:
+        db.refresh(row)
+        assert math.isclose(row.used, used_before + principal)
+        assert math.isclose(row.requested, requested_before - principal)
+
+    assert exposure_service.verify(db) == []
+
+
+def test_ledger_tracks_removal(whitelisted_invoices):
+    invoices, db = whitelisted_invoices
+    in1 = invoices[0]
+
+    invoice_service.remove(db, id=in1.id)
+
+    relationship = exposure_service.get(db, in1.supplier_id, in1.purchaser_id)
+    db.refresh(relationship)
+    assert relationship.invoices == 1
+    assert exposure_service.verify(db) == []
+
+
+def test_rebuild_repairs_ledger(whitelisted_invoices):
+    invoices, db = whitelisted_invoices
+    in1 = invoices[0]
+
+    # corrupt the ledger
+    db.query(CreditExposure).filter(CreditExposure.supplier_id == in1.supplier_id).update({"used": 1234})
+    db.commit()
+    assert exposure_service.verify(db)
+
+    exposure_service.rebuild(db)
+
+    assert exposure_service.verify(db) == []
@@ -1,5 +1,9 @@
 import pytest
+from database.exceptions import ImageDownloadException
 from database.image_service import ImageService
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.testclient import TestClient
 import os
 import tempfile
 import shutil
@@ -27,3 +31,43 @@ def test_zip_folder(image_service: ImageService):
 
 
 
+
+def fake_image_service(root_dir: str, **kwargs) -> ImageService:
+    """ an image service whose downloads are served by a small fake app """
+    fake = FastAPI()
+
+    @fake.get("/image/{size}")
+    def _image(size: int):
+        return StreamingResponse(iter([b"x" * 1000] * (size // 1000)), media_type="image/png")
+
+    @fake.get("/missing")
+    def _missing():
+        raise HTTPException(status_code=404, detail="not found")
+
+    service = ImageService(root_dir, **kwargs)
+    service.session = TestClient(fake)
+    return service
+
+
+def test_fetch_and_store_all(image_service: ImageService):
+    service = fake_image_service(image_service.root_dir)
+    paths = service.fetch_and_store_all(
+        {"pan": "http://testserver/image/5000", "aadhaar": "http://testserver/image/300000"}, "456"
+    )
+    assert os.path.getsize(paths["pan"]) == 5000
+    assert os.path.getsize(paths["aadhaar"]) == 300000
+    # no partial downloads are left behind
+    assert sorted(os.listdir(os.path.dirname(paths["pan"]))) == ["aadhaar", "pan"]
+
+
+def test_failed_download_keeps_stored_file(image_service: ImageService):
+    service = fake_image_service(image_service.root_dir, max_size_in_bytes=10000)
+    path = service.fetch_and_store("http://testserver/image/2000", "itr", "789")
+
+    with pytest.raises(ImageDownloadException):
+        service.fetch_and_store("http://testserver/image/20000", "itr", "789")
+    with pytest.raises(ImageDownloadException):
+        service.fetch_and_store_all({"itr": "http://testserver/missing"}, "789")
+
+    assert os.path.getsize(path) == 2000
+    assert os.listdir(os.path.dirname(path)) == ["itr"]
@@ -3,8 +3,8 @@ import pytest
 import time
 from database import crud
 from database.crud.invoice_service import invoice_to_terms
-from database.models import Invoice
-from database.exceptions import DuplicateInvoiceException
+from database.models import Invoice, TokenizationLeaf
+from database.exceptions import DuplicateInvoiceException, TokenizationException, UnknownInvoiceException
 from database.test.fixtures import NEW_RAW_ORDER
 from sqlalchemy.orm import Session
 from typing import Tuple
@@ -15,6 +15,8 @@ from test.integration.conftest import TestingSessionLocal
 import datetime as dt
 from utils.constant import MAX_CREDIT, RECEIVER_ID1, GURUGRUPA_CUSTOMER_ID
 from utils.common import FinanceStatus
+from utils.merkle import canonical_json, merkle_root, verify_proof
+from algorand.algo_service import algo_service
 
 invoice_service = crud.invoice
 
@@ -146,6 +148,19 @@ def test_update_db(invoice_x_supplier):
 
     # TODO move this into its own test
     assert after.delivered_on is not None
+    assert after.last_synced_at is not None
+
+
+def test_update_db_skips_final_invoices(invoice_x_supplier):
+    invoice, db_session = invoice_x_supplier
+    assert invoice.shipment_status == "DELIVERED"
+
+    updated, errored = invoice_service.update_invoice_db(db_session)
+
+    assert not updated and not errored
+    # never tracked at tusker
+    db_session.refresh(invoice)
+    assert invoice.last_synced_at is None
 
 
 def test_update_db_stores_update_timestamp_and_delivered_on(invoice_x_supplier):
@@ -193,3 +208,114 @@ def test_update_error_reporting():
     pass
  
 
+
+
+def test_loan_term_columns_follow_payment_details(invoice_x_supplier):
+    invoice1, db_session = invoice_x_supplier
+    terms = invoice_to_terms(
+        id=invoice1.id, order_id=invoice1.order_ref, amount=invoice1.value,
+        apr=.16, tenor_in_days=90, loan_id="loanId1"
+    )
+    invoice_service.update_invoice_with_loan_terms(invoice1, terms, db_session)
+
+    after = invoice_service.get(db_session, id=invoice1.id)
+    assert after.principal == terms.principal
+    assert after.interest == terms.interest
+    assert after.loan_id == "loanId1"
+
+    invoice_service.update_invoice_payment_status(
+        db_session, invoice1.id, FinanceStatus.FINANCED, loan_id="l2", tx_id="tx1", disbursal_time=1632497776
+    )
+
+    after = invoice_service.get(db_session, id=invoice1.id)
+    payment_details = json.loads(after.payment_details)
+    assert after.loan_id == "l2"
+    assert after.disbursal_transaction_id == "tx1"
+    assert str(after.collection_date) == payment_details["collection_date"]
+    assert [i.id for i in invoice_service.get_invoices_from_loan("l2", db_session)] == [invoice1.id]
+    assert invoice_service.get_sum_of_live_invoices_from_purchaser(after.purchaser_id, db_session) == after.principal
+
+
+def test_get_invoices_page(whitelisted_invoices):
+    invoices, db_session = whitelisted_invoices
+    ids = sorted([(i.created_on, i.id) for i in invoices])
+
+    first = invoice_service.get_invoices_page(db_session, limit=1)
+    assert len(first) == 1
+    invoice, whitelist_entry, supplier = first[0]
+    assert invoice.id == ids[0][1]
+    assert whitelist_entry.purchaser_id == invoice.purchaser_id
+    assert supplier.supplier_id == invoice.supplier_id
+
+    second = invoice_service.get_invoices_page(db_session, limit=1, after=(invoice.created_on, invoice.id))
+    assert [r[0].id for r in second] == [ids[1][1]]
+    assert invoice_service.get_invoices_page(db_session, limit=1, after=ids[1]) == []
+
+    assert invoice_service.get_invoices_page(db_session, finance_status=FinanceStatus.FINANCED) == []
+    assert len(invoice_service.get_invoices_page(db_session, supplier_id=invoice.supplier_id)) == 2
+
+
+def test_check_loan_invoices(whitelisted_invoices):
+    invoices, db_session = whitelisted_invoices
+    in1, in2 = invoices
+    invoice_service.update_invoice_payment_status(
+        db_session, in1.id, FinanceStatus.FINANCED, loan_id="l1", tx_id="tx1", disbursal_time=1632497776
+    )
+
+    check = invoice_service.check_loan_invoices("l1", db_session)
+    assert check.invoices == 1
+    assert not check.tokenized and not check.not_financed and not check.without_tx_ref
+
+    # new invoices all carry the placeholder loan id
+    check = invoice_service.check_loan_invoices(in2.loan_id, db_session)
+    assert check.invoices == 1
+    assert check.not_financed == [f"{in2.order_ref}: {FinanceStatus.INITIAL.value}"]
+    assert check.without_tx_ref == [in2.order_ref]
+
+    assert invoice_service.check_loan_invoices("unknown", db_session).invoices == 0
+
+
+def test_update_invoices_tokenization(whitelisted_invoices):
+    invoices, db_session = whitelisted_invoices
+    in1, in2 = invoices
+    tokenization = {"asset_id": 1234, "transactions": {"tx1": "creation"}}
+
+    assert invoice_service.update_invoices_tokenization([in1.id, in2.id], tokenization, db_session) == 2
+
+    for invoice in [invoice_service.get(db_session, in1.id), invoice_service.get(db_session, in2.id)]:
+        assert invoice.asset_id == 1234
+        payment_details = json.loads(invoice.payment_details)
+        assert payment_details["tokenization"] == tokenization
+        # the other payment details are kept
+        assert payment_details["principal"] == invoice.principal
+
+    # tokenized invoices are not overwritten
+    other = {"asset_id": 5678, "transactions": {"tx2": "creation"}}
+    assert invoice_service.update_invoices_tokenization([in1.id], other, db_session) == 0
+    assert invoice_service.get(db_session, in1.id).asset_id == 1234
+
+
+def test_inclusion_proof(whitelisted_invoices):
+    invoices, db_session = whitelisted_invoices
+    leaves = [(i.id, canonical_json({"invoice_id": i.id, "order_id": i.order_ref, "value": i.value,
+                                     "financed_on": "", "transaction_ref": "tx"})) for i in invoices]
+    root = merkle_root([leaf for _, leaf in leaves])
+    invoice_service.update_invoices_tokenization(
+        [i.id for i in invoices], {"asset_id": 1234, "merkle_root": root, "transactions": {}}, db_session, leaves=leaves
+    )
+
+    for index, (invoice_id, leaf) in enumerate(leaves):
+        proof = algo_service.get_inclusion_proof(invoice_id, db_session)
+        assert proof.merkle_root == root
+        assert proof.leaf_index == index and proof.leaf == leaf
+        assert proof.invoice.invoice_id == invoice_id
+        assert verify_proof(proof.leaf, proof.proof, root)
+
+    with pytest.raises(UnknownInvoiceException):
+        algo_service.get_inclusion_proof("unknown", db_session)
+
+    # leaves that do not add up to the root the asset was created with give no proof
+    db_session.query(TokenizationLeaf).filter(TokenizationLeaf.leaf_index == 0).update({"leaf": "tampered"})
+    db_session.commit()
+    with pytest.raises(TokenizationException):
+        algo_service.get_inclusion_proof(leaves[-1][0], db_session)
@@ -0,0 +1,130 @@
+import datetime as dt
+import json
+
+from database import crud
+from database.crud.invoice_service import InvoiceService
+from database.models import RepaymentLog
+from database.crud.repayment_log_service import RepaymentLogService, to_batch_idempotency_key
+from utils.common import FinanceStatus, RepaymentLogStatus
+from utils.constant import REPAYMENT_LOG_MAX_ATTEMPTS
+
+invoice_service: InvoiceService = crud.invoice
+repayment_log_service: RepaymentLogService = crud.repayment_log
+
+
+def _repaid_tokenized_invoice(invoices, db):
+    in1 = invoices[0]
+    invoice_service.update_invoices_tokenization(
+        [in1.id], {"asset_id": 1234, "transactions": {"tx0": "creation"}}, db
+    )
+    invoice_service.update_invoice_payment_status(db, in1.id, FinanceStatus.REPAID, tx_id="tx1")
+    return in1
+
+
+def test_repayment_is_queued_with_status_change(whitelisted_invoices):
+    invoices, db = whitelisted_invoices
+    in1 = _repaid_tokenized_invoice(invoices, db)
+
+    assert invoice_service.get(db, in1.id).finance_status == FinanceStatus.REPAID
+    entries = repayment_log_service.get_from_invoice(db, in1.id)
+    assert len(entries) == 1
+    assert entries[0].status == RepaymentLogStatus.PENDING
+    assert entries[0].asset_id == 1234
+    assert json.loads(entries[0].log_data)["data"]["tx_ref"] == "tx1"
+
+    # the same repayment is only queued once
+    invoice_service.update_invoice_payment_status(db, in1.id, FinanceStatus.REPAID, tx_id="tx1")
+    assert len(repayment_log_service.get_from_invoice(db, in1.id)) == 1
+
+    # invoices that are not tokenized have nothing to log
+    in2 = invoices[1]
+    invoice_service.update_invoice_payment_status(db, in2.id, FinanceStatus.REPAID, tx_id="tx2")
+    assert repayment_log_service.get_from_invoice(db, in2.id) == []
+
+
+def test_sent_entry_is_stored_on_invoice(whitelisted_invoices):
+    invoices, db = whitelisted_invoices
+    in1 = _repaid_tokenized_invoice(invoices, db)
+
+    entry = repayment_log_service.claim_next(db)
+    assert entry.invoice_id == in1.id
+    repayment_log_service.mark_sent(db, [entry], "tx-log-1", {"round": 1})
+
+    db.expire_all()
+    assert repayment_log_service.get_from_invoice(db, in1.id)[0].status == RepaymentLogStatus.SENT
+    transactions = json.loads(invoice_service.get(db, in1.id).payment_details)["tokenization"]["transactions"]
+    assert transactions["tx0"] == "creation"
+    assert transactions["tx-log-1"]["tx_info"] == {"round": 1}
+    assert repayment_log_service.claim_next(db) is None
+
+
+def test_failed_entries_are_retried_with_backoff(whitelisted_invoices):
+    invoices, db = whitelisted_invoices
+    in1 = _repaid_tokenized_invoice(invoices, db)
+
+    entry = repayment_log_service.claim_next(db)
+    repayment_log_service.mark_failed(db, [entry], "logger down")
+    assert entry.status == RepaymentLogStatus.PENDING
+    assert entry.next_attempt_at > dt.datetime.utcnow()
+    # not due yet
+    assert repayment_log_service.claim_next(db) is None
+
+    for _ in range(REPAYMENT_LOG_MAX_ATTEMPTS - 1):
+        repayment_log_service.mark_failed(db, [entry], "logger down")
+    assert entry.status == RepaymentLogStatus.FAILED
+    assert repayment_log_service.get_stats(db)["failed"] == 1
+
+    assert repayment_log_service.retry_failed(db) == 1
+    assert repayment_log_service.claim_next(db).invoice_id == in1.id
+
+
+def test_repayments_are_batched_per_asset(whitelisted_invoices):
+    invoices, db = whitelisted_invoices
+    ids = [i.id for i in invoices]
+    invoice_service.update_invoices_tokenization(ids, {"asset_id": 1234, "transactions": {"tx0": "creation"}}, db)
+    for invoice_id in ids:
+        invoice_service.update_invoice_payment_status(db, invoice_id, FinanceStatus.REPAID, tx_id=f"tx-{invoice_id}")
+
+    batch = repayment_log_service.claim_next_batch(db, limit=10)
+    assert sorted(e.invoice_id for e in batch) == sorted(ids)
+    key = to_batch_idempotency_key(batch)
+    assert key == to_batch_idempotency_key(list(reversed(batch)))
+    assert all(e.batch_key == key for e in batch)
+
+    repayment_log_service.mark_sent(db, batch, "tx-batch", {"round": 2})
+
+    db.expire_all()
+    for invoice_id in ids:
+        transactions = json.loads(invoice_service.get(db, invoice_id).payment_details)["tokenization"]["transactions"]
+        assert transactions["tx-batch"]["log_data"]["data"]["tx_ref"] == f"tx-{invoice_id}"
+    assert repayment_log_service.claim_next_batch(db, limit=10) == []
+
+
+def test_retried_batch_keeps_its_entries(whitelisted_invoices):
+    invoices, db = whitelisted_invoices
+    ids = [i.id for i in invoices]
+    invoice_service.update_invoices_tokenization(ids, {"asset_id": 1234, "transactions": {"tx0": "creation"}}, db)
+    for invoice_id in ids[:-1]:
+        invoice_service.update_invoice_payment_status(db, invoice_id, FinanceStatus.REPAID, tx_id=f"tx-{invoice_id}")
+
+    batch = repayment_log_service.claim_next_batch(db, limit=10)
+    key = batch[0].batch_key
+    # the logger logged the batch, but its response got lost
+    repayment_log_service.mark_failed(db, batch, "read timeout")
+    # another repayment of the asset becomes due before the retry
+    invoice_service.update_invoice_payment_status(db, ids[-1], FinanceStatus.REPAID, tx_id="tx-late")
+    db.query(RepaymentLog).filter(RepaymentLog.batch_key == key).update(
+        {"next_attempt_at": dt.datetime.utcnow() - dt.timedelta(hours=1)}, synchronize_session=False
+    )
+    db.commit()
+
+    # the retry sends exactly the same entries under the same key...
+    retry = repayment_log_service.claim_next_batch(db, limit=10)
+    assert sorted(e.invoice_id for e in retry) == sorted(ids[:-1])
+    assert {e.batch_key for e in retry} == {key}
+    repayment_log_service.mark_sent(db, retry, "tx-batch", {"round": 3})
+
+    # ...and the new repayment goes into a batch of its own
+    late = repayment_log_service.claim_next_batch(db, limit=10)
+    assert [e.invoice_id for e in late] == [ids[-1]]
+    assert late[0].batch_key != key
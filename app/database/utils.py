@@ -6,9 +6,13 @@ import json
 
 def reset_db(db: Session, tables=[]):
     if tables:
+        # the exposure ledger, repayment log outbox and tokenization leaves belong to the invoices
+        # and must be reset with them
+        if "invoice" in tables:
+            tables = [*tables, *[t for t in ["exposure", "repayment_log", "tokenization_leaf"] if t not in tables]]
         db.execute("TRUNCATE " + ",".join(tables))
     else: 
-        db.execute("TRUNCATE invoice, users, supplier, whitelist, purchaser")
+        db.execute("TRUNCATE invoice, users, supplier, whitelist, purchaser, exposure, repayment_log, tokenization_leaf")
 
 
 def remove_none_entries(d: Dict):
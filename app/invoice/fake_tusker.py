@@ -0,0 +1,245 @@
+"""
+in-memory stand-in for the parts of the tusker api we use (order search/creation/patching and user search),
+for offline development and load testing. Orders move through their statuses on a schedule,
+requests can be slowed down and made to fail randomly.
+
+run it with e.g.
+> cd app
+> python -m invoice.fake_tusker --orders 20000 --latency 0.05 --error-rate 0.01 --port 8001
+and point the backend at it with TUSKER_BASE_URL=http://localhost:8001
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterator, List, Optional
+
+from fastapi import Body, FastAPI, Header, HTTPException
+from pydantic import BaseModel
+from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_404_NOT_FOUND, HTTP_503_SERVICE_UNAVAILABLE
+
+# tusker status codes (see tusker_client.code_to_status): placed -> picked up -> in transit -> delivered
+STATUS_SCHEDULE = [3, 6, 9, 21]
+CANCELLED = 24
+CITIES = ["Hubballi", "Dharwad", "Belagavi", "Gadag", "Haveri", "Karwar"]
+TOKEN_HEADER = Header(None, alias="LM_PA_TOKEN")
+
+
+class FakeTuskerConfig(BaseModel):
+    # every request waits latency_in_s + up to latency_jitter_in_s
+    latency_in_s: float = 0
+    latency_jitter_in_s: float = 0
+    # share of requests that fail with a 503
+    error_rate: float = 0
+    # if set, requests with another LM_PA_TOKEN are rejected
+    token: Optional[str] = None
+    # an order moves on to the next status of STATUS_SCHEDULE every step_in_s seconds (0: never)
+    step_in_s: float = 60
+    # share of orders that get cancelled instead of picked up
+    cancel_rate: float = 0
+
+
+def new_order(
+    supplier_id: str, location_id: str, value: float, receiver_name: str = "Test Receiver", city: str = "Hubballi"
+) -> Dict:
+    """ an order with the fields we read from tusker orders """
+    now = int(time.time() * 1000)
+    return {
+        "id": str(uuid.uuid4()),
+        "ref_no": f"FT{uuid.uuid4().int % 10 ** 12:012d}",
+        "status": STATUS_SCHEDULE[0],
+        "crt": now,
+        "upd": now,
+        "eta": now + 3 * 24 * 3600 * 1000,
+        "cust": {"id": supplier_id},
+        "rcvr": {
+            "id": location_id,
+            "cntct": {"name": receiver_name, "p_mob": "+91-0000000000"},
+            "addr": {"city": city},
+        },
+        "consgt": {"val_dcl": value},
+        "documents": [],
+    }
+
+
+def generate_orders(
+    n: int, supplier_ids: List[str], location_ids: List[str], seed: int = 0
+) -> Iterator[Dict]:
+    """ yields n orders spread over the given suppliers and receiver-locations """
+    rng = random.Random(seed)
+    for i in range(n):
+        location_index = rng.randrange(len(location_ids))
+        yield new_order(
+            supplier_id=rng.choice(supplier_ids),
+            location_id=location_ids[location_index],
+            value=round(rng.uniform(500, 50000), 2),
+            receiver_name=f"Receiver {location_index}",
+            city=CITIES[location_index % len(CITIES)],
+        )
+
+
+class OrderBook:
+    """
+    the orders (by id and ref_no) and receivers known to the fake.
+    The status schedule runs on clock (seconds), tests can pass one they advance themselves
+    """
+
+    def __init__(self, config: FakeTuskerConfig, seed: int = 0, clock: Callable[[], float] = time.monotonic):
+        self.config = config
+        self._clock = clock
+        self._rng = random.Random(seed)
+        self._orders: Dict[str, Dict] = {}
+        self._ids_by_ref: Dict[str, str] = {}
+        # per order: when it was added, whether it will be cancelled and an explicitly set status
+        self._meta: Dict[str, Dict] = {}
+        self._users: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def add(self, order: Dict):
+        with self._lock:
+            self._orders[order["id"]] = order
+            self._ids_by_ref[order["ref_no"]] = order["id"]
+            self._meta[order["id"]] = {
+                "added": self._clock() - self._rng.uniform(0, self.config.step_in_s),
+                "cancel": self._rng.random() < self.config.cancel_rate,
+                "status": None,
+            }
+            rcvr = order["rcvr"]
+            self._users.setdefault(rcvr["id"], {
+                "id": str(uuid.uuid5(uuid.NAMESPACE_URL, rcvr["id"])),
+                "cntct": rcvr["cntct"],
+                "loc": {"id": rcvr["id"], "addr": rcvr["addr"]},
+            })
+
+    def seed(self, orders: Iterator[Dict]) -> int:
+        count = 0
+        for order in orders:
+            self.add(order)
+            count += 1
+        return count
+
+    def _current(self, order_id: str) -> Dict:
+        """ the order with its status according to the schedule """
+        order, meta = self._orders[order_id], self._meta[order_id]
+        status = meta["status"]
+        if status is None:
+            steps = int((self._clock() - meta["added"]) / self.config.step_in_s) if self.config.step_in_s else 0
+            if meta["cancel"] and steps > 0:
+                status = CANCELLED
+            else:
+                status = STATUS_SCHEDULE[min(steps, len(STATUS_SCHEDULE) - 1)]
+        if status != order["status"]:
+            order["status"] = status
+            order["upd"] = order["s_updt"] = int(time.time() * 1000)
+        return order
+
+    def search(self, ref_nos: List[str]) -> List[Dict]:
+        with self._lock:
+            return [self._current(self._ids_by_ref[r]) for r in ref_nos if r in self._ids_by_ref]
+
+    def set_status(self, order_id: str, status: int):
+        with self._lock:
+            if order_id not in self._orders:
+                raise KeyError(order_id)
+            self._meta[order_id]["status"] = status
+
+    def ref_nos(self) -> List[str]:
+        with self._lock:
+            return list(self._ids_by_ref.keys())
+
+    def search_users(self, text: str) -> List[Dict]:
+        with self._lock:
+            return [u for u in self._users.values() if text.lower() in u["cntct"]["name"].lower()]
+
+    def __len__(self):
+        return len(self._orders)
+
+
+def create_app(config: FakeTuskerConfig, order_book: Optional[OrderBook] = None) -> FastAPI:
+    book = order_book if order_book is not None else OrderBook(config)
+    fake = FastAPI(title="fake tusker")
+    fake.state.order_book = book
+
+    async def simulate(token: Optional[str]):
+        if config.latency_in_s or config.latency_jitter_in_s:
+            await asyncio.sleep(config.latency_in_s + random.uniform(0, config.latency_jitter_in_s))
+        if config.token and token != config.token:
+            raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail="invalid token")
+        if random.random() < config.error_rate:
+            raise HTTPException(status_code=HTTP_503_SERVICE_UNAVAILABLE, detail="simulated failure")
+
+    @fake.post("/orders/search")
+    async def _search_orders(payload: Dict = Body(...), lm_pa_token: Optional[str] = TOKEN_HEADER):
+        await simulate(lm_pa_token)
+        ref_nos = payload.get("pl", {}).get("o_ref_nos", [])
+        return {"pl": {"orders": book.search(ref_nos)}}
+
+    @fake.post("/orders")
+    async def _create_order(payload: Dict = Body(...), lm_pa_token: Optional[str] = TOKEN_HEADER):
+        await simulate(lm_pa_token)
+        pl = payload.get("pl", {})
+        order = new_order(
+            supplier_id=pl.get("cust", {}).get("id"),
+            location_id=pl.get("rcvr", {}).get("id"),
+            value=pl.get("consgt", {}).get("val_dcl", 0),
+        )
+        book.add(order)
+        return {"pl": book.search([order["ref_no"]])[0]}
+
+    @fake.patch("/orders/{order_id}")
+    async def _patch_order(order_id: str, payload: Dict = Body(...), lm_pa_token: Optional[str] = TOKEN_HEADER):
+        await simulate(lm_pa_token)
+        for op in payload.get("pl", []):
+            if op.get("path") == "\\status":
+                try:
+                    book.set_status(order_id, int(op.get("val")))
+                except KeyError:
+                    raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="unknown order")
+        return {"pl": {}}
+
+    @fake.post("/search/users/suggestions")
+    async def _search_users(payload: Dict = Body(...), lm_pa_token: Optional[str] = TOKEN_HEADER):
+        await simulate(lm_pa_token)
+        return {"pl": {"users": book.search_users(payload.get("pl", {}).get("p_txt", ""))}}
+
+    @fake.get("/")
+    def _health():
+        return {"orders": len(book)}
+
+    return fake
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="run a fake tusker api on an in-memory order book")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--orders", type=int, default=10000, help="number of orders to seed")
+    parser.add_argument("--suppliers", nargs="*", default=[], help="supplier ids to seed orders for")
+    parser.add_argument("--locations", nargs="*", default=[], help="receiver location ids to seed orders for")
+    parser.add_argument("--latency", type=float, default=0, help="seconds every request takes at least")
+    parser.add_argument("--jitter", type=float, default=0, help="up to how many seconds are added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of requests failing with 503")
+    parser.add_argument("--step", type=float, default=60, help="seconds between status transitions, 0 for never")
+    parser.add_argument("--cancel-rate", type=float, default=0.05, help="share of orders that get cancelled")
+    parser.add_argument("--token", default=None, help="only accept requests with this LM_PA_TOKEN")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = FakeTuskerConfig(
+        latency_in_s=args.latency,
+        latency_jitter_in_s=args.jitter,
+        error_rate=args.error_rate,
+        token=args.token,
+        step_in_s=args.step,
+        cancel_rate=args.cancel_rate,
+    )
+    book = OrderBook(config, seed=args.seed)
+    rng = random.Random(args.seed)
+    supplier_ids = args.suppliers or [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(5)]
+    location_ids = args.locations or [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(200)]
+    seeded = book.seed(generate_orders(args.orders, supplier_ids, location_ids, seed=args.seed))
+    print(f"seeded {seeded} orders for {len(supplier_ids)} suppliers and {len(location_ids)} locations")
+    uvicorn.run(create_app(config, book), host="0.0.0.0", port=args.port)
@@ -0,0 +1,109 @@
+import datetime as dt
+import random
+import threading
+import time
+
+from sqlalchemy import text
+
+from database import crud
+from database.db import SessionLocal, engine
+from utils.common import ShipmentSyncStats
+from utils.constant import SHIPMENT_SYNC_INTERVAL_IN_S, SHIPMENT_SYNC_JITTER_IN_S, SHIPMENT_SYNC_LOCK_ID
+from utils.logger import get_logger
+
+
+class ShipmentSyncScheduler:
+    """
+    runs the shipment sync (InvoiceService.sync_shipments) in a background thread every interval + jitter seconds.
+    Each worker process has its own scheduler, a postgres advisory lock makes sure only one of them syncs at a time
+    """
+
+    def __init__(self, interval_in_s: int = SHIPMENT_SYNC_INTERVAL_IN_S, jitter_in_s: int = SHIPMENT_SYNC_JITTER_IN_S):
+        self.interval_in_s = interval_in_s
+        self.jitter_in_s = jitter_in_s
+        self.last_run = ShipmentSyncStats()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._running = threading.Lock()
+        self._thread = None
+        self._logger = get_logger(self.__class__.__name__)
+
+    def start(self):
+        if self._thread or not self.interval_in_s:
+            return
+        self._logger.info(f"Syncing shipments every {self.interval_in_s}s (+ up to {self.jitter_in_s}s)")
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._loop, name="shipment-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def trigger(self) -> bool:
+        """ run a sync as soon as possible, returns False if one is already running """
+        if not self._thread:
+            # no background thread (e.g. disabled by config), run in a one-off thread.
+            # It gets the lock from here, so that its own run does not count as already running
+            if not self._running.acquire(blocking=False):
+                return False
+            threading.Thread(target=self._sync, name="shipment-sync-once", daemon=True).start()
+            return True
+        already_running = self._running.locked()
+        self._wakeup.set()
+        return not already_running
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval_in_s + random.uniform(0, self.jitter_in_s))
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            self.run_once()
+
+    def run_once(self) -> ShipmentSyncStats:
+        """ sync once, unless another thread or worker process is already syncing """
+        if not self._running.acquire(blocking=False):
+            return self.last_run
+        return self._sync()
+
+    def _sync(self) -> ShipmentSyncStats:
+        """ run_once, for the thread holding _running (released when done) """
+        started_at = dt.datetime.utcnow()
+        start = time.monotonic()
+        stats = ShipmentSyncStats(running=True, started_at=started_at)
+        self.last_run = stats
+        # advisory locks belong to a db connection, so the whole sync has to use the same one
+        connection = engine.connect()
+        try:
+            if not connection.scalar(text("SELECT pg_try_advisory_lock(:key)"), key=SHIPMENT_SYNC_LOCK_ID):
+                self._logger.info("Shipment sync already running in another process, skipping")
+                stats = ShipmentSyncStats(started_at=started_at, skipped=True)
+            else:
+                db = SessionLocal(bind=connection)
+                try:
+                    checked, updated, errored = crud.invoice.sync_shipments(db)
+                    stats = ShipmentSyncStats(
+                        started_at=started_at, checked=checked, updated=len(updated), errored=len(errored)
+                    )
+                finally:
+                    db.close()
+                    connection.execute(text("SELECT pg_advisory_unlock(:key)"), key=SHIPMENT_SYNC_LOCK_ID)
+        except Exception as e:
+            self._logger.exception(f"Shipment sync failed: {str(e)}")
+            stats = ShipmentSyncStats(started_at=started_at, error=str(e))
+        finally:
+            connection.close()
+            stats.finished_at = dt.datetime.utcnow()
+            stats.duration_in_s = time.monotonic() - start
+            self.last_run = stats
+            self._running.release()
+
+        self._logger.info(f"Shipment sync done: {stats.dict()}")
+        return stats
+
+
+shipment_sync = ShipmentSyncScheduler()
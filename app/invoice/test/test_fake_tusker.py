@@ -0,0 +1,76 @@
+import pytest
+from database.exceptions import TuskerRequestException
+from invoice.fake_tusker import CANCELLED, FakeTuskerConfig, OrderBook, create_app, generate_orders
+from invoice.tusker_client import TuskerClient, code_to_order_status
+from starlette.testclient import TestClient
+
+SUPPLIER_ID = "fake-supplier"
+LOCATION_IDS = ["fake-location-1", "fake-location-2"]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def fake_tusker_client(config: FakeTuskerConfig, n_orders: int = 0, token: str = "token", clock=None):
+    book = OrderBook(config, clock=clock or FakeClock())
+    book.seed(generate_orders(n_orders, [SUPPLIER_ID], LOCATION_IDS))
+    client = TuskerClient(base_url="http://testserver", token=token, backoff_in_s=0)
+    # route the client's requests into the fake app
+    client.session = TestClient(create_app(config, book))
+    return client, book
+
+
+def test_track_order_pagination():
+    client, book = fake_tusker_client(FakeTuskerConfig(), n_orders=95)
+    refs = book.ref_nos()
+
+    orders = client.track_orders(refs)
+
+    assert sorted(o["ref_no"] for o in orders) == sorted(refs)
+
+
+def test_orders_move_through_status_schedule():
+    clock = FakeClock()
+    client, book = fake_tusker_client(FakeTuskerConfig(step_in_s=60), clock=clock)
+    inv_id, order_ref, status = client.create_test_order(supplier_id=SUPPLIER_ID, location_id=LOCATION_IDS[0])
+    assert code_to_order_status(status) == "PLACED_AND_VALID"
+
+    for expected in ["PICKED_BY_SHIPPER", "IN_TRANSIT", "DELIVERED", "DELIVERED"]:
+        clock.now += 60
+        assert code_to_order_status(client.track_orders([order_ref])[0]["status"]) == expected
+
+
+def test_mark_order_as():
+    client, book = fake_tusker_client(FakeTuskerConfig(step_in_s=60))
+    inv_id, order_ref, _ = client.create_test_order(supplier_id=SUPPLIER_ID, location_id=LOCATION_IDS[0])
+
+    client.mark_test_order_as(inv_id, "DELIVERED")
+
+    assert code_to_order_status(client.track_orders([order_ref])[0]["status"]) == "DELIVERED"
+
+
+def test_cancelled_orders():
+    clock = FakeClock()
+    client, book = fake_tusker_client(FakeTuskerConfig(step_in_s=60, cancel_rate=1), n_orders=3, clock=clock)
+    refs = book.ref_nos()
+    assert all(code_to_order_status(o["status"]) == "PLACED_AND_VALID" for o in client.track_orders(refs))
+
+    clock.now += 60
+
+    assert all(o["status"] == CANCELLED for o in client.track_orders(refs))
+
+
+def test_invalid_token_is_rejected():
+    client, _ = fake_tusker_client(FakeTuskerConfig(token="token"), token="invalid")
+    with pytest.raises(TuskerRequestException):
+        client.create_test_order(supplier_id=SUPPLIER_ID, location_id=LOCATION_IDS[0])
+
+
+def test_receiver_search():
+    client, _ = fake_tusker_client(FakeTuskerConfig(), n_orders=20)
+    assert client.customer_to_receiver_info("receiver")["status"] == "OK"
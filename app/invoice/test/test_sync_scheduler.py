@@ -0,0 +1,24 @@
+import threading
+
+from invoice.sync_scheduler import ShipmentSyncScheduler
+from utils.common import ShipmentSyncStats
+
+
+def test_trigger_without_background_thread():
+    scheduler = ShipmentSyncScheduler(interval_in_s=0)
+    started, finish = threading.Event(), threading.Event()
+
+    def sync():
+        started.set()
+        finish.wait(5)
+        scheduler._running.release()
+        return ShipmentSyncStats()
+
+    scheduler._sync = sync
+
+    # the run it queued itself does not count as already running...
+    assert scheduler.trigger()
+    assert started.wait(5)
+    # ...but a second trigger while it syncs does
+    assert not scheduler.trigger()
+    finish.set()
@@ -1,5 +1,11 @@
+import json
+import threading
+import time
+from typing import Dict
+
 import pytest
-from invoice.tusker_client import (TUSKER_BASE_URL, TUSKER_TOKEN, TuskerClient,
+from database.exceptions import TuskerConnectionException, TuskerRequestException, TuskerServerException
+from invoice.tusker_client import (TUSKER_BASE_URL, TUSKER_PAGE_SIZE, TUSKER_TOKEN, OrderCache, TuskerClient,
                                    order_status_to_code, tusker_client)
 from utils.constant import GURUGRUPA_CUSTOMER_ID, LOC_ID1
 
@@ -9,10 +15,16 @@ from utils.constant import GURUGRUPA_CUSTOMER_ID, LOC_ID1
 def test_init_client_invalid_credentials():
     # TODO how to raise an exception here of gracefully raise that a connection can not be established?
     tc = TuskerClient(base_url=TUSKER_BASE_URL, token="invalidToken")
-    with pytest.raises(NotImplementedError):
+    with pytest.raises(TuskerRequestException):
         tc.create_test_order()
 
 
+def test_unreachable_tusker_fails_after_retries():
+    tc = TuskerClient(base_url="http://localhost:1", token=TUSKER_TOKEN, max_retries=2, backoff_in_s=0)
+    with pytest.raises(TuskerConnectionException):
+        tc.track_orders(["someRef"])
+
+
 def test_init_client_valid_credentials():
     tc = TuskerClient(base_url=TUSKER_BASE_URL, token=TUSKER_TOKEN)
     tc.create_test_order()
@@ -25,8 +37,11 @@ def test_create_test_order():
         supplier_id=GURUGRUPA_CUSTOMER_ID, location_id=LOC_ID1
     )
 
-    raw_order = tusker_client.track_orders(reference_numbers=[order_ref], customer_id=test_id)[0]
+    reference_numbers = [order_ref]
+    raw_order = tusker_client.track_orders(reference_numbers=reference_numbers, customer_id=test_id)[0]
 
+    # the input is left untouched
+    assert reference_numbers == [order_ref]
     assert raw_order.get("id") == inv_id
     assert raw_order.get("ref_no") == order_ref
     assert raw_order.get("status") == shipment_status
@@ -53,7 +68,136 @@ def test_mark_order_as():
     assert raw_order.get("status") == order_status_to_code("DELIVERED")
 
 
-@pytest.mark.skip()
+class FakeResponse:
+    def __init__(self, status_code: int, body: Dict):
+        self.status_code = status_code
+        self.text = json.dumps(body)
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class FakeSession:
+    """
+    answers order searches with one order per ref_no, records the requested pages.
+    failures: how often the page starting with a ref_no fails with a 503 before it succeeds
+    delays: how long the page starting with a ref_no takes
+    """
+
+    def __init__(self, failures: Dict[str, int] = {}, delays: Dict[str, float] = {}):
+        self.failures = dict(failures)
+        self.delays = delays
+        self.pages = []
+        self._lock = threading.Lock()
+
+    def request(self, method, url, headers=None, timeout=None, json=None):
+        ref_nos = json["pl"]["o_ref_nos"]
+        with self._lock:
+            self.pages.append(ref_nos)
+            failing = self.failures.get(ref_nos[0], 0) > 0
+            if failing:
+                self.failures[ref_nos[0]] -= 1
+        time.sleep(self.delays.get(ref_nos[0], 0))
+        if failing:
+            return FakeResponse(503, {"error": "unavailable"})
+        return FakeResponse(200, {"pl": {"orders": [{"ref_no": r, "status": 3} for r in ref_nos]}})
+
+
+def paginated_client(session: FakeSession, max_retries: int = 2) -> TuskerClient:
+    client = TuskerClient(base_url="http://fake", token="token", max_retries=max_retries, backoff_in_s=0)
+    client.session = session
+    return client
+
+
+REF_NOS = [f"ref-{i:03d}" for i in range(5 * TUSKER_PAGE_SIZE + 3)]
+
+
 def test_track_order_pagination():
-    # make sure that if more than 10 orders are being tracked, they are properly paginated
-    pass
+    session = FakeSession()
+    orders = paginated_client(session).track_orders(REF_NOS)
+
+    assert sorted(o["ref_no"] for o in orders) == REF_NOS
+    # each page is requested once, with up to TUSKER_PAGE_SIZE ref_nos
+    assert sorted(session.pages) == [
+        REF_NOS[i:i + TUSKER_PAGE_SIZE] for i in range(0, len(REF_NOS), TUSKER_PAGE_SIZE)
+    ]
+
+
+def test_pages_are_yielded_as_they_arrive():
+    # the first page is the slowest
+    session = FakeSession(delays={REF_NOS[0]: 0.3})
+    pages = list(paginated_client(session).iter_order_pages(REF_NOS, concurrency=8))
+
+    assert pages[-1][0]["ref_no"] == REF_NOS[0]
+    assert sorted(o["ref_no"] for page in pages for o in page) == REF_NOS
+
+
+def test_remaining_pages_are_not_fetched_after_early_stop():
+    session = FakeSession(delays={r: 0.05 for r in REF_NOS})
+    pages = paginated_client(session).iter_order_pages(REF_NOS, concurrency=2)
+
+    next(pages)
+    pages.close()
+    time.sleep(0.3)
+
+    # the pages in flight finish, the queued ones are cancelled
+    assert len(session.pages) < len(REF_NOS) / TUSKER_PAGE_SIZE
+
+
+def test_page_is_retried():
+    session = FakeSession(failures={REF_NOS[TUSKER_PAGE_SIZE]: 2})
+    orders = paginated_client(session, max_retries=2).track_orders(REF_NOS)
+
+    assert sorted(o["ref_no"] for o in orders) == REF_NOS
+    assert [p[0] for p in session.pages].count(REF_NOS[TUSKER_PAGE_SIZE]) == 3
+
+
+def test_failing_page_fails_tracking():
+    session = FakeSession(failures={REF_NOS[TUSKER_PAGE_SIZE]: 3})
+    with pytest.raises(TuskerServerException):
+        paginated_client(session, max_retries=2).track_orders(REF_NOS)
+    assert [p[0] for p in session.pages].count(REF_NOS[TUSKER_PAGE_SIZE]) == 3
+
+
+def test_order_cache_evicts_least_recently_used():
+    cache = OrderCache(maxsize=2, ttl_in_s=60)
+    for ref_no in ["r1", "r2"]:
+        cache.put({"ref_no": ref_no, "status": 3})
+    # r1 is used again, so r2 gets evicted
+    assert cache.get("r1")["status"] == 3
+    cache.put({"ref_no": "r3", "status": 3})
+
+    assert cache.get("r2") is None
+    assert cache.get("r3") is not None
+    cache.invalidate("r3")
+    assert cache.get("r3") is None
+    assert cache.stats() == {"size": 1, "maxsize": 2, "hits": 2, "misses": 2}
+
+
+def test_order_cache_invalidates_by_order_id():
+    cache = OrderCache(maxsize=2, ttl_in_s=60)
+    cache.put({"ref_no": "r1", "id": "o1", "status": 3})
+    cache.put({"ref_no": "r2", "id": "o2", "status": 3})
+
+    cache.invalidate_order("o1")
+
+    assert cache.get("r1") is None
+    assert cache.get("r2") is not None
+
+
+def test_order_cache_expires_entries():
+    cache = OrderCache(maxsize=2, ttl_in_s=0)
+    cache.put({"ref_no": "r1", "status": 3})
+    assert cache.get("r1") is None
+
+
+def test_get_orders_is_served_from_cache():
+    _, order_ref, _ = tusker_client.create_test_order(supplier_id=GURUGRUPA_CUSTOMER_ID, location_id=LOC_ID1)
+    hits = tusker_client.order_cache.hits
+
+    first = tusker_client.get_orders([order_ref])[0]
+    second = tusker_client.get_orders([order_ref])[0]
+
+    assert first == second
+    assert tusker_client.order_cache.hits == hits + 1
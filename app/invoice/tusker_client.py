@@ -2,17 +2,36 @@
 import copy
 import json
 import os
-from typing import List
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional
 
 import requests
+from database.exceptions import TuskerConnectionException, TuskerRequestException, TuskerServerException
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 from utils.constant import GURUGRUPA_CUSTOMER_ID, TUSKER_DEFAULT_NEW_ORDER
+from utils.logger import get_logger
 
 load_dotenv()
 TUSKER_INVOICE_BUCKET_URL = os.getenv("TUSKER_INVOICE_BUCKET_URL")
 TUSKER_REFERER = os.getenv("TUSKER_REFERER")
 TUSKER_TOKEN = os.getenv("TUSKER_TOKEN")
 TUSKER_BASE_URL = os.getenv("TUSKER_BASE_URL")
+TUSKER_CONNECT_TIMEOUT_IN_S = float(os.getenv("TUSKER_CONNECT_TIMEOUT_IN_S", 3.05))
+TUSKER_READ_TIMEOUT_IN_S = float(os.getenv("TUSKER_READ_TIMEOUT_IN_S", 20))
+TUSKER_MAX_RETRIES = int(os.getenv("TUSKER_MAX_RETRIES", 3))
+# waits backoff, 2 * backoff, 4 * backoff, ... seconds between retries
+TUSKER_BACKOFF_IN_S = float(os.getenv("TUSKER_BACKOFF_IN_S", 0.5))
+TUSKER_POOL_SIZE = int(os.getenv("TUSKER_POOL_SIZE", 10))
+# max number of order-search pages fetched at the same time (should not exceed the pool size)
+TUSKER_CONCURRENCY = int(os.getenv("TUSKER_CONCURRENCY", 8))
+TUSKER_PAGE_SIZE = 10
+# raw orders looked up by reference number are cached for a short while (see get_orders)
+TUSKER_ORDER_CACHE_SIZE = int(os.getenv("TUSKER_ORDER_CACHE_SIZE", 1024))
+TUSKER_ORDER_CACHE_TTL_IN_S = float(os.getenv("TUSKER_ORDER_CACHE_TTL_IN_S", 60))
 
 TUSKER_USER_URL = "/search/users/suggestions"
 TUSKER_ORDER_URL = "/orders"
@@ -65,36 +84,174 @@ STATUS_ELIGIBLE_FOR_FINANCING = [
     *status_to_code["PLACED_AND_VALID"],
 ]
 
+# orders in these states will not change anymore
+FINAL_SHIPMENT_STATUS = ["DELIVERED", "CANCELLED"]
+
+
+class OrderCache:
+    """ thread-safe LRU cache of raw orders by ref_no whose entries expire after ttl_in_s """
+
+    def __init__(self, maxsize: int = TUSKER_ORDER_CACHE_SIZE, ttl_in_s: float = TUSKER_ORDER_CACHE_TTL_IN_S):
+        self.maxsize = maxsize
+        self.ttl_in_s = ttl_in_s
+        self.hits = 0
+        self.misses = 0
+        self._orders = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, ref_no: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._orders.get(ref_no)
+            if entry and time.monotonic() - entry[0] < self.ttl_in_s:
+                self._orders.move_to_end(ref_no)
+                self.hits += 1
+                # callers may modify the order
+                return copy.deepcopy(entry[1])
+            if entry:
+                del self._orders[ref_no]
+            self.misses += 1
+            return None
+
+    def put(self, raw_order: Dict):
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._orders[raw_order.get("ref_no")] = (time.monotonic(), copy.deepcopy(raw_order))
+            self._orders.move_to_end(raw_order.get("ref_no"))
+            while len(self._orders) > self.maxsize:
+                self._orders.popitem(last=False)
+
+    def invalidate(self, ref_no: str):
+        with self._lock:
+            self._orders.pop(ref_no, None)
+
+    def invalidate_order(self, order_id: str):
+        """ invalidate by the id tusker gave the order (instead of its ref_no) """
+        with self._lock:
+            for ref_no in [ref_no for ref_no, (_, order) in self._orders.items() if order.get("id") == order_id]:
+                del self._orders[ref_no]
+
+    def clear(self):
+        with self._lock:
+            self._orders.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"size": len(self._orders), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
 
 class TuskerClient:
     """ code to connect Tusker API to our DB """
 
-    def __init__(self, base_url: str, token: str, customer_id: str = GURUGRUPA_CUSTOMER_ID):
-        """ initialize client and """
-        # TODO properly add logger
-        # self.logger = get_logger(self.__class__.__name__)
+    def __init__(
+        self,
+        base_url: str,
+        token: str,
+        customer_id: str = GURUGRUPA_CUSTOMER_ID,
+        connect_timeout_in_s: float = TUSKER_CONNECT_TIMEOUT_IN_S,
+        read_timeout_in_s: float = TUSKER_READ_TIMEOUT_IN_S,
+        max_retries: int = TUSKER_MAX_RETRIES,
+        backoff_in_s: float = TUSKER_BACKOFF_IN_S,
+    ):
+        """ initialize client and its (keep-alive) connection pool """
+        self._logger = get_logger(self.__class__.__name__)
         self.headers = {"Content-Type": "application/json", "LM_PA_TOKEN": token}
         self.base_url = base_url
         # TODO get this from other API
         self.customer_id = customer_id
+        self.timeout = (connect_timeout_in_s, read_timeout_in_s)
+        self.max_retries = max_retries
+        self.backoff_in_s = backoff_in_s
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=TUSKER_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.order_cache = OrderCache()
+
+    def _request(self, method: str, path: str, retry: bool = True, **kwargs) -> Dict:
+        """
+        send a request to the tusker api and return the json-body of the response.
+        Retries connection errors, timeouts and 5xx responses with exponential backoff (unless retry is False,
+        for requests that must not be sent twice), raises Tusker*Exceptions if that does not help
+        """
+        url = self.base_url + path
+        attempts = self.max_retries + 1 if retry else 1
+        for attempt in range(attempts):
+            try:
+                response = self.session.request(method, url, headers=self.headers, timeout=self.timeout, **kwargs)
+                if response.status_code < 500:
+                    break
+                error = TuskerServerException(f"{method} {path} failed with {response.status_code}: {response.text}")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = TuskerConnectionException(f"{method} {path} failed: {str(e)}")
+
+            if attempt == attempts - 1:
+                raise error
+            wait = self.backoff_in_s * 2 ** attempt
+            self._logger.warning(f"{error.msg}, retrying in {wait}s")
+            time.sleep(wait)
+
+        if response.status_code != 200:
+            raise TuskerRequestException(f"{method} {path} failed with {response.status_code}: {response.text}")
+        return response.json()
 
     def track_orders(self, reference_numbers: List[str], customer_id=""):
         raw_orders = []
-        # TODO add some retries with https://github.com/litl/backoff
-        while reference_numbers:
-            # TODO properly understand pagination
-            to_be_fetched = reference_numbers[:10]
-            del reference_numbers[:10]
-            input = {"pl": {"o_ref_nos": to_be_fetched, "size": 10}}
-            response = requests.post(self.base_url + TUSKER_ORDER_SEARCH_URL, json=input, headers=self.headers)
-            if response.status_code == 200:
-                orders = response.json().get("pl", {}).get("orders", [])
-                raw_orders += orders
+        for orders in self.iter_order_pages(reference_numbers, customer_id):
+            raw_orders += orders
+        return raw_orders
+
+    def get_orders(self, reference_numbers: List[str]) -> List[Dict]:
+        """
+        track_orders, but serves orders looked up within the last TUSKER_ORDER_CACHE_TTL_IN_S seconds from the cache.
+        Use track_orders wherever the latest status is needed
+        """
+        raw_orders = []
+        missing = []
+        for ref_no in reference_numbers:
+            raw_order = self.order_cache.get(ref_no)
+            if raw_order:
+                raw_orders.append(raw_order)
             else:
-                # TODO implement custom exception class
-                raise NotImplementedError(str(response.json()))
+                missing.append(ref_no)
+        if missing:
+            fetched = self.track_orders(missing)
+            for raw_order in fetched:
+                self.order_cache.put(raw_order)
+            raw_orders += fetched
         return raw_orders
 
+    def iter_order_pages(
+        self, reference_numbers: List[str], customer_id="", concurrency: int = TUSKER_CONCURRENCY
+    ) -> Iterator[List[Dict]]:
+        """
+        fetch the orders for the given reference numbers, with up to concurrency pages of TUSKER_PAGE_SIZE in flight.
+        Yields each page as soon as it arrives (so not necessarily in the order of reference_numbers)
+        """
+        # TODO properly understand pagination
+        pages = [
+            reference_numbers[i:i + TUSKER_PAGE_SIZE] for i in range(0, len(reference_numbers), TUSKER_PAGE_SIZE)
+        ]
+        if len(pages) <= 1 or concurrency <= 1:
+            for page in pages:
+                yield self._fetch_order_page(page)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=min(concurrency, len(pages)), thread_name_prefix="tusker")
+        futures = [executor.submit(self._fetch_order_page, page) for page in pages]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # on errors or if the caller stops early, do not fetch the remaining pages
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _fetch_order_page(self, reference_numbers: List[str]) -> List[Dict]:
+        input = {"pl": {"o_ref_nos": reference_numbers, "size": TUSKER_PAGE_SIZE}}
+        return self._request("POST", TUSKER_ORDER_SEARCH_URL, json=input).get("pl", {}).get("orders", [])
+
     def create_test_order(self, supplier_id: str = "", location_id: str = "", value: float = 2000):
         _input = copy.deepcopy(TUSKER_DEFAULT_NEW_ORDER)
 
@@ -107,15 +264,9 @@ class TuskerClient:
 
         _input["pl"]["consgt"]["val_dcl"] = value
 
-        response = requests.post(self.base_url + TUSKER_ORDER_URL, json=_input, headers=self.headers)
-        if response.status_code == 200:
-            new_order = response.json().get("pl", {})
-            # print(new_order)
-            # return new_order
-            return new_order["id"], new_order["ref_no"], new_order["status"]
-        else:
-            # TODO implement custom exception class
-            raise NotImplementedError(str(response.json()))
+        # not idempotent, a retry could create the order twice
+        new_order = self._request("POST", TUSKER_ORDER_URL, retry=False, json=_input).get("pl", {})
+        return new_order["id"], new_order["ref_no"], new_order["status"]
 
     def mark_test_order_as(self, invoice_id, new_status: str = "DELIVERED"):
         """ change the status of a new order to """
@@ -126,20 +277,13 @@ class TuskerClient:
                 {"op": "2", "path": "\\remarks", "val": "Arboreum Testing"},
             ]
         }
-        url = f"{self.base_url}{TUSKER_ORDER_URL}/{invoice_id}"
-        print(url)
-        response = requests.patch(f"{self.base_url}{TUSKER_ORDER_URL}/{invoice_id}", json=_input, headers=self.headers)
-        if response.status_code == 200:
-            return True
-        else:
-            # TODO implement custom exception class
-            raise NotImplementedError(str(response.json()))
+        self._request("PATCH", f"{TUSKER_ORDER_URL}/{invoice_id}", json=_input)
+        self.order_cache.invalidate_order(invoice_id)
+        return True
 
     def customer_to_receiver_info(self, search_string: str):
         _input = {"pl": {"type": 4, "p_txt": search_string, "stts": [0], "s_by": "name", "s_dir": 1}}
-        response = requests.post(f"{self.base_url}/search/users/suggestions", json=_input, headers=self.headers)
-        data = response.json()
-        assert response.status_code == 200, "some error"
+        data = self._request("POST", TUSKER_USER_URL, json=_input)
         users = data.get("pl").get("users")
         # TODO if #results > 10  or pages > 1 return error
         if len(users) > 10:
@@ -165,7 +309,7 @@ class TuskerClient:
         url = f"{TUSKER_INVOICE_BUCKET_URL}/{image_link}"
         print("url", url)
 
-        return requests.get(url=url, headers={"Referer": TUSKER_REFERER}, stream=True)
+        return self.session.get(url=url, headers={"Referer": TUSKER_REFERER}, stream=True, timeout=self.timeout)
 
 
 # %%
@@ -1,5 +1,7 @@
+import base64
+import datetime as dt
 import json
-from typing import Dict
+from typing import Dict, Tuple
 
 from database.models import Invoice, Supplier, Whitelist
 from invoice.tusker_client import code_to_order_status
@@ -89,3 +91,30 @@ def db_invoice_to_frontend_info(inv: Invoice, purchaser: Whitelist, supplier: Su
 def invoice_to_principal(inv: Invoice):
     payment_details = json.loads(inv.payment_details)
     return payment_details["principal"]
+
+
+def payment_details_to_columns(payment_details: Dict):
+    """ the fields of the payment_details that are also stored as typed columns of the invoice table """
+    collection_date = payment_details.get("collection_date")
+    return {
+        "principal": payment_details.get("principal", 0),
+        "interest": payment_details.get("interest", 0),
+        "loan_id": payment_details.get("loan_id") or None,
+        "disbursal_transaction_id": payment_details.get("disbursal_transaction_id") or None,
+        "collection_date": dt.date.fromisoformat(str(collection_date)) if collection_date else None,
+        "asset_id": (payment_details.get("tokenization") or {}).get("asset_id"),
+    }
+
+
+def encode_invoice_cursor(created_on: dt.datetime, invoice_id: str) -> str:
+    """ opaque cursor for the invoice list (see InvoiceService.get_invoices_page) """
+    return base64.urlsafe_b64encode(f"{created_on.isoformat()}|{invoice_id}".encode()).decode()
+
+
+def decode_invoice_cursor(cursor: str) -> Tuple[dt.datetime, str]:
+    """ raises ValueError for invalid cursors """
+    try:
+        created_on, invoice_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+    except Exception:
+        raise ValueError(f"invalid cursor {cursor}")
+    return dt.datetime.fromisoformat(created_on), invoice_id
@@ -8,7 +8,11 @@ from routes.v1.kyc import kyc_app
 from routes.v1.supplier import supplier_app
 from routes.v1.purchaser import purchaser_app
 from routes.v1.admin import admin_app
+from routes.v1.mapping import mapping_app
 from routes.v1.test import test_app
+from invoice.sync_scheduler import shipment_sync
+from algorand.repayment_log_worker import repayment_log_worker
+from utils.allocation_pool import allocation_pool
 from starlette.status import HTTP_401_UNAUTHORIZED
 from utils.common import JWTUser
 from utils.constant import TOKEN_DESCRIPTION, FRONTEND_URL
@@ -41,15 +45,48 @@ app.include_router(
     tags=['kyc']
 )
 
+app.include_router(
+    mapping_app,
+    prefix="/v1",
+    dependencies=[Depends(log_request), Depends(RoleChecker('rc'))],
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # the cursor to the next page of GET /v1/invoice
+    expose_headers=["X-Next-Cursor"],
 )
 
 
+@app.on_event("startup")
+def start_shipment_sync():
+    shipment_sync.start()
+
+
+@app.on_event("shutdown")
+def stop_shipment_sync():
+    shipment_sync.stop()
+
+
+@app.on_event("startup")
+def start_repayment_log_worker():
+    repayment_log_worker.start()
+
+
+@app.on_event("shutdown")
+def stop_repayment_log_worker():
+    repayment_log_worker.stop()
+
+
+@app.on_event("shutdown")
+def stop_allocation_pool():
+    allocation_pool.stop()
+
+
 @app.get("/", tags=["health"])
 def read_root():
     return {"Hello": "World"}
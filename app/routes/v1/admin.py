@@ -8,6 +8,12 @@ from sqlalchemy.orm import Session
 from starlette.status import HTTP_404_NOT_FOUND, HTTP_400_BAD_REQUEST
 from database.crud.kycuser_service import (VerificationStatus, ManualVerification)
 from database.schemas import KYCStatus
+from invoice.sync_scheduler import shipment_sync
+from invoice.tusker_client import tusker_client
+from algorand.repayment_log_worker import repayment_log_worker
+from database import crud
+from utils.allocation_pool import allocation_pool
+from utils.common import AllocationStats, RepaymentLogStats, ShipmentSyncStats
 
 # ===================== routes ==========================
 admin_app = APIRouter()
@@ -66,3 +72,36 @@ def _update_verification_status(
         return kycuser_service.update_user_verification_status(phone_number, new_status=newStatus, db=db)
     except UnknownPhoneNumberException as e:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@admin_app.get("/sync/shipments", response_model=ShipmentSyncStats, description="stats of the last shipment sync")
+def _get_shipment_sync_stats():
+    return shipment_sync.last_run
+
+
+@admin_app.get("/cache/orders", description="size and hit/miss counts of the tusker order cache")
+def _get_order_cache_stats():
+    return tusker_client.order_cache.stats()
+
+
+@admin_app.get(
+    "/mapping/stats", response_model=AllocationStats, description="queue depth and solve times of the mapping optimizer"
+)
+def _get_mapping_stats():
+    return allocation_pool.get_stats()
+
+
+@admin_app.get(
+    "/outbox/repayments",
+    response_model=RepaymentLogStats,
+    description="state of the repayment log outbox and stats of the last run of its worker"
+)
+def _get_repayment_log_stats(db: Session = Depends(get_db)):
+    return RepaymentLogStats(**{**repayment_log_worker.last_run.dict(), **crud.repayment_log.get_stats(db)})
+
+
+@admin_app.post("/outbox/repayments/retry", description="retry the repayment log entries that were given up on")
+def _retry_failed_repayment_logs(db: Session = Depends(get_db)):
+    retried = crud.repayment_log.retry_failed(db)
+    repayment_log_worker.trigger()
+    return {"retried": retried}
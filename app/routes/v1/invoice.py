@@ -1,21 +1,24 @@
 import json
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from database import crud
 from database.crud.invoice_service import invoice_to_terms
+from algorand.algo_service import algo_service
 from database.exceptions import (CreditLimitException,
-                                 DuplicateInvoiceException,
+                                 DuplicateInvoiceException, TokenizationException, UnknownInvoiceException,
                                  UnknownPurchaserException, WhitelistException)
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from invoice.sync_scheduler import shipment_sync
 from invoice.tusker_client import tusker_client
-from invoice.utils import db_invoice_to_frontend_info, raw_order_to_invoice
+from invoice.utils import (db_invoice_to_frontend_info, decode_invoice_cursor, encode_invoice_cursor,
+                           raw_order_to_invoice)
 from routes.dependencies import get_db
 from sqlalchemy.orm import Session
 from starlette.status import (HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED,
                               HTTP_404_NOT_FOUND, HTTP_412_PRECONDITION_FAILED,
                               HTTP_500_INTERNAL_SERVER_ERROR)
-from utils.common import (CamelModel, CreditLineInfo, InvoiceFrontendInfo,
-                          PaymentDetails)
+from utils.common import (CamelModel, CreditLineInfo, FinanceStatus, InclusionProof, InvoiceAdmission,
+                          InvoiceFrontendInfo, PaymentDetails)
 from utils.logger import get_logger
 from utils.security import check_jwt_token_role
 
@@ -38,7 +41,7 @@ def _get_order(
     """ read raw order data from tusker """
     username, role = user_info
     print(f"{username} with role {role} wants to know about order {order_reference_number}")
-    raw_orders = tusker_client.track_orders([order_reference_number])
+    raw_orders = tusker_client.get_orders([order_reference_number])
     # check against whitelist
     if raw_orders:
         raw_order = raw_orders[0]
@@ -87,46 +90,87 @@ def _get_order(
 
 # @invoice_app.get("/invoice", response_model=List[InvoiceFrontendInfo], tags=["invoice"])
 @invoice_app.get("/invoice", tags=["invoice"])
-def _get_invoices_from_db(db: Session = Depends(get_db)):
+def _get_invoices_from_db(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    supplier_id: Optional[str] = None,
+    purchaser_id: Optional[str] = None,
+    finance_status: Optional[FinanceStatus] = None,
+    shipment_status: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
     """
-    return all invoices that we are currently tracking as they are in our db
+    return the invoices that we are currently tracking as they are in our db, oldest first, limit at a time.
+    If there are more, the X-Next-Cursor header holds the cursor to pass to get the next page
     """
-    # TODO filter by customer once we have more than one
-    invoices = invoice_service.get_all_invoices(db)
-    print("found", len(invoices))
-    return [
-        db_invoice_to_frontend_info(
-            inv=inv,
-            purchaser=whitelist_service.get(db, inv.supplier_id, inv.purchaser_id),
-            supplier=crud.supplier.get(db, inv.supplier_id),
-        )
-        for inv in invoices
-    ]
+    try:
+        after = decode_invoice_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    rows = invoice_service.get_invoices_page(
+        db,
+        limit=limit,
+        after=after,
+        supplier_id=supplier_id,
+        purchaser_id=purchaser_id,
+        finance_status=finance_status,
+        shipment_status=shipment_status,
+    )
+    if len(rows) == limit:
+        last = rows[-1][0]
+        response.headers["X-Next-Cursor"] = encode_invoice_cursor(last.created_on, last.id)
+
+    invoices = []
+    for inv, purchaser, supplier in rows:
+        if not purchaser or not supplier:
+            get_logger(__name__).error(f"Invoice {inv.id} has no whitelist entry or supplier, skipping it")
+            continue
+        invoices.append(db_invoice_to_frontend_info(inv=inv, purchaser=purchaser, supplier=supplier))
+    return invoices
 
 
 @invoice_app.post("/invoice/update", response_model=Dict, tags=["invoice"])
-def _update_invoice_db(db: Session = Depends(get_db)):
+def _update_invoice_db():
     """
-    updating the invoices in our DB with the latest data from tusker
-    then return them all
+    queue an update of the invoices in our DB with the latest data from tusker and return immediately,
+    see /admin/sync/shipments for the outcome
     """
-    updated, error = invoice_service.update_invoice_db(db)
-    if error:
-        raise HTTPException(status_code=HTTP_500_INTERNAL_SERVER_ERROR, detail=error)
-    return {"updated": updated, "error": error}
+    already_running = not shipment_sync.trigger()
+    return {"queued": True, "alreadyRunning": already_running}
+
+
+@invoice_app.post("/invoice/batch", response_model=List[InvoiceAdmission], tags=["invoice"])
+def _add_new_invoices(order_request: OrderRequest, db: Session = Depends(get_db)):
+    """
+    admit many orders at once: fetches all orders from tusker, checks them against the credit limits in order
+    and inserts the admitted ones in one transaction. Returns which orders were admitted and why others were not
+    """
+    order_refs = list(dict.fromkeys(order_request.order_ids))
+    raw_orders = {o.get('ref_no'): o for o in tusker_client.get_orders(list(order_refs))}
+
+    try:
+        admissions = invoice_service.admit_invoices([raw_orders[ref] for ref in order_refs if ref in raw_orders], db)
+    except Exception as e:
+        print(e)
+        raise HTTPException(
+            status_code=HTTP_500_INTERNAL_SERVER_ERROR, detail="Unknown Failure, please inform us:" + str(e)
+        )
+    by_ref = {a.order_ref: a for a in admissions}
+    return [by_ref.get(ref, InvoiceAdmission(order_ref=ref, reason="Unknown order id")) for ref in order_refs]
 
 
 @invoice_app.post("/invoice/{order_reference_number}", response_model=Dict, tags=["invoice"])
 def _add_new_invoice(order_reference_number: str, db: Session = Depends(get_db)):
     # get raw order
-    orders = tusker_client.track_orders([order_reference_number])
+    orders = tusker_client.get_orders([order_reference_number])
     if not orders:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Unknown order id")
     raw_order = orders[0]
 
     try:
-        invoice_service.check_credit_limit(raw_order, db)
-        invoice_service.insert_new_invoice_from_raw_order(raw_order, db)
+        invoice_service.admit_invoice(raw_order, db)
 
     except CreditLimitException:
         raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="Not enough credit")
@@ -153,11 +197,7 @@ def _add_new_invoice(order_reference_number: str, db: Session = Depends(get_db))
 
 @invoice_app.get("/credit", response_model=Dict[str, Dict[str, CreditLineInfo]])
 def _get_creditSummary(user_info: Tuple[str, str] = Depends(check_jwt_token_role), db: Session = Depends(get_db)):
-    res = {"tusker": invoice_service.get_provider_summary(provider="tusker", db=db)}
-    suppliers = crud.supplier.get_all_suppliers(db)
-    for s in suppliers:
-        res[s.supplier_id] = invoice_service.get_credit_line_info(supplier_id=s.supplier_id, db=db)
-    return res
+    return invoice_service.get_credit_dashboard(db)
 
 
 @invoice_app.post("/invoice/verification/{invoice_id}/{verified}", tags=["invoice"])
@@ -177,6 +217,17 @@ def _mark_invoice_verification_status(
     return {"status": "OK"}
 
 
+@invoice_app.get("/invoice/{invoice_id}/proof", response_model=InclusionProof, tags=["invoice"])
+def _get_invoice_inclusion_proof(invoice_id: str, db: Session = Depends(get_db)):
+    """ merkle proof that a tokenized invoice is part of its loan-asset """
+    try:
+        return algo_service.get_inclusion_proof(invoice_id, db)
+    except UnknownInvoiceException:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Unknown invoice id")
+    except TokenizationException as e:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=str(e))
+
+
 @invoice_app.get("/invoice/image/{invoice_id}")
 def _get_invoice_image_from_tusker(
     invoice_id: str, db: Session = Depends(get_db), user_info: Tuple[str, str] = Depends(check_jwt_token_role)
@@ -188,7 +239,7 @@ def _get_invoice_image_from_tusker(
         raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Unknown invoice id")
 
     # user order id of invoice to pull latest data from tusker
-    raw_order = tusker_client.track_orders([invoice.order_ref])[0]
+    raw_order = tusker_client.get_orders([invoice.order_ref])[0]
     documents = [d for d in raw_order.get("documents", []) if d.get("template_code", 0) == 1]
     if len(documents) == 0:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="No documents attached")
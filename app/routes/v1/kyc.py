@@ -1,7 +1,8 @@
 from database.crud import kyc_user as kycuser_service
 from database.crud.kycuser_service import (ImageUpdateInput,
                                            ManualVerification, UserUpdateInput)
-from database.exceptions import UnknownPhoneNumberException, NoDocumentsException, DuplicatePhoneNumberException
+from database.exceptions import (UnknownPhoneNumberException, NoDocumentsException, DuplicatePhoneNumberException,
+                                 ImageDownloadException)
 # from database.exceptions import UnknownPurchaserException
 from fastapi import APIRouter, Body, Depends, HTTPException
 from routes.dependencies import get_db
@@ -48,6 +49,8 @@ def _update_user_images(update: ImageUpdateInput = Body(...), db: Session = Depe
         return kycuser_service._update_user_image(update, db)
     except UnknownPhoneNumberException as e:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail=str(e))
+    except ImageDownloadException as e:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=str(e))
 
 
 # TODO disable this before going to production
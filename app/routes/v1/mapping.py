@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, FastAPI, HTTPException
+from fastapi import APIRouter, FastAPI, HTTPException
 from pydantic import BaseModel
-from starlette.status import HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED
-from utils.common import Mapping, MappingInput
-from utils.fullfill_loan import fulfill
+from starlette.concurrency import run_in_threadpool
+from starlette.status import HTTP_400_BAD_REQUEST
+from utils.allocation_pool import allocation_pool
+from utils.common import BatchMapping, BatchMappingInput, FulfillMethod, Mapping, MappingInput
+from utils.fullfill_loan import fulfill, fulfill_batch
 from utils.rupeecircle_client import rc_client
-from utils.security import check_jwt_token_role
 
 
 class Item(BaseModel):
@@ -31,20 +32,10 @@ mapping_app = APIRouter()
 #     return {"OKTEST"}
 
 
-# def _get_mapping(mapping_request: MappingInput, role: str = Depends(check_jwt_token)):
-@mapping_app.post(
-    "/mapping",
-    response_model=Mapping,
-    responses={HTTP_400_BAD_REQUEST: {"model": Message, "description": "Invalid Funds"}},
-    tags=["RC"],
-)
-# def _get_mapping(mapping_request: MappingInput):
-def _get_mapping(mapping_request: MappingInput, role: str = Depends(check_jwt_token_role)):
-    if role != "rc":
-        raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail=f"Wrong permissions, role {role} not authorized")
+def _get_lender_balances(investor_ids):
     # TODO
     # get lender balances from RC-api
-    lender_balances = rc_client.get_investor_balances(investor_ids=mapping_request.investor_ids)
+    lender_balances = rc_client.get_investor_balances(investor_ids=investor_ids)
     nonzero_balances = [1 for b in lender_balances.values() if b > 1000]
     if sum(nonzero_balances) < 4:
         raise HTTPException(
@@ -52,10 +43,44 @@ def _get_mapping(mapping_request: MappingInput, role: str = Depends(check_jwt_to
         )
 
     print(lender_balances)
+    return lender_balances
+
+
+# NOTE: only users with the role "rc" are let through (see main.py)
+@mapping_app.post(
+    "/mapping",
+    response_model=Mapping,
+    responses={HTTP_400_BAD_REQUEST: {"model": Message, "description": "Invalid Funds"}},
+    tags=["RC"],
+)
+async def _get_mapping(mapping_request: MappingInput):
+    lender_balances = await run_in_threadpool(_get_lender_balances, mapping_request.investor_ids)
+    try:
+        if mapping_request.method == FulfillMethod.DIFF_EV:
+            # slow: optimized in the pool's worker processes, within its time budget
+            lender_contributions, method = await allocation_pool.allocate(mapping_request.loan_amount, lender_balances)
+        else:
+            # exact, but grows with the number of investors, so off the event loop as well
+            lender_contributions, _ = await run_in_threadpool(
+                fulfill, mapping_request.loan_amount, lender_balances, method=FulfillMethod.WATER_FILLING
+            )
+            method = FulfillMethod.WATER_FILLING
+    except AssertionError as e:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=str(e))
+    return Mapping(allocations=lender_contributions, method=method)
+
+
+@mapping_app.post(
+    "/mapping/batch",
+    response_model=BatchMapping,
+    responses={HTTP_400_BAD_REQUEST: {"model": Message, "description": "Invalid Funds"}},
+    tags=["RC"],
+)
+def _get_batch_mapping(mapping_request: BatchMappingInput):
+    """ allocates all loans against one snapshot of the investor balances, in the given order """
+    lender_balances = _get_lender_balances(mapping_request.investor_ids)
     try:
-        lender_contributions, _ = fulfill(mapping_request.loan_amount, lender_balances)
+        allocations, balances = fulfill_batch(mapping_request.loan_amounts, lender_balances)
     except AssertionError as e:
         raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=str(e))
-        print(e)
-    # call fill_loan
-    return Mapping(allocations=lender_contributions)
+    return BatchMapping(allocations=allocations, balances=balances)
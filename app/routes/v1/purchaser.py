@@ -2,7 +2,7 @@ from typing import Dict, List, Optional, Tuple
 
 from database import crud
 from database.exceptions import UnknownPurchaserException
-from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
 from routes.dependencies import get_db
 from sqlalchemy.orm import Session
 from starlette.status import HTTP_400_BAD_REQUEST
@@ -32,22 +32,27 @@ class PurchaserFrontendInfo(CamelModel):
 @purchaser_app.get("/purchaser", response_model=List[PurchaserFrontendInfo], tags=["purchaser"])
 def _get_purchasers(
     # user_info: Tuple[str, str] = Depends(check_jwt_token_role),
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    name: Optional[str] = None,
     db: Session = Depends(get_db),
 ):
-    purchasers = crud.purchaser.get_all(db)
+    """ purchasers ordered by name, optionally only those whose name contains name """
+    purchasers = crud.purchaser.get_with_credit_used(db, skip=skip, limit=limit, name=name)
+    # TODO its stupid that those are stored on the whitelist entry
+    whitelist_entries = crud.whitelist.get_from_purchaser_ids(db, [p.purchaser_id for p, _ in purchasers])
     ret = []
-    for p in purchasers:
-        # TODO its stupid that those are stored on the whitelist entry
-        whitelist_entry = crud.whitelist.get_from_purchaser_id(db, p.purchaser_id)
+    for p, credit_used in purchasers:
+        whitelist_entry = whitelist_entries.get(p.purchaser_id)
         ret.append(
             PurchaserFrontendInfo(
                 id=p.purchaser_id,
                 name=p.name,
                 credit_limit=p.credit_limit,
-                credit_used=crud.invoice.get_sum_of_live_invoices_from_purchaser(p.purchaser_id, db),
-                phone=whitelist_entry.phone,
-                city=whitelist_entry.city,
-                location_id=whitelist_entry.location_id,
+                credit_used=credit_used,
+                phone=whitelist_entry.phone if whitelist_entry else "",
+                city=whitelist_entry.city if whitelist_entry else "",
+                location_id=whitelist_entry.location_id if whitelist_entry else "",
             )
         )
     return ret
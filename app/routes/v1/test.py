@@ -26,7 +26,7 @@ def mark_as_delivered(
     invoice = invoice_service.get(db, invoiceId)
     update = {"shipment_status": "DELIVERED"}
     invoice_service.update_and_log(db, invoice, update)
-    order = tusker_client.track_orders([invoice.order_ref])[0]
+    order = tusker_client.get_orders([invoice.order_ref])[0]
     # tusker api is in milliseconds
     order["s_updt"] = int(dt.datetime.utcnow().timestamp()) * 1000
     invoice_service.handle_update(db, invoice, "DELIVERED", order)
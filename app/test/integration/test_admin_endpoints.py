@@ -11,6 +11,7 @@ from database.schemas.supplier import SupplierCreate
 from database.test.conftest import (db_session, insert_base_user,  # noqa: 401
                                     reset_db)
 from database.test.fixtures import p1
+from invoice.sync_scheduler import shipment_sync
 from invoice.tusker_client import tusker_client
 from main import app
 from routes.dependencies import get_db
@@ -174,3 +175,17 @@ def test_zip_folder(db_session):
     assert res.status_code == HTTP_200_OK
 
     reset_db(db_session)
+
+
+def test_shipment_sync_stats(whitelist_and_invoices):
+    (inv_id1, order_ref1), GURUGRUPA_CUSTOMER_ID, p1, db, auth_header = whitelist_and_invoices
+
+    shipment_sync.run_once()
+
+    res = client.get("v1/admin/sync/shipments", headers=auth_header)
+    assert res.status_code == HTTP_200_OK
+    stats = res.json()
+    assert stats["checked"] == 1
+    assert not stats["skipped"] and not stats["error"]
+    db.expire_all()
+    assert invoice_service.get(db, inv_id1).last_synced_at is not None
@@ -0,0 +1,79 @@
+from test.integration.conftest import get_auth_header
+
+import pytest
+from database.models import User
+from database.test.conftest import db_session, insert_base_user, reset_db  # noqa: 401
+from main import app
+from routes.v1 import mapping
+from sqlalchemy.orm import Session
+from starlette.status import HTTP_200_OK, HTTP_401_UNAUTHORIZED
+from starlette.testclient import TestClient
+
+client = TestClient(app)
+BALANCES = {f"investor-{i}": 10000.0 * (i + 1) for i in range(10)}
+
+
+def insert_rc_user(db: Session):
+    rc_user = User(
+        email="rc@mail.india",
+        username="rc",
+        hashed_password="$2b$12$8t8LDzm.Ag68n6kv8pZoI.Oqd1x1rczNfe8QUcZwp6wnX8.dse0Ni",  # pw=tusker
+        role="rc",
+    )
+    db.add(rc_user)
+    db.commit()
+
+
+@pytest.fixture(scope="function")
+def rc_auth_header(db_session, monkeypatch):  # noqa: F811
+    reset_db(db_session)
+    insert_rc_user(db_session)
+    monkeypatch.setattr(mapping.rc_client, "get_investor_balances", lambda investor_ids: BALANCES)
+    yield get_auth_header(username="rc", password="tusker")
+    reset_db(db_session)
+    db_session.commit()
+
+
+def test_mapping_is_optimized_by_default(rc_auth_header):
+    response = client.post(
+        "/v1/mapping", json={"investorIds": list(BALANCES), "loanAmount": 100000}, headers=rc_auth_header
+    )
+
+    assert response.status_code == HTTP_200_OK, response.content
+    # (water-filling if the optimizer does not finish within the time budget)
+    assert response.json()["method"] in ["DiffEv", "WaterFilling"]
+    assert sum(response.json()["allocations"].values()) == 100000
+
+
+def test_mapping_with_water_filling(rc_auth_header):
+    response = client.post(
+        "/v1/mapping",
+        json={"investorIds": list(BALANCES), "loanAmount": 100000, "method": "WaterFilling"},
+        headers=rc_auth_header,
+    )
+
+    assert response.status_code == HTTP_200_OK, response.content
+    assert response.json()["method"] == "WaterFilling"
+    assert sum(response.json()["allocations"].values()) == 100000
+
+
+def test_batch_mapping(rc_auth_header):
+    response = client.post(
+        "/v1/mapping/batch",
+        json={"investorIds": list(BALANCES), "loanAmounts": [50000, 50000]},
+        headers=rc_auth_header,
+    )
+
+    assert response.status_code == HTTP_200_OK, response.content
+    assert [sum(a.values()) for a in response.json()["allocations"]] == [50000, 50000]
+
+
+def test_mapping_needs_rc_role(rc_auth_header, db_session):  # noqa: F811
+    insert_base_user(db_session)
+    tusker_header = get_auth_header()
+
+    response = client.post(
+        "/v1/mapping", json={"investorIds": list(BALANCES), "loanAmount": 100000}, headers=tusker_header
+    )
+
+    assert response.status_code == HTTP_401_UNAUTHORIZED
@@ -43,6 +43,19 @@ def test_get_purchasers(purchaser_x_auth_user):
     assert purchaser_from_response["creditUsed"] == 0  # TODO test taht
 
 
+def test_get_purchasers_by_name(purchaser_x_auth_user):
+    purchaser, auth_user = purchaser_x_auth_user
+
+    response = client.get("v1/purchaser", params={"name": purchaser.name[1:-1].lower(), "limit": 1}, headers=auth_user)
+    assert response.status_code == HTTP_200_OK
+    data = response.json()
+    assert [p["id"] for p in data] == [purchaser.purchaser_id]
+    assert data[0]["locationId"]
+
+    response = client.get("v1/purchaser", params={"name": "no such purchaser"}, headers=auth_user)
+    assert response.json() == []
+
+
 def test_purchaser_update(purchaser_x_auth_user, db_session):
     purchaser, auth_user = purchaser_x_auth_user
 
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from utils.common import AllocationStats, FulfillMethod
+from utils.constant import MAPPING_MAX_QUEUE, MAPPING_TIME_BUDGET_IN_S, MAPPING_WORKERS
+from utils.fullfill_loan import fulfill, fulfill_water_filling
+from utils.logger import get_logger
+
+
+def _timed(solver: Callable, loan_amount: float, lender_balances: Dict[Any, float]) -> Tuple[Any, float, float]:
+    """ runs in the worker process, returns the solver's result, when it started and how long it took """
+    started = time.time()
+    start = time.perf_counter()
+    result = solver(loan_amount, lender_balances)
+    return result, started, time.perf_counter() - start
+
+
+class AllocationPool:
+    """
+    runs the differential evolution of fulfill in worker processes, so that it does not hold the GIL of the api process.
+    The pool is started on first use. Requests wait at most time_budget_in_s for the result, else (or if max_queue
+    jobs are waiting already) they get the water-filling allocation. A job the request stopped waiting for still
+    finishes in the pool (a running process can not be interrupted) and counts towards the queue
+    """
+
+    def __init__(
+        self,
+        workers: int = MAPPING_WORKERS,
+        time_budget_in_s: float = MAPPING_TIME_BUDGET_IN_S,
+        max_queue: int = MAPPING_MAX_QUEUE,
+        solver: Callable = fulfill,
+        fallback: Callable = fulfill_water_filling,
+    ):
+        self.workers = workers
+        self.time_budget_in_s = time_budget_in_s
+        self.max_queue = max_queue
+        self.solver = solver
+        self.fallback = fallback
+        self.stats = AllocationStats(workers=workers, time_budget_in_s=time_budget_in_s)
+        self._total_solve_time_in_s = 0.0
+        self._total_wait_time_in_s = 0.0
+        self._executor = None
+        self._lock = threading.Lock()
+        self._logger = get_logger(self.__class__.__name__)
+
+    def start(self):
+        with self._lock:
+            if self._executor or not self.workers:
+                return
+            self._logger.info(f"Optimizing lender mappings with {self.workers} worker processes")
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def stop(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False)
+
+    def _restart(self):
+        """ a pool whose worker process died does not take jobs anymore, a new one is started on next use """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False)
+
+    def get_stats(self) -> AllocationStats:
+        with self._lock:
+            return self.stats.copy()
+
+    def _finished(self, submitted_at: float, future: Future):
+        with self._lock:
+            self.stats.queued -= 1
+            if future.cancelled():
+                self.stats.errors += 1
+                return
+            if future.exception() is not None:
+                if isinstance(future.exception(), AssertionError):
+                    self.stats.infeasible += 1
+                else:
+                    self.stats.errors += 1
+                return
+            _, started, solve_time_in_s = future.result()
+            self.stats.solved += 1
+            self.stats.last_solve_time_in_s = solve_time_in_s
+            self.stats.max_solve_time_in_s = max(self.stats.max_solve_time_in_s, solve_time_in_s)
+            self._total_solve_time_in_s += solve_time_in_s
+            self._total_wait_time_in_s += max(started - submitted_at, 0)
+            self.stats.avg_solve_time_in_s = self._total_solve_time_in_s / self.stats.solved
+            self.stats.avg_wait_time_in_s = self._total_wait_time_in_s / self.stats.solved
+
+    async def allocate(self, loan_amount: float, lender_balances: Dict[Any, float]) -> Tuple[Dict[Any, float], str]:
+        """
+        (contributions per lender, the FulfillMethod they come from).
+        Raises an AssertionError like fulfill if the loan can not be fulfilled
+        """
+        with self._lock:
+            overloaded = self.stats.queued >= self.max_queue
+            if overloaded:
+                self.stats.overloaded += 1
+            else:
+                self.stats.queued += 1
+        if overloaded:
+            self._logger.warning(f"{self.max_queue} mappings queued already, using water-filling")
+            return await self._fallback(loan_amount, lender_balances)
+
+        self.start()
+        # without a pool (workers=0) the optimizer runs in a thread of the default executor
+        submitted_at = time.time()
+        future = asyncio.get_event_loop().run_in_executor(
+            self._executor, _timed, self.solver, loan_amount, lender_balances
+        )
+        future.add_done_callback(lambda f: self._finished(submitted_at, f))
+        try:
+            (contributions, _), _, _ = await asyncio.wait_for(asyncio.shield(future), self.time_budget_in_s)
+            return contributions, FulfillMethod.DIFF_EV
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.stats.timed_out += 1
+            self._logger.warning(f"mapping not optimized within {self.time_budget_in_s}s, using water-filling")
+        except AssertionError:
+            raise
+        except BrokenProcessPool as e:
+            self._logger.error(f"mapping worker process died, restarting the pool: {str(e)}")
+            self._restart()
+        except Exception as e:
+            self._logger.error(f"optimizing the mapping failed, using water-filling: {str(e)}")
+        return await self._fallback(loan_amount, lender_balances)
+
+    async def _fallback(self, loan_amount: float, lender_balances: Dict[Any, float]) -> Tuple[Dict[Any, float], str]:
+        contributions, _ = await run_in_threadpool(self.fallback, loan_amount, lender_balances)
+        return contributions, FulfillMethod.WATER_FILLING
+
+
+allocation_pool = AllocationPool()
@@ -0,0 +1,218 @@
+"""
+benchmark & quality suite of the loan fulfillment solvers (utils.fullfill_loan.fulfill) on seeded synthetic lender
+balances. For every combination of method, balance distribution, number of lenders, loan size and alpha it records
+the wall time, how often the optimizer ran, the entropy of the balances left over and any violated constraints:
+
+> cd app
+> python -m utils.benchmark_fulfill --lenders 10 100 1000 10000 --alphas 0.5 2 --output fulfill_report.json
+
+Differential evolution takes seconds already for tens of lenders, it is only run up to --de-max-lenders.
+The same seed always produces the same balances, so reports of different solver versions can be compared.
+"""
+import argparse
+import json
+import platform
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from utils.fullfill_loan import MAX_LENDER_SHARE, fulfill, generalized_entropy
+
+METHODS = ["WaterFilling", "DiffEv"]
+
+
+def _uniform(rng, n):
+    return rng.uniform(1000, 100000, n)
+
+
+def _lognormal(rng, n):
+    return np.clip(rng.lognormal(10, 1, n), 1000, 10 ** 6)
+
+
+def _pareto(rng, n):
+    return np.clip(1000 * (1 + rng.pareto(1.2, n)), 1000, 10 ** 7)
+
+
+def _whales(rng, n):
+    """ mostly small lenders and a few (5%) that hold most of the funds """
+    balances = rng.uniform(1000, 20000, n)
+    whales = rng.random(n) < 0.05
+    balances[whales] = rng.uniform(500000, 2000000, np.sum(whales))
+    return balances
+
+
+DISTRIBUTIONS = {"uniform": _uniform, "lognormal": _lognormal, "pareto": _pareto, "whales": _whales}
+
+
+def random_balances(distribution: str, n: int, seed: int = 0) -> Dict[str, float]:
+    """ the same (distribution, n, seed) always gives the same balances """
+    rng = np.random.default_rng([seed, n, list(DISTRIBUTIONS).index(distribution)])
+    return {f"lender-{i}": float(round(b, 2)) for i, b in enumerate(DISTRIBUTIONS[distribution](rng, n))}
+
+
+def to_loan_amount(balances: Dict[str, float], loan_share: float) -> float:
+    """ loan_share of what the lenders could fund at most, in steps of 1000 """
+    funds = np.floor(np.array(list(balances.values())) / 1000) * 1000
+    # no lender may give more than MAX_LENDER_SHARE of the loan, so the loan can not exceed sum(min(b, share * L))
+    loan_amount = np.floor(loan_share * np.sum(funds) / 1000) * 1000
+    while loan_amount > 0 and np.sum(np.minimum(funds, MAX_LENDER_SHARE * loan_amount // 1000 * 1000)) < loan_amount:
+        loan_amount -= 1000 * max(1, int(loan_amount / 1000 * 0.05))
+    return float(max(loan_amount, 0))
+
+
+def violations(
+    loan_amount: float, balances: Dict[str, float], contributions: Dict[str, float], new_balances: Dict[str, float]
+) -> List[str]:
+    """ the constraints of fulfill the allocation does not meet (checked independently of its asserts) """
+    found = []
+    if abs(sum(contributions.values()) - loan_amount) > 1e-6:
+        found.append(f"contributions sum to {sum(contributions.values())} instead of {loan_amount}")
+    cap = np.floor(MAX_LENDER_SHARE * loan_amount / 1000) * 1000
+    for lender_id, contribution in contributions.items():
+        if contribution < 0:
+            found.append(f"{lender_id} contributes {contribution} < 0")
+        if contribution % 1000:
+            found.append(f"{lender_id} contributes {contribution}, not a multiple of 1000")
+        if contribution > cap:
+            found.append(
+                f"{lender_id} contributes {contribution}, more than {cap} ({MAX_LENDER_SHARE:.0%} of the loan)"
+            )
+        if contribution > balances[lender_id]:
+            found.append(f"{lender_id} contributes {contribution}, more than its balance {balances[lender_id]}")
+        if abs(new_balances[lender_id] - (balances[lender_id] - contribution)) > 1e-6:
+            found.append(f"new balance of {lender_id} does not match its contribution")
+    return found
+
+
+def run_case(method: str, distribution: str, n: int, loan_share: float, alpha: float, seed: int = 0) -> Dict:
+    balances = random_balances(distribution, n, seed)
+    loan_amount = to_loan_amount(balances, loan_share)
+    before = np.floor(np.array(list(balances.values())) / 1000) * 1000
+    result = {
+        "method": method,
+        "distribution": distribution,
+        "lenders": n,
+        "loanShare": loan_share,
+        "loanAmount": loan_amount,
+        "alpha": alpha,
+        "seed": seed,
+        "entropyBefore": float(generalized_entropy(before, alpha)),
+    }
+    # differential evolution draws from numpy's global random state
+    np.random.seed(seed)
+    stats = {}
+    start = time.perf_counter()
+    try:
+        contributions, new_balances = fulfill(loan_amount, balances, alpha=alpha, method=method, stats=stats)
+    except AssertionError as e:
+        result.update(wallTimeInS=time.perf_counter() - start, runs=stats.get("runs", 0), error=str(e))
+        return result
+    result["wallTimeInS"] = time.perf_counter() - start
+    result["runs"] = stats.get("runs", 0)
+    # the objective fulfill minimizes, on the balances it works with (in steps of 1000)
+    after = before - np.array([contributions[lender_id] for lender_id in balances])
+    result["entropy"] = float(generalized_entropy(after, alpha))
+    result["lendersUsed"] = int(sum(1 for c in contributions.values() if c > 0))
+    result["violations"] = violations(loan_amount, balances, contributions, new_balances)
+    return result
+
+
+def run_suite(
+    methods: List[str] = METHODS,
+    distributions: List[str] = list(DISTRIBUTIONS),
+    lenders: List[int] = [10, 100, 1000, 10000],
+    loan_shares: List[float] = [0.01, 0.1],
+    alphas: List[float] = [2],
+    seed: int = 0,
+    de_max_lenders: int = 20,
+    verbose: bool = False,
+) -> Dict:
+    results = []
+    for distribution in distributions:
+        for n in lenders:
+            for loan_share in loan_shares:
+                for alpha in alphas:
+                    for method in methods:
+                        if method == "DiffEv" and n > de_max_lenders:
+                            continue
+                        result = run_case(method, distribution, n, loan_share, alpha, seed)
+                        results.append(result)
+                        if verbose:
+                            print(_format(result))
+    return {
+        "config": {
+            "methods": methods,
+            "distributions": distributions,
+            "lenders": lenders,
+            "loanShares": loan_shares,
+            "alphas": alphas,
+            "seed": seed,
+            "deMaxLenders": de_max_lenders,
+        },
+        "environment": {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine()},
+        "results": results,
+        "summary": summarize(results),
+    }
+
+
+def summarize(results: List[Dict]) -> Dict:
+    """ per method: cases, failures, violations, total wall time and how often it found the lowest entropy """
+    best = {}
+    for r in results:
+        if "entropy" in r:
+            key = (r["distribution"], r["lenders"], r["loanShare"], r["alpha"])
+            best[key] = min(best.get(key, np.inf), r["entropy"])
+    summary = {}
+    for r in results:
+        s = summary.setdefault(
+            r["method"], {"cases": 0, "failed": 0, "violations": 0, "wallTimeInS": 0.0, "runs": 0, "best": 0}
+        )
+        s["cases"] += 1
+        s["wallTimeInS"] += r["wallTimeInS"]
+        s["runs"] += r["runs"]
+        if "error" in r:
+            s["failed"] += 1
+            continue
+        s["violations"] += len(r["violations"])
+        key = (r["distribution"], r["lenders"], r["loanShare"], r["alpha"])
+        if r["entropy"] <= best[key] + 1e-9:
+            s["best"] += 1
+    return summary
+
+
+def _format(r: Dict) -> str:
+    line = f"{r['method']:>12} {r['distribution']:>9} {r['lenders']:7d} {r['loanShare']:6.2f} {r['alpha']:5.2f}"
+    line += f" {r['wallTimeInS'] * 1000:10.1f}ms {r['runs']:3d}"
+    if "error" in r:
+        return line + f"  failed: {r['error'][:60]}"
+    return line + f" {r['entropy']:10.5f} {len(r['violations']):3d}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark the loan fulfillment solvers")
+    parser.add_argument("--methods", nargs="+", default=METHODS, choices=METHODS)
+    parser.add_argument("--distributions", nargs="+", default=list(DISTRIBUTIONS), choices=list(DISTRIBUTIONS))
+    parser.add_argument("--lenders", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument(
+        "--loan-shares", type=float, nargs="+", default=[0.01, 0.1], help="loan amounts as share of the funds"
+    )
+    parser.add_argument("--alphas", type=float, nargs="+", default=[2])
+    parser.add_argument("--de-max-lenders", type=int, default=20, help="skip differential evolution above this size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write the report as json to this file")
+    args = parser.parse_args()
+
+    print(f"{'method':>12} {'dist':>9} {'lenders':>7} {'share':>6} {'alpha':>5} {'time':>12} {'runs'} "
+          f"{'entropy':>10} {'violations'}")
+    report = run_suite(
+        args.methods, args.distributions, args.lenders, args.loan_shares, args.alphas, args.seed, args.de_max_lenders,
+        verbose=True,
+    )
+    for method, s in report["summary"].items():
+        print(f"{method}: {s['cases']} cases in {s['wallTimeInS']:.2f}s, {s['failed']} failed, "
+              f"{s['violations']} violations, lowest entropy in {s['best']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"report written to {args.output}")
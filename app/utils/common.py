@@ -44,6 +44,13 @@ class FinanceStatus(str, Enum):
     DEFAULTED = "DEFAULTED"
 
 
+class RepaymentLogStatus(str, Enum):
+    PENDING = "PENDING"
+    SENT = "SENT"
+    # gave up after REPAYMENT_LOG_MAX_ATTEMPTS, can be retried via the admin api
+    FAILED = "FAILED"
+
+
 def to_camel(string):
     return camelize(string)
 
@@ -154,13 +161,37 @@ class RealizedTerms(LoanTerms):
     collection_date: dt.datetime
 
 
+class FulfillMethod(str, Enum):
+    """ solvers of utils.fullfill_loan.fulfill """
+    # exact, takes milliseconds
+    WATER_FILLING = "WaterFilling"
+    # differential evolution, approximate and takes seconds already for tens of lenders
+    DIFF_EV = "DiffEv"
+
+
 class MappingInput(CamelModel):
     investor_ids: List[str]
     loan_amount: float
+    # the optimizer, as before. WaterFilling skips it
+    method: FulfillMethod = FulfillMethod.DIFF_EV
 
 
 class Mapping(CamelModel):
     allocations: Dict[str, float]
+    # the solver the allocation comes from, WaterFilling if DiffEv was asked for but did not finish in time
+    method: Optional[FulfillMethod] = None
+
+
+class BatchMappingInput(CamelModel):
+    investor_ids: List[str]
+    loan_amounts: List[float]
+
+
+class BatchMapping(CamelModel):
+    # one allocation per loan amount (in the same order)
+    allocations: List[Dict[str, float]]
+    # the investor balances after all loans
+    balances: Dict[str, float]
 
 
 class WhiteListEntry(BaseModel):
@@ -178,6 +209,60 @@ class CreditLineInfo(CamelModel):
     invoices: int = 0
 
 
+class InvoiceAdmission(CamelModel):
+    order_ref: str
+    admitted: bool = False
+    invoice_id: str = ""
+    reason: str = ""
+
+
+class ShipmentSyncStats(CamelModel):
+    running: bool = False
+    started_at: Optional[dt.datetime] = None
+    finished_at: Optional[dt.datetime] = None
+    duration_in_s: float = 0
+    checked: int = 0
+    updated: int = 0
+    errored: int = 0
+    # another worker process held the sync lock
+    skipped: bool = False
+    error: str = ""
+
+
+class RepaymentLogStats(CamelModel):
+    # of the last run of the repayment log worker
+    started_at: Optional[dt.datetime] = None
+    duration_in_s: float = 0
+    sent: int = 0
+    errored: int = 0
+    # sent entries are batched per asset
+    transactions: int = 0
+    error: str = ""
+    # current state of the outbox
+    pending: int = 0
+    failed: int = 0
+    oldest_pending: Optional[dt.datetime] = None
+
+
+class AllocationStats(CamelModel):
+    workers: int = 0
+    time_budget_in_s: float = 0
+    # jobs submitted to the pool and not finished yet (including those the requests stopped waiting for)
+    queued: int = 0
+    solved: int = 0
+    # DiffEv requests answered with the water-filling allocation, because the time budget ran out or the queue was full
+    timed_out: int = 0
+    overloaded: int = 0
+    # loans the lenders' balances could not fund
+    infeasible: int = 0
+    errors: int = 0
+    # of the jobs finished in the pool, solve time without the time spent waiting for a worker
+    last_solve_time_in_s: float = 0
+    avg_solve_time_in_s: float = 0
+    max_solve_time_in_s: float = 0
+    avg_wait_time_in_s: float = 0
+
+
 class FundedInvoice(BaseModel):
     invoice_id: str
     order_id: str
@@ -186,6 +271,24 @@ class FundedInvoice(BaseModel):
     transaction_ref: str
 
 
+class MerkleProofStep(BaseModel):
+    hash: str
+    # which side the sibling is on: "left" | "right"
+    position: str
+
+
+class InclusionProof(CamelModel):
+    """ proof that an invoice is part of the invoices committed to in the metadata of a loan-asset """
+    asset_id: int
+    merkle_root: str
+    invoice: FundedInvoice
+    # the leaf as it was hashed (canonical json of the invoice)
+    leaf: str
+    leaf_index: int
+    leaves: int
+    proof: List[MerkleProofStep]
+
+
 # dataFormat to hit asset-creation endpoint
 class NewLoanParams(BaseModel):
     loan_id: str
@@ -195,7 +298,8 @@ class NewLoanParams(BaseModel):
     tenor_in_days: int
     start_date: int
     compounding_frequency: str  # "daily | monthly | weekly"
-    # this is a stringified object of loan-specific data: for the tusker model it will be: List[FundedInvoice]
+    # this is a stringified object of loan-specific data: for the tusker model it is the merkle root over
+    # the List[FundedInvoice] (see AlgoService.tokenize_loan)
     data: str
 
 
@@ -98,6 +98,27 @@ INVOICE_FUNDING_RATE = float(os.getenv("INVOICE_FUNDING_RATE"))
 MAX_TUSKER_CREDIT = int(os.getenv("MAX_TUSKER_CREDIT"))
 
 MAX_CREDIT = 50000
+# number of invoices tracked at tusker per round of the shipment sync
+SYNC_CHUNK_SIZE = 100
+# the shipment sync runs in the background every interval (+ up to jitter) seconds, 0 disables it
+SHIPMENT_SYNC_INTERVAL_IN_S = int(os.getenv("SHIPMENT_SYNC_INTERVAL_IN_S", 15 * 60))
+SHIPMENT_SYNC_JITTER_IN_S = int(os.getenv("SHIPMENT_SYNC_JITTER_IN_S", 60))
+# postgres advisory lock key, so that only one worker process syncs at a time
+SHIPMENT_SYNC_LOCK_ID = 31415
+# repayment log entries are sent to the algorand logger by a background worker every interval seconds, 0 disables it
+REPAYMENT_LOG_INTERVAL_IN_S = int(os.getenv("REPAYMENT_LOG_INTERVAL_IN_S", 30))
+REPAYMENT_LOG_BATCH_SIZE = 50
+# failed entries are retried after backoff, 2 * backoff, 4 * backoff, ... (at most max backoff) seconds
+# and marked as FAILED after max attempts
+REPAYMENT_LOG_BACKOFF_IN_S = 10
+REPAYMENT_LOG_MAX_BACKOFF_IN_S = 60 * 60
+REPAYMENT_LOG_MAX_ATTEMPTS = 20
+# mappings (unless requested with the WaterFilling method) are optimized in a pool of worker processes
+# (0 to optimize in a thread),
+# requests that take longer than the time budget or find max queue jobs waiting get the water-filling allocation
+MAPPING_WORKERS = int(os.getenv("MAPPING_WORKERS", 2))
+MAPPING_TIME_BUDGET_IN_S = float(os.getenv("MAPPING_TIME_BUDGET_IN_S", 10))
+MAPPING_MAX_QUEUE = int(os.getenv("MAPPING_MAX_QUEUE", 8))
 
 TUSKER_DEFAULT_NEW_ORDER = {
     "pl": {
@@ -1,10 +1,38 @@
 import copy
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 from iteround import saferound
 from scipy import optimize
 
+# share of a loan a single lender may contribute at most
+MAX_LENDER_SHARE = 0.25
+
+
+def entropy_beta(N: int, alpha: float) -> float:
+    """ normalization of the generalized entropy of N balances """
+    if alpha == 0:
+        return -1 / N
+    elif alpha == 1:
+        return 1 / N
+    else:
+        return 1 / (N * alpha * (alpha - 1))
+
+
+def generalized_entropy(y: np.ndarray, alpha: float = 2, weights: Optional[np.ndarray] = None) -> float:
+    """ generalized entropy of the (remaining) lender balances y, the objective fulfill minimizes """
+    mu = np.mean(y)
+    vals = (y / mu) ** (alpha) - 1
+    if weights is None:
+        return entropy_beta(len(y), alpha) * np.sum(vals)
+    return entropy_beta(len(y), alpha) * np.sum(vals / weights)
+
+
+def upper_bounds(loan_amount: float, lender_balances: np.ndarray) -> np.ndarray:
+    """ a lender contributes at most MAX_LENDER_SHARE of the loan and at most its balance (in steps of 1000) """
+    ub = np.full(len(lender_balances), np.floor(MAX_LENDER_SHARE * loan_amount / 1000) * 1000)
+    return np.minimum(ub, np.floor(np.array(lender_balances) / 1000) * 1000)
+
 
 def fulfill(
     loan_amount: float,
@@ -12,8 +40,9 @@ def fulfill(
     alpha: float = 2,
     weights: Any = None,
     penalty_coef: float = 1,
-    # method: str = 'DiffEv',
+    method: str = "DiffEv",
     num_CPUs: int = 1,
+    stats: Optional[Dict] = None,
 ):
 
     """
@@ -25,10 +54,12 @@ def fulfill(
     weights ({Lender_ID : Weight (float)}): weight attached to different lenders
     penalty_coef (float): if sum constraint is part of the objective function (>1)
                           or linear constraint on the topological manifold (0)
-    (ignore) method (str): can be "DiffEv" for differential-evolution (only one that works in reasonable time),
-                         "SHGO" for simplicial homology global optimization,
-                         "BFGS" for localized gradient-descent (Broyden–Fletcher–Goldfarb–Shanno algorithm)
+    method (str): can be "DiffEv" for differential-evolution
+                  or "WaterFilling" for the exact solution by bisection (see fulfill_water_filling, much faster)
+                  (formerly also "SHGO" for simplicial homology global optimization,
+                  "BFGS" for localized gradient-descent (Broyden–Fletcher–Goldfarb–Shanno algorithm))
     num_CPUs (int): optimization can run faster using more CPUs (default 1)
+    stats (dict): if given, "runs" is set to how often the optimizer ran (it reruns if rounding broke a constraint)
 
     Returns:
     --------
@@ -40,6 +71,11 @@ def fulfill(
     For any future editor essential asserts to check constraints must be included
     """
 
+    if method == "WaterFilling":
+        if stats is not None:
+            stats["runs"] = 1
+        return fulfill_water_filling(loan_amount, lender_balances, alpha=alpha, weights=weights)
+
     # parse dicts
     lender_IDs = list(lender_balances.keys())
     lender_balances = list(lender_balances.values())
@@ -56,25 +92,9 @@ def fulfill(
         assert len(weights) == N, "weights must be same length as lender_balances"
         weights = [weights[id] for id in lender_IDs]
 
-    # precalculate some values for below function
-    if alpha == 0:
-        beta = -1 / N
-    elif alpha == 1:
-        beta = 1 / N
-    else:
-        beta = 1 / (N * alpha * (alpha - 1))
-
     # objective function to minimize (x=contribution)
-    def generalized_entropy(x):
-
-        y = lender_balances - x
-        mu = np.mean(y)
-        vals = (y / mu) ** (alpha) - 1
-
-        if weights is None:
-            entropy = beta * np.sum(vals)
-        else:
-            entropy = beta * np.sum(vals / weights)
+    def objective(x):
+        entropy = generalized_entropy(lender_balances - x, alpha, weights)
 
         # penalty
         penalty = (np.sum(x) - (loan_amount - np.sum(contributions))) ** 2
@@ -94,21 +114,22 @@ def fulfill(
 
     # optimizer
     def run_opt(lb, ub, penalty_coef, num_CPUs):
+        if stats is not None:
+            stats["runs"] = stats.get("runs", 0) + 1
 
         if penalty_coef == 0:
             rslt = optimize.differential_evolution(
-                generalized_entropy, bounds=list(zip(lb, ub)), constraints=(lc), workers=num_CPUs
+                objective, bounds=list(zip(lb, ub)), constraints=(lc), workers=num_CPUs
             )
         else:
-            rslt = optimize.differential_evolution(generalized_entropy, bounds=list(zip(lb, ub)), workers=num_CPUs)
+            rslt = optimize.differential_evolution(objective, bounds=list(zip(lb, ub)), workers=num_CPUs)
 
         contributions = np.array(saferound(rslt.x / 1000, 0)) * 1000
 
         return contributions, rslt
 
     # set upper bound (25%)
-    ub = np.full(N, np.floor(0.25 * loan_amount / 1000) * 1000)
-    ub = np.minimum(ub, lender_balances)
+    ub = upper_bounds(loan_amount, lender_balances)
     # set lower bound (0)
     lb = np.full(N, 0)
 
@@ -135,6 +156,13 @@ def fulfill(
     if np.sum(contributions) != loan_amount:
         contributions, _ = run_opt(lb, ub2, 0, num_CPUs)
 
+    return _to_result(loan_amount, lender_IDs, lender_balances_original, contributions, ub)
+
+
+def _to_result(loan_amount: float, lender_IDs, lender_balances_original: np.ndarray, contributions, ub):
+    """ check the constraints and return the (contributions, new lender balances)-dicts """
+    N = len(lender_IDs)
+
     # assertions
     assert np.sum(contributions) == loan_amount, (
         "Contributions equal " + str(np.sum(contributions)) + ", different from loan amount"
@@ -151,6 +179,90 @@ def fulfill(
     return contributions, lender_balances
 
 
+def fulfill_water_filling(
+    loan_amount: float,
+    lender_balances: Dict[Any, float],
+    alpha: float = 2,
+    weights: Any = None,
+):
+    """
+    same allocation problem as fulfill, solved exactly instead of with differential evolution.
+
+    The mean of the remaining balances y = b - x is fixed by the sum constraint, so the objective is separable
+    (and convex for alpha >= 0). Its KKT conditions give y_i = t * s_i, with s_i = w_i ** (1 / (alpha - 1)) (1 without
+    weights), wherever a lender's bounds are not active: x_i(t) = clip(b_i - t * s_i, 0, ub_i).
+    sum(x(t)) decreases in t, so the level t that makes it equal the loan amount is found by bisection
+    ("water-filling" the balances down to a common level). Contributions are rounded to 1000 like in fulfill.
+
+    Parameters and returns as fulfill
+    """
+    # parse dicts
+    lender_IDs = list(lender_balances.keys())
+    lender_balances_original = np.array(list(lender_balances.values()), dtype=float)
+    N = len(lender_IDs)
+    balances = np.floor(lender_balances_original / 1000) * 1000
+
+    # assertions
+    assert alpha >= 0, "alpha must be non-negative"
+    if weights is not None:
+        assert len(weights) == N, "weights must be same length as lender_balances"
+        weights = np.array([weights[id] for id in lender_IDs], dtype=float)
+        assert np.all(weights > 0), "weights must be positive"
+
+    ub = upper_bounds(loan_amount, balances)
+    # check if request is even possible
+    if np.sum(ub) < loan_amount:
+        raise AssertionError(f"Loan Amount {loan_amount}> funds available{np.sum(ub)}")
+
+    x = water_fill(loan_amount, balances, ub, alpha, weights)
+    contributions = np.array(saferound(list(x / 1000), 0)) * 1000
+
+    return _to_result(loan_amount, lender_IDs, lender_balances_original, contributions, ub)
+
+
+def water_fill(
+    loan_amount: float,
+    balances: np.ndarray,
+    ub: np.ndarray,
+    alpha: float = 2,
+    weights: Optional[np.ndarray] = None,
+    max_iter: int = 200,
+) -> np.ndarray:
+    """ the (unrounded) contributions 0 <= x <= ub with sum(x) == loan_amount that minimize the entropy of b - x """
+    if weights is not None and alpha == 1:
+        # the objective is linear in x: fill up the lenders with the smallest weights first
+        order = np.argsort(weights, kind="stable")
+        before = np.cumsum(ub[order]) - ub[order]
+        x = np.zeros(len(balances))
+        x[order] = np.clip(loan_amount - before, 0, ub[order])
+        return x
+
+    # (without weights the optimum does not depend on alpha, for alpha == 0 any feasible x is optimal)
+    if weights is None or alpha == 0:
+        scale = np.ones(len(balances))
+    else:
+        scale = weights ** (1 / (alpha - 1))
+
+    def contributions(level: float) -> np.ndarray:
+        return np.clip(balances - level * scale, 0, ub)
+
+    low, high = 0.0, float(np.max(balances / scale))
+    for _ in range(max_iter):
+        level = (low + high) / 2
+        if level in (low, high):
+            break
+        if np.sum(contributions(level)) > loan_amount:
+            low = level
+        else:
+            high = level
+    x = contributions(high)
+    # hand the rounding error of the level to the lenders that are not at a bound
+    free = (x > 0) & (x < ub)
+    if np.any(free):
+        x[free] += (loan_amount - np.sum(x)) / np.sum(free)
+    return np.clip(x, 0, ub)
+
+
 # if method=="SHGO":
 #     penalty_coef = max(1.0,penalty_coef)
 #     rslt = optimize.shgo(generalized_entropy,
@@ -176,3 +288,69 @@ def fulfill(
 #                                                 ub),
 #                             bounds=optimize.Bounds(lb,ub),
 #                             constraints=[constraints])
+
+
+def fulfill_batch(
+    loan_amounts: List[float],
+    lender_balances: Dict[Any, float],
+    alpha: float = 2,
+    weights: Any = None,
+    method: str = "WaterFilling",
+    num_CPUs: int = 1,
+) -> Tuple[List[Dict[Any, float]], Dict[Any, float]]:
+    """
+    allocates several loans (in the given order) against one snapshot of the lender balances,
+    every loan sees the balances the loans before it left over.
+
+    Parameters:
+    -----------
+    loan_amounts ([float]): the loans to fulfill, each with at most 25% per lender
+    lender_balances, alpha, weights, method: as in fulfill
+    num_CPUs (int): processes differential evolution uses per loan (method "DiffEv"), the water-filling solver
+                    is vectorized over the lenders and runs in-process
+
+    Returns:
+    --------
+    contributions ([{Lender_ID : Contribution (float)}]): the contributions per lender, one dict per loan
+    lender_balances ({Lender_ID : Balance (float)}): the lender balances after all loans
+
+    raises an AssertionError (naming the loan) if any of the loans can not be fulfilled, nothing is allocated then
+    """
+    if method == "DiffEv":
+        allocations = []
+        balances = dict(lender_balances)
+        for i, loan_amount in enumerate(loan_amounts):
+            try:
+                contributions, balances = fulfill(loan_amount, balances, alpha, weights, num_CPUs=num_CPUs)
+            except AssertionError as e:
+                raise AssertionError(f"Loan {i}: {e}")
+            allocations.append(contributions)
+        return allocations, balances
+
+    # parse dicts
+    lender_IDs = list(lender_balances.keys())
+    lender_balances_original = np.array(list(lender_balances.values()), dtype=float)
+    # the balances left over after every contribution, contributions are multiples of 1000
+    remaining = copy.deepcopy(lender_balances_original)
+
+    # assertions
+    assert alpha >= 0, "alpha must be non-negative"
+    if weights is not None:
+        assert len(weights) == len(lender_IDs), "weights must be same length as lender_balances"
+        weights = np.array([weights[id] for id in lender_IDs], dtype=float)
+        assert np.all(weights > 0), "weights must be positive"
+
+    allocations = []
+    for i, loan_amount in enumerate(loan_amounts):
+        balances = np.floor(remaining / 1000) * 1000
+        ub = upper_bounds(loan_amount, balances)
+        if np.sum(ub) < loan_amount:
+            raise AssertionError(f"Loan {i}: Loan Amount {loan_amount}> funds available{np.sum(ub)}")
+
+        x = water_fill(loan_amount, balances, ub, alpha, weights)
+        contributions = np.array(saferound(list(x / 1000), 0)) * 1000
+        contributions, _ = _to_result(loan_amount, lender_IDs, remaining, contributions, ub)
+        allocations.append(contributions)
+        remaining = remaining - np.array(list(contributions.values()))
+
+    return allocations, dict(zip(lender_IDs, remaining))
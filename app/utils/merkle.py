@@ -0,0 +1,68 @@
+"""
+binary sha256 merkle tree over a list of leaves (strings), used to commit to the invoices of a tokenized loan.
+Leaves and inner nodes are hashed with different prefixes (0x00 / 0x01), so that an inner node can not be passed
+off as a leaf. A node without a sibling is moved up a level as is (it is not paired with itself).
+
+To verify a proof: h = sha256(0x00 + leaf), then for each step h = sha256(0x01 + step.hash + h) if the step's
+position is "left", else sha256(0x01 + h + step.hash). The leaf belongs to the tree if h equals the root.
+"""
+import hashlib
+import json
+from typing import Dict, List
+
+from utils.common import MerkleProofStep
+
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def canonical_json(data: Dict) -> str:
+    """ the same data always serializes to the same leaf """
+    return json.dumps(data, sort_keys=True, separators=(",", ":"))
+
+
+def hash_leaf(leaf: str) -> bytes:
+    return hashlib.sha256(LEAF_PREFIX + leaf.encode()).digest()
+
+
+def hash_node(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+def _levels(leaves: List[str]) -> List[List[bytes]]:
+    """ all levels of the tree, from the leaf hashes up to the root """
+    if not leaves:
+        raise ValueError("can not build a merkle tree without leaves")
+    levels = [[hash_leaf(leaf) for leaf in leaves]]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        levels.append([
+            hash_node(level[i], level[i + 1]) if i + 1 < len(level) else level[i] for i in range(0, len(level), 2)
+        ])
+    return levels
+
+
+def merkle_root(leaves: List[str]) -> str:
+    """ hex-encoded root of the tree over the leaves (in the given order) """
+    return _levels(leaves)[-1][0].hex()
+
+
+def merkle_proof(leaves: List[str], index: int) -> List[MerkleProofStep]:
+    """ the sibling hashes from the leaf at index up to the root """
+    if not 0 <= index < len(leaves):
+        raise IndexError(f"no leaf {index} in a tree of {len(leaves)} leaves")
+    proof = []
+    for level in _levels(leaves)[:-1]:
+        sibling = index + 1 if index % 2 == 0 else index - 1
+        if sibling < len(level):
+            proof.append(MerkleProofStep(hash=level[sibling].hex(), position="right" if index % 2 == 0 else "left"))
+        index //= 2
+    return proof
+
+
+def verify_proof(leaf: str, proof: List[MerkleProofStep], root: str) -> bool:
+    node = hash_leaf(leaf)
+    for step in proof:
+        sibling = bytes.fromhex(step.hash)
+        node = hash_node(sibling, node) if step.position == "left" else hash_node(node, sibling)
+    return node.hex() == root
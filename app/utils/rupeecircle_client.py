@@ -1,9 +1,23 @@
 # %%
-# import os
 # from random import randint
-from typing import List
+import os
+import threading
+import time
+from typing import Dict, List, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from starlette.status import HTTP_401_UNAUTHORIZED
+from utils.logger import get_logger
+
+RUPEE_CIRCLE_CONNECT_TIMEOUT_IN_S = float(os.getenv("RUPEE_CIRCLE_CONNECT_TIMEOUT_IN_S", 3.05))
+RUPEE_CIRCLE_READ_TIMEOUT_IN_S = float(os.getenv("RUPEE_CIRCLE_READ_TIMEOUT_IN_S", 20))
+RUPEE_CIRCLE_POOL_SIZE = int(os.getenv("RUPEE_CIRCLE_POOL_SIZE", 10))
+# used if the login response does not say how long the access token is valid
+RUPEE_CIRCLE_TOKEN_TTL_IN_S = float(os.getenv("RUPEE_CIRCLE_TOKEN_TTL_IN_S", 3600))
+RUPEE_CIRCLE_TOKEN_REFRESH_MARGIN_IN_S = float(os.getenv("RUPEE_CIRCLE_TOKEN_REFRESH_MARGIN_IN_S", 60))
+# investor balances are reused for this long (0 to always ask the wallet api)
+RUPEE_CIRCLE_BALANCE_CACHE_TTL_IN_S = float(os.getenv("RUPEE_CIRCLE_BALANCE_CACHE_TTL_IN_S", 0))
 
 
 class FormData:
@@ -36,39 +50,121 @@ def result_to_balance(res):
         return 0
 
 
+class BalanceCache:
+    """ thread-safe cache of investor balances whose entries expire after ttl_in_s (a ttl of 0 disables it) """
+
+    def __init__(self, ttl_in_s: float = RUPEE_CIRCLE_BALANCE_CACHE_TTL_IN_S):
+        self.ttl_in_s = ttl_in_s
+        self.hits = 0
+        self.misses = 0
+        self._balances: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, investor_ids: List[str]) -> Dict[str, float]:
+        """ the cached balances of the given investors (investors without a fresh balance are left out) """
+        now = time.monotonic()
+        balances = {}
+        with self._lock:
+            for investor_id in investor_ids:
+                entry = self._balances.get(investor_id)
+                if entry and now - entry[0] < self.ttl_in_s:
+                    balances[investor_id] = entry[1]
+            self.hits += len(balances)
+            self.misses += len(investor_ids) - len(balances)
+        return balances
+
+    def put(self, balances: Dict[str, float]):
+        if not self.ttl_in_s:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for investor_id, balance in balances.items():
+                self._balances[investor_id] = (now, balance)
+
+    def clear(self):
+        with self._lock:
+            self._balances.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"size": len(self._balances), "ttlInS": self.ttl_in_s, "hits": self.hits, "misses": self.misses}
+
+
 class RupeeCircleClient:
-    def __init__(self, base_url: str, email: str, password: str):
-        """ initialize client and get access token from RC-sandbox """
+    def __init__(
+        self,
+        base_url: str,
+        email: str,
+        password: str,
+        balance_cache_ttl_in_s: float = RUPEE_CIRCLE_BALANCE_CACHE_TTL_IN_S,
+        connect_timeout_in_s: float = RUPEE_CIRCLE_CONNECT_TIMEOUT_IN_S,
+        read_timeout_in_s: float = RUPEE_CIRCLE_READ_TIMEOUT_IN_S,
+    ):
+        """ initialize client and its (keep-alive) connection pool, the access token is fetched on first use """
+        self._logger = get_logger(self.__class__.__name__)
         self.base_url = base_url
         self.password = password
         self.username = email
         self.headers = {}
-        self.refresh_token()
+        self.timeout = (connect_timeout_in_s, read_timeout_in_s)
+        # monotonic time after which the access token is refreshed
+        self.token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=RUPEE_CIRCLE_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.balance_cache = BalanceCache(balance_cache_ttl_in_s)
 
     def refresh_token(self):
         form = FormData()
         form.append("email", self.username)
         form.append("password", self.password)
         auth_url = self.base_url + "/api/v1/clientSecretDetails"
-        response = requests.request("POST", auth_url, data=form.data)
+        response = self.session.request("POST", auth_url, data=form.data, timeout=self.timeout)
         data = response.json()
         if not data["flag"]:
             raise AttributeError(data["message"])  # TODO define exception
         else:
-            access_token = response.json()["data"]["token_details"]["access_token"]
+            token_details = data["data"]["token_details"]
+            access_token = token_details["access_token"]
             self.headers = {"Authorization": f"Bearer {access_token}"}
+            expires_in_s = float(token_details.get("expires_in") or RUPEE_CIRCLE_TOKEN_TTL_IN_S)
+            # refresh a little before the token actually expires
+            self.token_expires_at = time.monotonic() + max(expires_in_s - RUPEE_CIRCLE_TOKEN_REFRESH_MARGIN_IN_S, 0)
+
+    def ensure_token(self, force: bool = False):
+        """ log in if there is no access token yet or it (almost) expired, or always if force is set """
+        with self._token_lock:
+            if force or not self.headers or time.monotonic() >= self.token_expires_at:
+                self.refresh_token()
+
+    def _post(self, path: str, payload: Dict) -> Dict:
+        """ post to the rc-api with the cached access token, logs in again once if the token is rejected """
+        self.ensure_token()
+        url = self.base_url + path
+        response = self.session.request("POST", url, json=payload, headers=self.headers, timeout=self.timeout)
+        if response.status_code == HTTP_401_UNAUTHORIZED:
+            self._logger.info("access token rejected, logging in again")
+            self.ensure_token(force=True)
+            response = self.session.request("POST", url, json=payload, headers=self.headers, timeout=self.timeout)
+        return response.json()
 
     def get_investor_balances(self, investor_ids: List[str]):
-        self.refresh_token()
-        url = self.base_url + "/api/v1/walletbalance"
+        """ the available balance per investor, balances fetched within the last balance_cache ttl are reused """
+        balances = self.balance_cache.get(investor_ids)
+        missing = [investor_id for investor_id in investor_ids if investor_id not in balances]
+        if not missing:
+            return balances
+
         # response = requests.request("POST", url, json={"investor_id": investor_ids})
-        response = requests.request("POST", url, json={"investor_id": investor_ids}, headers=self.headers)
-        data = response.json()
+        data = self._post("/api/v1/walletbalance", {"investor_id": missing})
         if not data["flag"]:
             raise AttributeError(data["message"])  # TODO define exception
         else:
-            balances = response.json()["data"]
-            return {inv: result_to_balance(val) for inv, val in balances.items()}
+            fetched = {inv: result_to_balance(val) for inv, val in data["data"].items()}
+            self.balance_cache.put(fetched)
+            return {**balances, **fetched}
 
 
 rc_client = RupeeCircleClient(
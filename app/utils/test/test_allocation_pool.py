@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+import pytest
+
+from utils.allocation_pool import AllocationPool
+from utils.common import FulfillMethod
+from utils.fullfill_loan import fulfill_water_filling
+
+BALANCES = {f"lender-{i}": 10000.0 * (i + 1) for i in range(10)}
+
+
+def slow_solver(loan_amount, lender_balances):
+    time.sleep(1)
+    return fulfill_water_filling(loan_amount, lender_balances)
+
+
+def test_allocation_is_solved_in_worker_process():
+    pool = AllocationPool(workers=1, time_budget_in_s=30, solver=fulfill_water_filling)
+    try:
+        contributions, method = asyncio.run(pool.allocate(100000.0, BALANCES))
+    finally:
+        pool.stop()
+
+    assert method == FulfillMethod.DIFF_EV
+    assert sum(contributions.values()) == 100000.0
+    stats = pool.get_stats()
+    assert stats.solved == 1 and stats.queued == 0
+
+
+def test_water_filling_is_used_when_budget_runs_out():
+    pool = AllocationPool(workers=0, time_budget_in_s=0.01, solver=slow_solver)
+
+    contributions, method = asyncio.run(pool.allocate(100000.0, BALANCES))
+
+    assert method == FulfillMethod.WATER_FILLING
+    assert contributions == fulfill_water_filling(100000.0, BALANCES)[0]
+    assert pool.get_stats().timed_out == 1
+
+
+def test_water_filling_is_used_when_queue_is_full():
+    pool = AllocationPool(workers=0, max_queue=0, solver=slow_solver)
+
+    _, method = asyncio.run(pool.allocate(100000.0, BALANCES))
+
+    assert method == FulfillMethod.WATER_FILLING
+    assert pool.get_stats().overloaded == 1
+
+
+def test_infeasible_loan_raises():
+    pool = AllocationPool(workers=0, solver=fulfill_water_filling)
+    with pytest.raises(AssertionError):
+        asyncio.run(pool.allocate(10 ** 7, BALANCES))
@@ -0,0 +1,38 @@
+import itertools
+
+import numpy as np
+
+from utils.benchmark_fulfill import DISTRIBUTIONS, random_balances, run_case, run_suite
+from utils.fullfill_loan import generalized_entropy, upper_bounds
+
+
+def test_balances_are_reproducible():
+    for distribution in DISTRIBUTIONS:
+        assert random_balances(distribution, 50, seed=1) == random_balances(distribution, 50, seed=1)
+        assert random_balances(distribution, 50, seed=1) != random_balances(distribution, 50, seed=2)
+
+
+def test_water_filling_meets_constraints_on_all_distributions():
+    report = run_suite(methods=["WaterFilling"], lenders=[10, 100, 1000], loan_shares=[0.01, 0.1, 0.5])
+
+    summary = report["summary"]["WaterFilling"]
+    assert summary["cases"] == len(DISTRIBUTIONS) * 3 * 3
+    assert summary["failed"] == 0
+    assert summary["violations"] == 0
+
+
+def test_water_filling_finds_the_optimum():
+    # all allocations in steps of 1000 of small (non-zero) loans
+    for distribution, seed in [("uniform", 4), ("lognormal", 4), ("pareto", 2), ("whales", 4)]:
+        result = run_case("WaterFilling", distribution, 6, 0.1, 2, seed=seed)
+        assert result["loanAmount"] > 0
+        balances = random_balances(distribution, 6, seed=seed)
+        b = np.floor(np.array(list(balances.values())) / 1000) * 1000
+        ub = upper_bounds(result["loanAmount"], b)
+
+        best = np.inf
+        steps = [range(0, int(u) + 1000, 1000) for u in ub]
+        for x in itertools.product(*steps):
+            if sum(x) == result["loanAmount"]:
+                best = min(best, generalized_entropy(b - np.array(x), 2))
+        assert result["entropy"] <= best + 1e-9
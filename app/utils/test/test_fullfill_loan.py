@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from utils.fullfill_loan import fulfill, fulfill_batch, fulfill_water_filling, generalized_entropy, upper_bounds
+
+
+def _balances(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return {f"lender-{i}": float(b) for i, b in enumerate(rng.uniform(1000, 50000, n))}
+
+
+def _check_constraints(loan_amount, balances, contributions, new_balances):
+    ub = dict(zip(balances, upper_bounds(loan_amount, np.array(list(balances.values())))))
+    assert sum(contributions.values()) == loan_amount
+    for lender_id, contribution in contributions.items():
+        assert contribution % 1000 == 0
+        assert 0 <= contribution <= ub[lender_id]
+        assert new_balances[lender_id] == balances[lender_id] - contribution
+
+
+@pytest.mark.parametrize("n", [10, 100, 1000, 10000])
+def test_water_filling_meets_constraints(n):
+    balances = _balances(n)
+    loan_amount = 100000.0
+    contributions, new_balances = fulfill(loan_amount, balances, method="WaterFilling")
+    _check_constraints(loan_amount, balances, contributions, new_balances)
+
+
+def test_water_filling_levels_balances():
+    balances = {"a": 10000.0, "b": 20000.0, "c": 30000.0, "d": 40000.0, "e": 50000.0}
+    contributions, new_balances = fulfill_water_filling(40000.0, balances)
+
+    # the richest lenders are drawn down to a common level, but none gives more than 25% of the loan
+    assert contributions == {"a": 0, "b": 10000, "c": 10000, "d": 10000, "e": 10000}
+    _check_constraints(40000.0, balances, contributions, new_balances)
+
+
+def test_water_filling_is_optimal():
+    balances = _balances(30, seed=1)
+    loan_amount = 150000.0
+    contributions, new_balances = fulfill_water_filling(loan_amount, balances, alpha=3)
+    ub = upper_bounds(loan_amount, np.array(list(balances.values())))
+    x = np.array(list(contributions.values()))
+    b = np.floor(np.array(list(balances.values())) / 1000) * 1000
+    best = generalized_entropy(b - x, 3)
+
+    # moving 1000 from one lender to another never improves the (rounded) allocation
+    for i in range(len(x)):
+        for j in range(len(x)):
+            if i != j and x[i] >= 1000 and x[j] + 1000 <= ub[j]:
+                y = x.copy()
+                y[i] -= 1000
+                y[j] += 1000
+                assert generalized_entropy(b - y, 3) >= best - 1e-9
+
+
+def test_water_filling_with_weights():
+    balances = _balances(20, seed=2)
+    loan_amount = 60000.0
+    for alpha in [0, 1, 2, 3]:
+        weights = {lender_id: 1 + i % 3 for i, lender_id in enumerate(balances)}
+        contributions, new_balances = fulfill_water_filling(loan_amount, balances, alpha=alpha, weights=weights)
+        _check_constraints(loan_amount, balances, contributions, new_balances)
+
+
+def test_infeasible_loan_raises():
+    balances = {"a": 10000.0, "b": 10000.0}
+    with pytest.raises(AssertionError):
+        fulfill_water_filling(100000.0, balances)
+
+
+def test_batch_carries_balances_forward():
+    balances = _balances(50, seed=3)
+    loan_amounts = [40000.0, 100000.0, 25000.0]
+    allocations, new_balances = fulfill_batch(loan_amounts, balances)
+
+    # the same as fulfilling the loans one after the other
+    remaining = dict(balances)
+    for loan_amount, contributions in zip(loan_amounts, allocations):
+        expected, next_remaining = fulfill_water_filling(loan_amount, remaining)
+        _check_constraints(loan_amount, remaining, contributions, next_remaining)
+        assert contributions == expected
+        remaining = next_remaining
+    assert new_balances == remaining
+
+
+def test_batch_fails_as_a_whole():
+    balances = {"a": 25000.0, "b": 25000.0, "c": 25000.0, "d": 25000.0}
+    with pytest.raises(AssertionError, match="Loan 2"):
+        fulfill_batch([40000.0, 40000.0, 40000.0], balances)
@@ -0,0 +1,36 @@
+import pytest
+
+from utils.merkle import canonical_json, hash_leaf, merkle_proof, merkle_root, verify_proof
+
+
+def test_every_leaf_has_a_valid_proof():
+    for n in [1, 2, 3, 5, 8, 13]:
+        leaves = [canonical_json({"invoice_id": f"in{i}", "value": i * 100.5}) for i in range(n)]
+        root = merkle_root(leaves)
+        for index, leaf in enumerate(leaves):
+            assert verify_proof(leaf, merkle_proof(leaves, index), root)
+
+
+def test_proof_fails_for_other_leaves_and_roots():
+    leaves = [f"leaf {i}" for i in range(5)]
+    root = merkle_root(leaves)
+    proof = merkle_proof(leaves, 2)
+
+    assert not verify_proof("leaf 3", proof, root)
+    assert not verify_proof("leaf 2", proof, merkle_root(leaves[:4]))
+
+
+def test_root_is_a_single_leaf_hash():
+    assert merkle_root(["only"]) == hash_leaf("only").hex()
+    assert merkle_proof(["only"], 0) == []
+
+
+def test_canonical_json_does_not_depend_on_key_order():
+    assert canonical_json({"a": 1, "b": 2}) == canonical_json({"b": 2, "a": 1})
+
+
+def test_invalid_trees():
+    with pytest.raises(ValueError):
+        merkle_root([])
+    with pytest.raises(IndexError):
+        merkle_proof(["a", "b"], 2)
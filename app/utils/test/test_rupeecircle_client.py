@@ -0,0 +1,58 @@
+from fastapi import Body, FastAPI, Header, HTTPException
+from starlette.testclient import TestClient
+
+from utils.rupeecircle_client import RupeeCircleClient
+
+
+def fake_rc_client(balance_cache_ttl_in_s: float = 0):
+    """ a client routed into a minimal fake of the rc-api, that counts logins and balance requests """
+    fake = FastAPI()
+    fake.state.calls = {"logins": 0, "balances": 0}
+    fake.state.token = "token-0"
+
+    @fake.post("/api/v1/clientSecretDetails")
+    def _login():
+        fake.state.calls["logins"] += 1
+        fake.state.token = f"token-{fake.state.calls['logins']}"
+        return {"flag": True, "data": {"token_details": {"access_token": fake.state.token, "expires_in": 3600}}}
+
+    @fake.post("/api/v1/walletbalance")
+    def _balances(payload: dict = Body(...), authorization: str = Header(None)):
+        if authorization != f"Bearer {fake.state.token}":
+            raise HTTPException(status_code=401, detail="invalid token")
+        fake.state.calls["balances"] += 1
+        return {"flag": True, "data": {i: [{"available_balance": 1000 * len(i)}] for i in payload["investor_id"]}}
+
+    client = RupeeCircleClient(
+        base_url="http://testserver", email="e", password="p", balance_cache_ttl_in_s=balance_cache_ttl_in_s
+    )
+    client.session = TestClient(fake)
+    return client, fake.state
+
+
+def test_token_is_fetched_lazily_and_reused():
+    client, state = fake_rc_client()
+    assert state.calls["logins"] == 0
+
+    assert client.get_investor_balances(["a", "bb"]) == {"a": 1000, "bb": 2000}
+    client.get_investor_balances(["a"])
+    assert state.calls == {"logins": 1, "balances": 2}
+
+
+def test_rejected_token_is_refreshed():
+    client, state = fake_rc_client()
+    client.get_investor_balances(["a"])
+    # e.g. the token was revoked on their side
+    state.token = "other-token"
+
+    assert client.get_investor_balances(["a"]) == {"a": 1000}
+    assert state.calls["logins"] == 2
+
+
+def test_balances_are_cached():
+    client, state = fake_rc_client(balance_cache_ttl_in_s=60)
+    client.get_investor_balances(["a", "bb"])
+
+    assert client.get_investor_balances(["bb", "ccc"]) == {"bb": 2000, "ccc": 3000}
+    assert client.get_investor_balances(["a", "ccc"]) == {"a": 1000, "ccc": 3000}
+    assert state.calls["balances"] == 2